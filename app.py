@@ -1,12 +1,17 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
+import json
+import time
 from dotenv import load_dotenv
 from chatbot import CarRentalChatbot
 from database import init_db, get_all_cars, get_user_conversation, save_user_conversation
+from retention import RetentionWorker
 from twilio.twiml.messaging_response import MessagingResponse
-from openai import OpenAI
-import requests
+from http_clients import get_http_client
+import metrics
+from metrics import span, request_span
+from resilience import Deadline, get_breaker, WEBHOOK_DEADLINE_SECONDS
 import tempfile
 
 # Load environment variables
@@ -19,9 +24,18 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-pro
 # Initialize database
 init_db()
 
+# Archive idle WhatsApp conversations and compact the database in the background
+if os.getenv('RETENTION_ENABLED', 'true').lower() == 'true':
+    RetentionWorker().start()
+
 # Initialize chatbot
 chatbot = CarRentalChatbot()
 
+# Voice notes: per-step caps, and what the webhook deadline keeps back for the reply
+MEDIA_TIMEOUT_SECONDS = 30
+TRANSCRIPTION_TIMEOUT_SECONDS = 60
+REPLY_RESERVE_SECONDS = 4
+
 @app.route('/')
 def index():
     """Render the main chat interface"""
@@ -39,7 +53,8 @@ def chat():
             return jsonify({'error': 'No message provided'}), 400
 
         # Get response from chatbot
-        bot_response = chatbot.get_response(user_message, conversation_history)
+        with request_span('chat'):
+            bot_response = chatbot.get_response(user_message, conversation_history)
 
         return jsonify({
             'response': bot_response,
@@ -52,6 +67,49 @@ def chat():
             'success': False
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Stream the chatbot's reply as Server-Sent Events.
+
+    Each `data:` event carries {"delta": text}; a final `done` event carries
+    time-to-first-token and total latency in milliseconds.
+    """
+    data = request.json or {}
+    user_message = data.get('message', '')
+    conversation_history = data.get('history', [])
+
+    if not user_message:
+        return jsonify({'error': 'No message provided', 'success': False}), 400
+
+    def events():
+        start = time.perf_counter()
+        first_token = None
+        with request_span('chat_stream'):
+            for chunk in chatbot.stream_response(user_message, conversation_history):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    metrics.STAGE_SECONDS.observe(first_token - start, 'first_token')
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+
+        end = time.perf_counter()
+        timing = {
+            'ttft_ms': round(((first_token or end) - start) * 1000),
+            'total_ms': round((end - start) * 1000)
+        }
+        print(f"Streamed chat reply: first token {timing['ttft_ms']} ms, total {timing['total_ms']} ms")
+        yield f"event: done\ndata: {json.dumps(timing)}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # keep reverse proxies from buffering the stream
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage latency histograms and counters in Prometheus text format"""
+    return Response(metrics.render(chatbot), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/cars', methods=['GET'])
 def get_cars():
     """Get all available cars (for debugging/admin)"""
@@ -67,30 +125,39 @@ def get_cars():
             'success': False
         }), 500
 
-def transcribe_voice_message(media_url):
+def transcribe_voice_message(media_url, deadline=None):
     """
     Download and transcribe a voice message from Twilio using OpenAI Whisper.
 
     Args:
         media_url: URL to the audio file from Twilio
+        deadline: Optional resilience.Deadline for the whole webhook; both
+            steps leave REPLY_RESERVE_SECONDS of it for the reply
 
     Returns:
         Transcribed text string, or None if transcription fails
     """
     try:
+        if deadline is None:
+            deadline = Deadline(MEDIA_TIMEOUT_SECONDS + TRANSCRIPTION_TIMEOUT_SECONDS + REPLY_RESERVE_SECONDS)
+
         # Get Twilio credentials for authenticated download
         twilio_account_sid = os.getenv('TWILIO_ACCOUNT_SID')
         twilio_auth_token = os.getenv('TWILIO_AUTH_TOKEN')
 
         print(f"Downloading voice message from: {media_url}")
 
-        # Download the audio file from Twilio (requires authentication)
-        response = requests.get(
-            media_url,
-            auth=(twilio_account_sid, twilio_auth_token),
-            timeout=30
-        )
-        response.raise_for_status()
+        # Download the audio file from Twilio (requires authentication); Twilio
+        # redirects to the media store, and the credentials are not forwarded there
+        timeout = deadline.budget(MEDIA_TIMEOUT_SECONDS, reserve=REPLY_RESERVE_SECONDS)
+        with span('media_download'), get_breaker('twilio_media').call():
+            response = get_http_client().get(
+                media_url,
+                auth=(twilio_account_sid, twilio_auth_token),
+                timeout=timeout,
+                follow_redirects=True
+            )
+            response.raise_for_status()
 
         # Save to temporary file
         with tempfile.NamedTemporaryFile(delete=False, suffix='.ogg') as temp_audio:
@@ -99,18 +166,20 @@ def transcribe_voice_message(media_url):
 
         print(f"Audio file downloaded to: {temp_audio_path}")
 
-        # Transcribe using OpenAI Whisper
-        openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-        with open(temp_audio_path, 'rb') as audio_file:
-            transcript = openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="en"  # Can be removed to auto-detect language
-            )
-
-        # Clean up temporary file
-        os.unlink(temp_audio_path)
+        # Transcribe using OpenAI Whisper, on the chatbot's pooled client, in one attempt
+        try:
+            timeout = deadline.budget(TRANSCRIPTION_TIMEOUT_SECONDS, reserve=REPLY_RESERVE_SECONDS)
+            with open(temp_audio_path, 'rb') as audio_file, span('transcription'), \
+                    get_breaker('openai_audio').call(), chatbot.model_tiers.track('transcription') as call:
+                transcript = chatbot.deadline_openai_client.audio.transcriptions.create(
+                    model=call.model,
+                    file=audio_file,
+                    language="en",  # Can be removed to auto-detect language
+                    timeout=timeout
+                )
+        finally:
+            # Clean up temporary file
+            os.unlink(temp_audio_path)
 
         transcribed_text = transcript.text
         print(f"Transcription successful: {transcribed_text}")
@@ -126,6 +195,13 @@ def transcribe_voice_message(media_url):
 @app.route('/whatsapp', methods=['POST'])
 def whatsapp_webhook():
     """Handle incoming WhatsApp messages (text and voice) from Twilio"""
+    with request_span('whatsapp'):
+        return handle_whatsapp_message()
+
+def handle_whatsapp_message():
+    """Reply to one Twilio webhook call with TwiML"""
+    # Twilio gives up on the webhook after 15 seconds; every stage shares this budget
+    deadline = Deadline(WEBHOOK_DEADLINE_SECONDS)
     try:
         # Get incoming message details from Twilio
         incoming_msg = request.values.get('Body', '').strip()
@@ -149,7 +225,7 @@ def whatsapp_webhook():
             if 'audio' in media_content_type.lower():
                 print("Voice message detected, transcribing...")
 
-                transcribed_text = transcribe_voice_message(media_url)
+                transcribed_text = transcribe_voice_message(media_url, deadline)
 
                 if transcribed_text:
                     incoming_msg = transcribed_text
@@ -173,21 +249,25 @@ def whatsapp_webhook():
             return str(resp)
 
         # Retrieve conversation history for this user
-        conversation_history = get_user_conversation(sender_number)
+        with span('load_history'):
+            conversation_history = get_user_conversation(sender_number)
         print(f"Retrieved conversation history: {len(conversation_history)} messages")
 
         # Get chatbot response (reuse existing chatbot logic)
-        bot_response = chatbot.get_response(incoming_msg, conversation_history)
+        bot_response = chatbot.get_response(incoming_msg, conversation_history, phone_number=sender_number,
+                                            deadline=deadline)
         print(f"Generated response: {bot_response[:100]}...")
 
         # Save conversation state
-        save_user_conversation(sender_number, incoming_msg, bot_response)
+        with span('save_conversation'):
+            save_user_conversation(sender_number, incoming_msg, bot_response)
 
         # Create Twilio response
         resp = MessagingResponse()
 
         # Check if bot response mentions specific cars and try to send images
-        image_urls = extract_car_images_from_response(bot_response, incoming_msg, conversation_history)
+        with span('extract_images'):
+            image_urls = extract_car_images_from_response(bot_response, incoming_msg, conversation_history)
 
         if image_urls:
             # Send images with the response
@@ -0,0 +1,305 @@
+"""
+Async variant of CarRentalChatbot for asyncio (ASGI) deployments.
+
+A blocking worker thread is pinned for the whole of every LLM call; here a
+turn only holds a coroutine, so one worker process serves many turns at
+once. All LLM calls of the process go through one LLMCaller, which adds:
+
+- a concurrency limit (LLM_CONCURRENCY calls in flight, the rest queue)
+- a timeout per attempt (LLM_TIMEOUT)
+- retries with jittered exponential backoff on 429s, 5xx responses,
+  timeouts and dropped connections (LLM_MAX_RETRIES)
+- hedging: a structured call that has not answered after LLM_HEDGE_AFTER
+  seconds is sent a second time and the first answer wins
+
+Database work (history, cache, search) runs on the async_database pool.
+"""
+import asyncio
+import os
+import random
+
+import instructor
+import openai
+from openai import AsyncOpenAI
+
+import async_database
+import chatbot
+from car_listings import render_car_options, MAX_OPTIONS
+from http_clients import get_async_http_client
+from metrics import span
+from chatbot import APOLOGY, FALLBACK_REPLY, NO_MORE_REPLY, CarRentalChatbot, has_summary
+from local_parser import parse_message
+from models import ChatbotAction
+from response_cache import get_response_cache
+
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', 16))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 30))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', 0.5))
+LLM_RETRY_MAX_DELAY = 8.0
+# Seconds before a slow structured call is hedged (0 disables hedging)
+LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', 3.0))
+
+
+def transport_error(error):
+    """The API or timeout error behind `error` (Instructor wraps them in its own), or None"""
+    for _ in range(5):
+        if error is None or isinstance(error, (asyncio.TimeoutError, openai.APIError)):
+            return error
+        last_attempt = getattr(error, 'last_attempt', None)
+        error = last_attempt.exception() if last_attempt is not None else error.__cause__ or error.__context__
+    return None
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+    error = transport_error(error)
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_delay(attempt, error, base=None):
+    """Full-jitter exponential backoff, at least the server's Retry-After"""
+    base = LLM_RETRY_BASE_DELAY if base is None else base
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, base * 2 ** attempt))
+    error = transport_error(error)
+    if isinstance(error, openai.APIStatusError):
+        try:
+            delay = max(delay, min(LLM_RETRY_MAX_DELAY, float(error.response.headers.get('retry-after', 0))))
+        except ValueError:
+            pass
+    return delay
+
+
+class LLMCaller:
+    """Concurrency limit, timeouts, retries and hedging around async LLM calls"""
+
+    def __init__(self, concurrency=None, timeout=None, max_retries=None, hedge_after=None, retry_base_delay=None):
+        self.slots = asyncio.Semaphore(LLM_CONCURRENCY if concurrency is None else concurrency)
+        self.timeout = LLM_TIMEOUT if timeout is None else timeout
+        self.max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.hedge_after = LLM_HEDGE_AFTER if hedge_after is None else hedge_after
+        self.retry_base_delay = retry_base_delay
+        self.stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'timeouts': 0, 'failures': 0,
+                      'hedges': 0, 'hedge_wins': 0}
+
+    async def call(self, make_call, hedge=False):
+        """
+        Await `make_call()` (a coroutine factory) with retries.
+
+        Args:
+            hedge: The call is idempotent and may be sent twice
+        """
+        self.stats['calls'] += 1
+        for attempt in range(self.max_retries + 1):
+            try:
+                if hedge and self.hedge_after > 0:
+                    return await self._hedged(make_call)
+                return await self._attempt(make_call)
+            except Exception as e:
+                await self._before_retry(attempt, e)
+
+    async def stream(self, make_stream):
+        """
+        Yield text deltas of a streamed completion. Failures before the
+        first delta are retried; later ones are raised to the caller.
+        """
+        self.stats['calls'] += 1
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self.slots:
+                    self.stats['attempts'] += 1
+                    stream = await asyncio.wait_for(make_stream(), self.timeout)
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            started = True
+                            yield chunk.choices[0].delta.content
+                return
+            except Exception as e:
+                if started:
+                    self.stats['failures'] += 1
+                    raise
+                await self._before_retry(attempt, e)
+
+    async def _before_retry(self, attempt, error):
+        """Sleep before the next attempt, or re-raise `error` when there is none"""
+        if isinstance(error, asyncio.TimeoutError):
+            self.stats['timeouts'] += 1
+        if attempt == self.max_retries or not is_retryable(error):
+            self.stats['failures'] += 1
+            raise error
+        delay = retry_delay(attempt, error, self.retry_base_delay)
+        self.stats['retries'] += 1
+        print(f"LLM call failed ({type(error).__name__}), retry {attempt + 1} in {delay * 1000:.0f} ms")
+        await asyncio.sleep(delay)
+
+    async def _attempt(self, make_call):
+        async with self.slots:
+            self.stats['attempts'] += 1
+            return await asyncio.wait_for(make_call(), self.timeout)
+
+    async def _hedged(self, make_call):
+        """First answer of the call and, if it is slow, a second copy of it"""
+        tasks = [asyncio.ensure_future(self._attempt(make_call))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done and not self.slots.locked():
+                # Only hedge with spare capacity; under load a copy would just queue
+                self.stats['hedges'] += 1
+                tasks.append(asyncio.ensure_future(self._attempt(make_call)))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None:
+                    if winner is not tasks[0]:
+                        self.stats['hedge_wins'] += 1
+                    return winner.result()
+                if not pending:
+                    raise done.pop().exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+class AsyncCarRentalChatbot(CarRentalChatbot):
+    """CarRentalChatbot whose turns are coroutines"""
+
+    def __init__(self, llm=None):
+        super().__init__()
+        api_key = os.getenv('OPENAI_API_KEY')
+        # Retries are LLMCaller's job, so the SDK must not add its own
+        self.async_openai_client = AsyncOpenAI(api_key=api_key, timeout=LLM_TIMEOUT, max_retries=0,
+                                               http_client=get_async_http_client())
+        self.async_client = instructor.from_openai(self.async_openai_client)
+        self.llm = llm or LLMCaller()
+
+    async def get_response_async(self, user_message, conversation_history=None, phone_number=None):
+        """Async get_response()"""
+        return "".join([chunk async for chunk in
+                        self.stream_response_async(user_message, conversation_history, phone_number)])
+
+    def _prepare_turn(self, user_message, conversation_history, phone_number):
+        """The blocking start of a turn: messages, cache lookup and local parse"""
+        messages = self.build_messages(user_message, conversation_history, phone_number)
+        cache = get_response_cache()
+        lookup = (None, None, None)
+        if cache:
+            lookup = cache.lookup(user_message, conversation_history, self.cache_context(),
+                                  summarized=has_summary(messages))
+        local = None
+        if chatbot.LOCAL_PARSER and lookup[2] is None:
+            local = parse_message(user_message, conversation_history)
+        return messages, cache, lookup, local
+
+    async def stream_response_async(self, user_message, conversation_history=None, phone_number=None):
+        """Async stream_response()"""
+        if conversation_history is None:
+            conversation_history = []
+
+        streamed = False
+        try:
+            with span('prepare'):
+                messages, cache, (key, versions, cached), local = await async_database.run_in_db(
+                    self._prepare_turn, user_message, conversation_history, phone_number
+                )
+            if cached is not None:
+                yield cached
+                return
+
+            if local:
+                action = local.action
+            else:
+                with span('router'), self.model_tiers.track('router') as call:
+                    action, completion = await self.llm.call(
+                        lambda: self.async_client.chat.completions.create_with_completion(
+                            model=call.model,
+                            response_model=ChatbotAction,
+                            messages=messages,
+                            temperature=0.7,
+                            max_tokens=1500,
+                            # One attempt: Instructor would otherwise retry inside a single LLMCaller attempt
+                            max_retries=1
+                        ), hedge=True)
+                    call.usage = completion.usage
+
+            with span('tool'):
+                tool = await async_database.run_in_db(self.run_tool, action, local, user_message,
+                                                      conversation_history)
+            more = tool.pop('more', None) if tool else None
+            if tool:
+                chunks = self.present_cars_async(messages, **tool)
+            elif action.action_type == "show_more":
+                chunks = self._single(NO_MORE_REPLY)
+            elif action.action_type == "direct_response" and action.response:
+                chunks = self._single(action.response)
+            else:
+                chunks = self._single(FALLBACK_REPLY)
+
+            parts = []
+            with span('responder'):
+                async for chunk in chunks:
+                    streamed = True
+                    parts.append(chunk)
+                    yield chunk
+
+            if more:
+                await async_database.run_in_db(self.remember_page, user_message, "".join(parts), more)
+
+            if cache:
+                await async_database.run_in_db(cache.store, key, versions, "".join(parts))
+
+        except Exception as e:
+            print(f"Error getting response: {e}")
+            import traceback
+            traceback.print_exc()
+            yield f"\n\n{APOLOGY}" if streamed else APOLOGY
+
+    @staticmethod
+    async def _single(text):
+        yield text
+
+    async def present_cars_async(self, messages, cars, tool_note, request, dates_given=False, ranked=False,
+                                 limit=MAX_OPTIONS):
+        """Async present_cars()"""
+        if chatbot.RESPONSE_RENDERING == 'llm':
+            final_messages = self.listing_messages(messages, cars, tool_note, request, ranked)
+            with self.model_tiers.track('responder') as call:
+                async for text in self.llm.stream(lambda: self.async_openai_client.chat.completions.create(
+                    model=call.model,
+                    messages=final_messages,
+                    temperature=0.7,
+                    max_tokens=1500,
+                    stream=True
+                )):
+                    call.first_token()
+                    yield text
+            return
+
+        intro = None
+        if chatbot.RESPONSE_RENDERING == 'local_intro' and cars:
+            intro = await self.write_intro_async(messages, cars)
+        yield render_car_options(cars, intro=intro, dates_given=dates_given, limit=limit, ranked=ranked)
+
+    async def write_intro_async(self, messages, cars):
+        """Async write_intro()"""
+        try:
+            with self.model_tiers.track('responder') as call:
+                response = await self.llm.call(lambda: self.async_openai_client.chat.completions.create(
+                    model=call.model,
+                    messages=self.intro_messages(messages, cars),
+                    temperature=0.7,
+                    max_tokens=40
+                ), hedge=True)
+                call.usage = response.usage
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Error writing listing intro: {e}")
+            return None
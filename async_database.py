@@ -0,0 +1,122 @@
+"""
+Async façade over database.py for asyncio request handlers.
+
+Calls run on a dedicated, bounded thread pool whose threads each own a
+SQLite connection, so the event loop never blocks on disk and async
+traffic cannot exhaust the connection pool used by sync handlers. Every
+call has a timeout; on timeout or cancellation a query that is still
+running is interrupted, and one that has not started yet is skipped.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import database
+
+ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', 4))
+ASYNC_DB_TIMEOUT = float(os.getenv('ASYNC_DB_TIMEOUT', 5.0))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                # Worker threads do not survive fork(); start a fresh pool
+                _executor = ThreadPoolExecutor(
+                    max_workers=ASYNC_DB_WORKERS,
+                    thread_name_prefix='async-db',
+                    initializer=database.pin_thread_connection
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def shutdown():
+    """Stop the executor threads (waits for running calls)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+class _Call:
+    """One queued database call that can be abandoned before or while it runs"""
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._conn = None
+
+    def __call__(self):
+        with self._lock:
+            if self._cancelled:
+                raise CancelledError()
+            self._conn = database.pinned_connection()
+        try:
+            return self.func(*self.args, **self.kwargs)
+        finally:
+            with self._lock:
+                self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            if self._conn is not None:
+                # Aborts the statement in progress with OperationalError
+                self._conn.interrupt()
+
+
+async def run_in_db(func, *args, timeout=None, **kwargs):
+    """
+    Run a blocking database function on the async executor.
+
+    Args:
+        func: Callable using database.connection()
+        timeout: Seconds before giving up (default ASYNC_DB_TIMEOUT)
+
+    Raises:
+        asyncio.TimeoutError: The call did not finish in time
+    """
+    call = _Call(func, args, kwargs)
+    future = asyncio.get_running_loop().run_in_executor(_get_executor(), call)
+    try:
+        return await asyncio.wait_for(future, ASYNC_DB_TIMEOUT if timeout is None else timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        call.cancel()
+        raise
+
+
+async def get_all_cars_async(timeout=None):
+    """Async get_all_cars()"""
+    return await run_in_db(database.get_all_cars, timeout=timeout)
+
+
+async def search_cars_async(criteria, timeout=None):
+    """Async search_cars()"""
+    return await run_in_db(database.search_cars, criteria, timeout=timeout)
+
+
+async def search_cars_page_async(criteria, cursor=None, timeout=None):
+    """Async search_cars_page()"""
+    return await run_in_db(database.search_cars_page, criteria, cursor, timeout=timeout)
+
+
+async def get_user_conversation_async(phone_number, limit=database.HISTORY_WINDOW, timeout=None):
+    """Async get_user_conversation()"""
+    return await run_in_db(database.get_user_conversation, phone_number, limit, timeout=timeout)
+
+
+async def save_user_conversation_async(phone_number, user_msg, bot_msg, timeout=None):
+    """Async save_user_conversation()"""
+    return await run_in_db(database.save_user_conversation, phone_number, user_msg, bot_msg,
+                           timeout=timeout)
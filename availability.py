@@ -0,0 +1,66 @@
+"""
+In-memory availability index over confirmed reservations.
+
+Each car's reservations are kept as a list of pickup times sorted
+ascending, with a running maximum of return times alongside. Whether a car
+is free for [start, end) is then one bisect: find the last reservation
+picking up before `end` and check that nothing up to it returns after
+`start`.
+"""
+from bisect import bisect_left
+from datetime import date, datetime, timezone
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def to_timestamp(value):
+    """
+    Normalize a datetime, date or ISO string to SQLite's 'YYYY-MM-DD HH:MM:SS'
+    (UTC for timezone-aware values), so timestamps compare as strings.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.strftime(TIMESTAMP_FORMAT)
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d 00:00:00')
+    raise TypeError(f"Unsupported timestamp: {value!r}")
+
+
+class AvailabilityIndex:
+    """Answers "is car X free in [start, end)" from sorted per-car intervals"""
+
+    def __init__(self, reservations):
+        """
+        Args:
+            reservations: (car_id, pickup_at, return_at) rows ordered by
+                car_id, pickup_at, with normalized timestamp strings
+        """
+        self._starts = {}
+        self._max_ends = {}
+        self.count = 0
+        for car_id, pickup_at, return_at in reservations:
+            starts = self._starts.setdefault(car_id, [])
+            max_ends = self._max_ends.setdefault(car_id, [])
+            starts.append(pickup_at)
+            # Running max keeps the check correct even if bookings overlap
+            max_ends.append(max(return_at, max_ends[-1]) if max_ends else return_at)
+            self.count += 1
+
+    def is_free(self, car_id, start, end):
+        starts = self._starts.get(car_id)
+        if not starts:
+            return True
+        i = bisect_left(starts, end) - 1
+        return i < 0 or self._max_ends[car_id][i] <= start
+
+    def filter_free(self, cars, start, end):
+        """Cars from `cars` with no reservation overlapping [start, end)"""
+        return list(self.iter_free(cars, start, end))
+
+    def iter_free(self, cars, start, end):
+        """Lazy filter_free(), for pages taken from an ordered walk"""
+        starts = self._starts
+        return (car for car in cars if car['id'] not in starts or self.is_free(car['id'], start, end))
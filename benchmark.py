@@ -0,0 +1,514 @@
+"""
+Micro-benchmarks for the chatbot's data and LLM paths.
+
+Each benchmark runs against a throwaway database in a temp directory, so it
+never touches car_rental.db. Run one with e.g.:
+
+    python benchmark.py connections --seconds 3 --threads 4
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import database
+import response_cache
+from availability import to_timestamp
+from synthetic_fleet import generate_cars, insert_cars
+
+
+def use_temp_database():
+    """Point database.py at a fresh temp file and initialize it"""
+    tmp_dir = tempfile.mkdtemp(prefix='car_rental_bench_')
+    database.DB_NAME = os.path.join(tmp_dir, 'bench.db')
+    database.init_db()
+    return database.DB_NAME
+
+
+def run_for(seconds, threads, func):
+    """Call func() repeatedly from N threads for a fixed time; return calls/sec"""
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(i):
+        n = 0
+        while time.perf_counter() < deadline:
+            func()
+            n += 1
+        counts[i] = n
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+# ---------------------------------------------------------------------------
+# connections: fresh sqlite3.connect() per call vs the pooled WAL layer
+# ---------------------------------------------------------------------------
+
+def _legacy_get_all_cars():
+    conn = sqlite3.connect(database.DB_NAME)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute('SELECT * FROM cars WHERE available = 1').fetchall()
+    conn.close()
+    return [dict(row, features=json.loads(row['features'])) for row in rows]
+
+
+def _legacy_get_user_conversation(phone_number):
+    conn = sqlite3.connect(database.DB_NAME)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute('SELECT history FROM conversations WHERE phone_number = ?',
+                       (phone_number,)).fetchone()
+    conn.close()
+    return json.loads(row['history']) if row else []
+
+
+def bench_connections(args):
+    use_temp_database()
+    database.save_user_conversation('whatsapp:+10000000000', 'Hello', 'Hello! How can I help?')
+
+    def legacy_turn():
+        _legacy_get_user_conversation('whatsapp:+10000000000')
+        _legacy_get_all_cars()
+
+    def pooled_turn():
+        database.get_user_conversation('whatsapp:+10000000000')
+        database.get_all_cars()
+
+    print(f"=== Connection layer ({args.threads} threads, {args.seconds}s each) ===\n")
+    before = run_for(args.seconds, args.threads, legacy_turn) * 2
+    after = run_for(args.seconds, args.threads, pooled_turn) * 2
+    print(f"connect-per-query: {before:10.0f} queries/sec")
+    print(f"pooled WAL:        {after:10.0f} queries/sec  ({after / before:.1f}x)")
+    print(f"pool stats: {database.get_pool_stats()}")
+
+
+# ---------------------------------------------------------------------------
+# search-index: SQL scan vs the in-memory columnar index
+# ---------------------------------------------------------------------------
+
+SEARCH_QUERIES = [
+    {'max_price': 200},
+    {'min_passengers': 7},
+    {'category': 'Luxury', 'max_price': 400},
+    {'fuel_type': 'Hybrid', 'min_passengers': 5},
+    {'category': 'Compact SUV', 'fuel_type': 'Gasoline', 'max_price': 210, 'min_passengers': 5},
+]
+
+
+def time_queries(func, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for criteria in queries:
+            func(criteria)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+
+def bench_search_index(args):
+    print("=== Search: SQL scan vs in-memory index ===\n")
+    print(f"{'cars':>8} {'build ms':>9} {'sql us':>10} {'index us':>10} {'speedup':>8}")
+    for size in (1_000, 10_000, 100_000):
+        use_temp_database()
+        with database.connection() as conn:
+            conn.execute('DELETE FROM cars')
+            insert_cars(conn, generate_cars(size, seed=size))
+        database.invalidate_inventory()
+
+        start = time.perf_counter()
+        database.get_inventory()
+        build = time.perf_counter() - start
+
+        repeat = max(1, 20_000 // size)
+        sql = time_queries(database.search_cars_sql, SEARCH_QUERIES, repeat)
+        index = time_queries(database.search_cars, SEARCH_QUERIES, repeat)
+        print(f"{size:>8} {build * 1e3:>9.1f} {sql * 1e6:>10.0f} {index * 1e6:>10.0f} {sql / index:>7.1f}x")
+
+
+RANKING_QUERIES = [
+    "something comfy for a desert road trip with lots of bags",
+    "a cheap little car for the city",
+    "we're a family of 7 with kids, need lots of luggage space",
+    "something fun and fast to impress at a wedding under 500 AED",
+]
+
+
+def bench_ranking(args):
+    import car_ranker
+
+    print("=== Ranking: free-text needs, top-6 of the fleet ===\n")
+    print(f"{'cars':>8} {'build ms':>9} {'top-6 us':>9} {'ns/car':>7}")
+    for size in (1_000, 10_000, 100_000):
+        use_temp_database()
+        with database.connection() as conn:
+            conn.execute('DELETE FROM cars')
+            insert_cars(conn, generate_cars(size, seed=size))
+        database.invalidate_inventory()
+        database.get_inventory()
+
+        start = time.perf_counter()
+        ranker = car_ranker.get_ranker()
+        build = time.perf_counter() - start
+
+        repeat = max(10, 20_000 // size)
+        time_queries(ranker.top, RANKING_QUERIES, 1)  # warm up the parser's feature patterns
+        query = time_queries(ranker.top, RANKING_QUERIES, repeat)
+        print(f"{size:>8} {build * 1e3:>9.1f} {query * 1e6:>9.0f} {query * 1e9 / len(ranker):>7.1f}")
+
+
+# ---------------------------------------------------------------------------
+# paging: sorted "show me more" pages, re-sorting every match vs keyset cursors
+# ---------------------------------------------------------------------------
+
+PAGING_QUERIES = [
+    {'sort_by': 'price', 'limit': 10},
+    {'sort_by': 'price', 'sort_descending': True, 'max_price': 400, 'limit': 10},
+    {'sort_by': 'passengers', 'sort_descending': True, 'min_passengers': 5, 'limit': 10},
+    {'sort_by': 'year', 'sort_descending': True, 'category': 'Economy', 'limit': 10},
+]
+PAGING_DEPTH = 20
+
+
+def bench_paging(args):
+    from inventory_index import SORT_COLUMNS, sort_order
+
+    def rescan(criteria, cursor, page):
+        """Before cursors: filter everything, sort it and slice out the page"""
+        sort_by, descending = sort_order(criteria)
+        column = SORT_COLUMNS[sort_by]
+        unsorted = {key: value for key, value in criteria.items() if key not in ('sort_by', 'sort_descending', 'limit')}
+        cars = sorted(database.search_cars(unsorted), key=lambda car: (car['daily_price'], car['id']),
+                      reverse=descending and sort_by == 'price')
+        if sort_by != 'price':
+            cars.sort(key=lambda car: car[column], reverse=descending)
+        return cars[page * criteria['limit']:(page + 1) * criteria['limit']]
+
+    print(f"=== Paging: page {PAGING_DEPTH + 1} of a sorted search, {len(PAGING_QUERIES)} sort orders ===\n")
+    print(f"{'cars':>8} {'re-sort us':>11} {'sql us':>8} {'index us':>9} {'speedup':>8}")
+    for size in (1_000, 10_000, 100_000):
+        use_temp_database()
+        with database.connection() as conn:
+            conn.execute('DELETE FROM cars')
+            insert_cars(conn, generate_cars(size, seed=size))
+        database.invalidate_inventory()
+        database.get_inventory()
+
+        # The cursor a customer holds after PAGING_DEPTH "show me more" turns
+        cursors = []
+        for criteria in PAGING_QUERIES:
+            cursor = None
+            for _ in range(PAGING_DEPTH):
+                cursor = database.search_cars_page(criteria, cursor)[1]
+            cursors.append(cursor)
+        queries = list(zip(PAGING_QUERIES, cursors))
+
+        repeat = max(2, 20_000 // size)
+        before = time_queries(lambda query: rescan(*query, PAGING_DEPTH), queries, repeat)
+        sql = time_queries(lambda query: database.search_cars_sql(*query), queries, repeat)
+        index = time_queries(lambda query: database.search_cars_page(*query), queries, repeat * 10)
+        print(f"{size:>8} {before * 1e6:>11.0f} {sql * 1e6:>8.0f} {index * 1e6:>9.0f} {before / index:>7.1f}x")
+
+
+# ---------------------------------------------------------------------------
+# write-behind: synchronous conversation commits vs batched group commit
+# ---------------------------------------------------------------------------
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_write_behind(args):
+    print(f"=== Conversation writes ({args.threads} threads, {args.seconds}s each, "
+          f"synchronous={database.SYNCHRONOUS}) ===\n")
+    print(f"{'mode':>8} {'saves/s':>9} {'commits/s':>10} {'p50 us':>8} {'p99 us':>8}")
+    for mode in ('sync', 'batched'):
+        use_temp_database()
+        database.CONVERSATION_WRITE_MODE = mode
+        latencies = []
+        counter = iter(range(10 ** 9))
+
+        def webhook_save():
+            phone = f"whatsapp:+1555{next(counter) % 500:07d}"
+            start = time.perf_counter()
+            database.save_user_conversation(phone, "Show me SUVs", "Here are some SUVs...")
+            latencies.append(time.perf_counter() - start)
+
+        before = database.get_conversation_writer_stats().get('batches', 0)
+        start = time.perf_counter()
+        saves = run_for(args.seconds, args.threads, webhook_save)
+        database.flush_conversations()
+        elapsed = time.perf_counter() - start
+        if mode == 'sync':
+            commits = len(latencies) / elapsed
+        else:
+            commits = (database.get_conversation_writer_stats()['batches'] - before) / elapsed
+        print(f"{mode:>8} {saves:>9.0f} {commits:>10.0f} "
+              f"{percentile(latencies, 50) * 1e6:>8.0f} {percentile(latencies, 99) * 1e6:>8.0f}")
+
+
+# ---------------------------------------------------------------------------
+# reservations: "free in [start, end)" over 100k bookings on 10k cars
+# ---------------------------------------------------------------------------
+
+def bench_reservations(args):
+    print("=== Availability: 100k reservations across 10k cars ===\n")
+    use_temp_database()
+    rng = random.Random(9)
+    with database.connection() as conn:
+        conn.execute('DELETE FROM cars')
+        insert_cars(conn, generate_cars(10_000, seed=10, available_ratio=1.0))
+        car_ids = [row[0] for row in conn.execute('SELECT id FROM cars')]
+
+        # Ten back-to-back-ish, non-overlapping bookings per car over ~4 months
+        start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        rows = []
+        for car_id in car_ids:
+            pickup = start + timedelta(hours=rng.randint(0, 48))
+            for _ in range(10):
+                ret = pickup + timedelta(hours=rng.randint(12, 24 * 6))
+                rows.append((car_id, to_timestamp(pickup), to_timestamp(ret)))
+                pickup = ret + timedelta(hours=rng.randint(1, 72))
+        conn.executemany('INSERT INTO reservations (car_id, pickup_at, return_at) VALUES (?, ?, ?)', rows)
+        conn.commit()
+    database.invalidate_inventory()
+
+    t = time.perf_counter()
+    database.get_inventory()
+    availability = database.get_availability()
+    print(f"Loaded {availability.count:,} reservations + index in {(time.perf_counter() - t) * 1e3:.0f} ms")
+
+    queries = []
+    for _ in range(50):
+        pickup = start + timedelta(hours=rng.randint(0, 24 * 90))
+        criteria = rng.choice(SEARCH_QUERIES + [{}])
+        queries.append(dict(criteria, pickup_at=pickup, return_at=pickup + timedelta(days=rng.randint(1, 7))))
+
+    sql = time_queries(database.search_cars_sql, queries, 1)
+    index = time_queries(database.search_cars, queries, 3)
+    print(f"SQL NOT IN (reservations): {sql * 1e3:8.2f} ms/query")
+    print(f"Interval index:            {index * 1e3:8.2f} ms/query  ({sql / index:.1f}x)")
+
+
+# ---------------------------------------------------------------------------
+# rendering: second LLM completion (streamed) vs locally rendered listings
+# ---------------------------------------------------------------------------
+
+LLM_TTFT = 0.35          # seconds before the first token
+LLM_TOKENS_PER_SEC = 50  # streaming speed of a GPT-4 class model
+
+
+class StubLLM:
+    """Stands in for both OpenAI clients: a fixed action and realistic delays"""
+
+    def __init__(self, action):
+        self.action = action
+        self.calls = 0
+        self.chat = self.completions = self
+
+    def create(self, messages, response_model=None, max_tokens=1500, **kwargs):
+        self.calls += 1
+        if response_model is not None:
+            # Structured tool choice, ~30 output tokens
+            time.sleep(LLM_TTFT + 30 / LLM_TOKENS_PER_SEC)
+            return self.action
+        # A three-car listing written by the model is ~180 tokens
+        tokens = min(max_tokens, 180)
+        if kwargs.get('stream'):
+            return self._stream(tokens)
+        time.sleep(LLM_TTFT + tokens / LLM_TOKENS_PER_SEC)
+        message = SimpleNamespace(content='word ' * tokens)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def create_with_completion(self, messages, response_model, **kwargs):
+        return self.create(messages, response_model=response_model, **kwargs), SimpleNamespace(usage=None)
+
+    def _stream(self, tokens):
+        time.sleep(LLM_TTFT)
+        for _ in range(tokens):
+            time.sleep(1 / LLM_TOKENS_PER_SEC)
+            delta = SimpleNamespace(content='word ')
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def bench_rendering(args):
+    import chatbot
+    from models import CarSearchCriteria, ChatbotAction
+
+    print(f"=== Search turn latency (stub LLM: {LLM_TTFT * 1e3:.0f} ms TTFT, "
+          f"{LLM_TOKENS_PER_SEC} tokens/s) ===\n")
+    use_temp_database()
+    # Every turn repeats the same message; measure generation, not the cache
+    # or the local parser (which would skip the tool-selection call)
+    response_cache.RESPONSE_CACHE = 'off'
+    chatbot.LOCAL_PARSER = False
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    bot = chatbot.CarRentalChatbot()
+    stub = StubLLM(ChatbotAction(action_type='search_cars',
+                                 search_criteria=CarSearchCriteria(category='Economy')))
+    bot.client = bot.openai_client = stub
+
+    # First token is what a streaming (/api/chat/stream) user waits for
+    print(f"{'mode':>12} {'first ms':>9} {'turn ms':>9} {'LLM calls':>10}")
+    for mode in ('llm', 'local_intro', 'local'):
+        chatbot.RESPONSE_RENDERING = mode
+        stub.calls = 0
+        turns = 3
+        first = total = 0.0
+        for _ in range(turns):
+            start = time.perf_counter()
+            chunks = bot.stream_response("Show me some economy cars")
+            next(chunks)
+            first += time.perf_counter() - start
+            for _ in chunks:
+                pass
+            total += time.perf_counter() - start
+        print(f"{mode:>12} {first / turns * 1e3:>9.0f} {total / turns * 1e3:>9.0f} "
+              f"{stub.calls / turns:>10.0f}")
+
+    chatbot.RESPONSE_RENDERING = 'local'
+    print(f"\nSample local reply:\n\n{bot.get_response('Show me some economy cars')}")
+
+
+# ---------------------------------------------------------------------------
+# tool-payload: json.dumps(cars) vs the compact table sent to the LLM
+# ---------------------------------------------------------------------------
+
+def bench_tool_payload(args):
+    from car_listings import format_tool_results
+    from history_budget import estimate_tokens
+
+    print("=== Tool result payload size (estimated tokens) ===\n")
+    # 'all rows' is the tabular encoding alone; 'compact' also caps the rows
+    print(f"{'fleet':>22} {'cars':>6} {'json':>8} {'all rows':>9} {'compact':>8} {'saved':>7}")
+    use_temp_database()
+    fleets = [('seed', database.get_all_cars())]
+    with database.connection() as conn:
+        conn.execute('DELETE FROM cars')
+        insert_cars(conn, generate_cars(500, seed=500, available_ratio=1.0))
+        conn.commit()
+    database.invalidate_inventory()
+    fleets.append(('synthetic 500', database.get_all_cars()))
+
+    for name, cars in fleets:
+        for label, subset in (('', cars), (' economy', [c for c in cars if c['category'] == 'Economy'])):
+            before = estimate_tokens(json.dumps(subset))
+            table = estimate_tokens(format_tool_results(subset, limit=len(subset)))
+            after = estimate_tokens(format_tool_results(subset))
+            print(f"{name + label:>22} {len(subset):>6} {before:>8,} {table:>9,} {after:>8,} "
+                  f"{1 - after / before:>6.0%}")
+
+    print(f"\nSample payload:\n{format_tool_results(fleets[0][1][:3])}")
+
+
+# ---------------------------------------------------------------------------
+# async-llm: turns/sec of one worker, blocking threads vs the async engine
+# ---------------------------------------------------------------------------
+
+def bench_async_llm(args):
+    import asyncio
+    from stand_in_server import StandInLLM
+
+    llm = StandInLLM(ttft=LLM_TTFT, tokens_per_sec=LLM_TOKENS_PER_SEC, seed=1).start()
+    os.environ['OPENAI_BASE_URL'] = llm.base_url
+    os.environ['OPENAI_API_KEY'] = 'stand-in'
+    import async_chatbot
+    import chatbot
+
+    use_temp_database()
+    response_cache.RESPONSE_CACHE = 'off'
+    chatbot.LOCAL_PARSER = False
+    chatbot.RESPONSE_RENDERING = 'local'
+    message = "Show me some economy cars"
+    print(f"=== Search turns per second, one worker (stand-in LLM at {llm.base_url}) ===\n")
+    print(f"{'engine':>28} {'turns/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'failed':>7}")
+
+    def report(name, latencies, failed, elapsed):
+        print(f"{name:>28} {len(latencies) / elapsed:>8.1f} {percentile(latencies, 50) * 1e3:>7.0f} "
+              f"{percentile(latencies, 99) * 1e3:>7.0f} {failed:>7}")
+
+    # A gthread worker: each thread is blocked for the whole turn
+    bot = chatbot.CarRentalChatbot()
+    latencies, failed = [], 0
+    lock = threading.Lock()
+
+    def sync_turn():
+        nonlocal failed
+        start = time.perf_counter()
+        reply = bot.get_response(message)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            failed += reply == chatbot.APOLOGY
+
+    start = time.perf_counter()
+    run_for(args.seconds, args.threads, sync_turn)
+    report(f"sync, {args.threads} threads", latencies, failed, time.perf_counter() - start)
+
+    def run_async(label, hedge_after):
+        async def main():
+            bot = async_chatbot.AsyncCarRentalChatbot(
+                llm=async_chatbot.LLMCaller(concurrency=args.concurrency, hedge_after=hedge_after))
+            latencies, failed = [], 0
+            deadline = time.perf_counter() + args.seconds
+
+            async def client():
+                nonlocal failed
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    reply = await bot.get_response_async(message)
+                    latencies.append(time.perf_counter() - start)
+                    failed += reply == async_chatbot.APOLOGY
+
+            start = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(args.concurrency)))
+            report(label, latencies, failed, time.perf_counter() - start)
+            return bot.llm.get_stats()
+
+        return asyncio.run(main())
+
+    run_async(f"async, {args.concurrency} in flight", 0)
+
+    # Tail latency: 5% of calls stall for 5s, 5% are rate limited
+    llm.slow_rate, llm.slow_seconds, llm.error_rate = 0.05, 5.0, 0.05
+    print("\nWith 5% rate limits and 5% of calls stalling for 5s:")
+    run_async("async, retries, no hedging", 0)
+    stats = run_async("async, retries, hedge at 1.5s", 1.5)
+    print(f"\nLast run: {stats['retries']} retries, {stats['hedges']} hedges "
+          f"({stats['hedge_wins']} won by the hedge)")
+    llm.stop()
+
+
+BENCHMARKS = {
+    'connections': bench_connections,
+    'search-index': bench_search_index,
+    'ranking': bench_ranking,
+    'paging': bench_paging,
+    'write-behind': bench_write_behind,
+    'reservations': bench_reservations,
+    'rendering': bench_rendering,
+    'tool-payload': bench_tool_payload,
+    'async-llm': bench_async_llm,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=64, help="Turns in flight (async-llm)")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Deterministic chat rendering of car search results.
+
+Produces the listing format the system prompt asks the model to use
+("**2024 Toyota Corolla** - AED 129/day"), so tool results can be shown
+without a second LLM completion.
+"""
+MAX_OPTIONS = 3
+
+NO_MATCHES = ("I couldn't find any cars matching that right now. Would you like me to "
+              "widen the search, for example a higher budget or a different category?")
+
+
+def format_price(daily_price):
+    """'AED 129/day', keeping fils when the price has them so it never rounds down"""
+    if daily_price == int(daily_price):
+        return f"AED {daily_price:,.0f}/day"
+    return f"AED {daily_price:,.2f}/day"
+
+
+def _join(names):
+    names = list(names)
+    if len(names) <= 1:
+        return ''.join(names)
+    return f"{', '.join(names[:-1])} and {names[-1]}"
+
+
+def format_car_listing(car):
+    """Title line with the daily price, then seats and up to three features"""
+    title = f"**{car['year']} {car['make']} {car['model']}** - {format_price(car['daily_price'])}"
+    details = f"Seats {car['passengers']} passengers"
+    if car['features']:
+        details += f", equipped with {_join(car['features'][:3])}"
+    return f"{title}\n{details}"
+
+
+def pick_options(cars, limit=MAX_OPTIONS, ranked=False):
+    """
+    Cheapest car of each category first, so a broad result shows some
+    variety; `ranked` cars (best match first, see car_ranker) keep their order
+    """
+    if ranked:
+        return list(cars[:limit])
+    by_price = sorted(cars, key=lambda car: (car['daily_price'], car['id']))
+    picked = []
+    categories = set()
+    for car in by_price:
+        if car['category'] not in categories:
+            categories.add(car['category'])
+            picked.append(car)
+            if len(picked) == limit:
+                return picked
+    chosen = {car['id'] for car in picked}
+    picked.extend([car for car in by_price if car['id'] not in chosen][:limit - len(picked)])
+    return sorted(picked, key=lambda car: car['daily_price'])
+
+
+def render_car_options(cars, intro=None, dates_given=False, limit=MAX_OPTIONS, ranked=False):
+    """
+    Chat reply presenting up to `limit` of `cars`.
+
+    Args:
+        cars: Matching car dicts (any order, or best first when `ranked`)
+        intro: Optional opening sentence; a plain one is used otherwise
+        dates_given: Whether the search was already filtered by rental dates
+    """
+    if not cars:
+        return NO_MATCHES
+
+    options = pick_options(cars, limit, ranked)
+    if intro is None:
+        if ranked and len(options) > 1:
+            intro = "These fit what you're looking for best:"
+        elif len(cars) > len(options):
+            intro = f"I found {len(cars)} cars that fit. Here are {len(options)} good options:"
+        else:
+            intro = "Here's what I have for you:" if len(options) > 1 else "I have one car that fits:"
+
+    if dates_given and len(options) == 1:
+        closing = "It's free for your dates. Would you like to book it?"
+    elif dates_given:
+        closing = "All of these are free for your dates. Which one would you like?"
+    else:
+        closing = ("Which one catches your eye? Let me know your pickup and return dates "
+                   "and I'll confirm it's available.")
+
+    listings = '\n\n---\n\n'.join(format_car_listing(car) for car in options)
+    return f"{intro}\n\n{listings}\n\n{closing}"
+
+
+# Rows sent to the LLM as tool results; the rest are summarised as a count
+MAX_TOOL_ROWS = 12
+TOOL_COLUMNS = 'year|make|model|category|AED/day|seats|fuel|features'
+
+
+def format_tool_results(cars, limit=MAX_TOOL_ROWS, ranked=False):
+    """
+    Compact header-plus-rows table of `cars` for an LLM prompt.
+
+    Only the columns the assistant talks about are kept, prices are
+    rounded to whole dirhams and at most `limit` cars are listed (spread
+    over categories, cheapest first), so the payload no longer grows with
+    the fleet.
+    """
+    if not cars:
+        return "(no matching cars)"
+    rows = [TOOL_COLUMNS]
+    for car in pick_options(cars, limit, ranked):
+        rows.append('|'.join((
+            str(car['year']), car['make'], car['model'], car['category'],
+            f"{car['daily_price']:.0f}", str(car['passengers']), car['fuel_type'],
+            '; '.join(car['features'])
+        )))
+    if len(cars) > limit:
+        rows.append(f"({len(cars) - limit} more matching cars not listed)")
+    return '\n'.join(rows)
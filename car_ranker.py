@@ -0,0 +1,245 @@
+"""
+Ranks the fleet against free-text needs.
+
+A message like "something comfy for a desert road trip with lots of bags"
+names nothing that CarSearchCriteria can hold, so the router answers with
+get_inventory. Without ranking, the whole fleet would go to the responder.
+Here the fleet is ranked against the message instead, and the chatbot
+sends only the best matches.
+
+Each inventory snapshot becomes a float32 matrix with one row per car. Its
+columns are:
+- the category and fuel type, one-hot
+- the features, multi-hot
+- passengers, luggage and price, scaled to 0..1
+
+A message becomes a query vector of the same width, built from:
+- NEEDS, which maps phrases to the columns they favour
+- any explicit filters local_parser finds, such as "for 7 people" or
+  "under 300 AED"; seats and budget become hard limits
+Scoring is one matrix-vector product, and np.argpartition picks the top k.
+
+    python car_ranker.py "something comfy for a desert road trip with lots of bags"
+"""
+import os
+import re
+import sys
+import threading
+
+import numpy as np
+
+import database
+from local_parser import parse_message
+
+# Cars sent on for a ranked get_inventory / search_cars result
+RANKED_OPTIONS = int(os.getenv('RANKED_OPTIONS', 6))
+
+# Phrase -> {column: weight}. Columns are categories, fuel types and feature
+# names (case-insensitive), or 'passengers', 'luggage', 'price' (pricier)
+# and 'value' (cheaper). Names the fleet does not have are ignored.
+NEEDS = [
+    (r'comfy|comfortable|comfort|smooth ride|relax\w*|spacious',
+     {'Luxury': 0.7, 'Full-Size SUV': 0.6, 'Mid-Size SUV': 0.4, 'Leather Interior': 0.6,
+      'Heated Seats': 0.2, 'Premium Sound System': 0.3, 'Sports': -0.5}),
+    (r'road ?trips?|long (?:drives?|distance|journey)|highway|cross country|drive to \w+',
+     {'Mid-Size SUV': 0.6, 'Full-Size SUV': 0.5, 'Navigation': 0.5, 'Apple CarPlay': 0.2, 'luggage': 0.5}),
+    (r'desert|dunes?|sand|off ?road\w*|mountains?|wadi|camping|rough roads?',
+     {'4WD': 1.0, 'All-Wheel Drive': 0.8, 'Full-Size SUV': 0.8, 'Pickup Truck': 0.5, 'Mid-Size SUV': 0.3,
+      'Economy': -0.5, 'Sports': -0.8, 'Luxury': -0.5}),
+    (r'bags|luggage|suitcases?|boot space|trunk space|lots of stuff|gear|golf clubs|shopping',
+     {'luggage': 1.5}),
+    (r'famil\w*|kids|children|baby|babies|car seats?|toddlers?',
+     {'Minivan': 0.8, 'Full-Size SUV': 0.5, 'Third Row Seating': 0.6, 'Rear Entertainment': 0.5,
+      'Power Sliding Doors': 0.3, 'Backup Camera': 0.3, 'passengers': 0.8, 'Sports': -1.0}),
+    (r'groups?|friends|colleagues|team|crew',
+     {'passengers': 1.0, 'Minivan': 0.5, 'Full-Size SUV': 0.4}),
+    (r'cheap\w*|budget|affordable|inexpensive|low cost|save money|economical|not too expensive',
+     {'value': 1.5, 'Economy': 0.5}),
+    (r'luxur\w*|fancy|classy|elegant|impress\w*|wedding|business|executive|vip|special occasion',
+     {'Luxury': 1.2, 'price': 0.6, 'Leather Interior': 0.5, 'Premium Sound System': 0.3}),
+    (r'fun|fast|sporty|speed|thrill\w*|exciting|powerful|convertible',
+     {'Sports': 1.2, 'Performance Package': 0.8, 'Sport Seats': 0.5}),
+    (r'eco|eco friendly|green|environment\w*|fuel efficient|efficient|sustainab\w*|low emissions?',
+     {'Electric': 1.0, 'Hybrid': 0.8, 'Quick Charging': 0.3}),
+    (r'city|town|parking|park|small|nimble|traffic|downtown',
+     {'Economy': 0.8, 'Compact SUV': 0.5, 'Backup Camera': 0.4, 'passengers': -0.3}),
+    (r'tow\w*|trailer|boat|jet ?skis?|haul\w*|moving house|furniture|cargo',
+     {'Pickup Truck': 1.2, 'Towing Package': 1.0, 'luggage': 0.5}),
+    (r'hot|heat|summer',
+     {'Air Conditioning': 0.3}),
+]
+NEED_PATTERNS = [(re.compile(rf'\b(?:{pattern})\b'), weights) for pattern, weights in NEEDS]
+
+# Explicit filters in the message outweigh the softer phrases above
+CATEGORY_WEIGHT = 2.0
+FUEL_WEIGHT = 1.5
+FEATURE_WEIGHT = 1.0
+# Added to every query so equal scores go to the cheaper car
+TIE_BREAK_VALUE = 0.05
+
+
+def _value(value):
+    return getattr(value, 'value', value)
+
+
+class CarRanker:
+    """Feature matrix of one inventory snapshot, and top-k queries against it"""
+
+    def __init__(self, cars):
+        """
+        Args:
+            cars: Sequence of car dicts (an InventorySnapshot's cars)
+        """
+        self.cars = cars
+        self.positions = {car['id']: i for i, car in enumerate(cars)}
+
+        categories = sorted({car['category'] for car in cars})
+        fuel_types = sorted({car['fuel_type'] for car in cars})
+        features = sorted({name for car in cars for name in car['features']})
+        # Case-folded name -> column indices ('Electric' is a category and a fuel type)
+        self.columns = {}
+        labels = [*categories, *fuel_types, *features, 'passengers', 'luggage', 'price', 'value']
+        for column, label in enumerate(labels):
+            self.columns.setdefault(label.casefold(), []).append(column)
+        self.width = len(labels)
+
+        category_column = {name: i for i, name in enumerate(categories)}
+        fuel_column = {name: len(categories) + i for i, name in enumerate(fuel_types)}
+        feature_column = {name: len(categories) + len(fuel_types) + i for i, name in enumerate(features)}
+
+        rows, columns = [], []
+        for i, car in enumerate(cars):
+            rows += [i, i]
+            columns += [category_column[car['category']], fuel_column[car['fuel_type']]]
+            for name in car['features']:
+                rows.append(i)
+                columns.append(feature_column[name])
+        self.matrix = np.zeros((len(cars), self.width), dtype=np.float32)
+        self.matrix[rows, columns] = 1.0
+
+        self.passengers = np.array([car['passengers'] for car in cars], dtype=np.int16)
+        self.prices = np.array([car['daily_price'] for car in cars], dtype=np.float32)
+        luggage = np.array([car.get('luggage') or 0 for car in cars], dtype=np.float32)
+        numeric = len(labels) - 4
+        if len(cars):
+            self.matrix[:, numeric] = self.passengers / max(1, self.passengers.max())
+            self.matrix[:, numeric + 1] = luggage / max(1.0, luggage.max())
+            spread = float(self.prices.max() - self.prices.min()) or 1.0
+            self.matrix[:, numeric + 2] = (self.prices - self.prices.min()) / spread
+            self.matrix[:, numeric + 3] = 1.0 - self.matrix[:, numeric + 2]
+
+    def __len__(self):
+        return len(self.cars)
+
+    def _add(self, vector, name, weight):
+        for column in self.columns.get(name.casefold(), ()):
+            vector[column] += weight
+
+    def query(self, message):
+        """
+        Query vector and hard limits for a message.
+
+        Returns:
+            (vector, min_passengers, max_price), or None when the message
+            states no needs to rank by
+        """
+        text = message.casefold().replace('-', ' ')
+        vector = np.zeros(self.width, dtype=np.float32)
+        matched = False
+        for pattern, weights in NEED_PATTERNS:
+            if pattern.search(text):
+                matched = True
+                for name, weight in weights.items():
+                    self._add(vector, name, weight)
+
+        criteria = {}
+        parsed = parse_message(message, strict=False)
+        if parsed and parsed.action.search_criteria:
+            criteria = parsed.action.search_criteria.model_dump(exclude_none=True)
+            for category in parsed.categories:
+                self._add(vector, _value(category), CATEGORY_WEIGHT)
+            if criteria.get('category'):
+                self._add(vector, _value(criteria['category']), CATEGORY_WEIGHT)
+            if criteria.get('fuel_type'):
+                self._add(vector, _value(criteria['fuel_type']), FUEL_WEIGHT)
+            for name in criteria.get('required_features') or ():
+                self._add(vector, name, FEATURE_WEIGHT)
+        if not matched and not criteria:
+            return None
+
+        self._add(vector, 'value', TIE_BREAK_VALUE)
+        return vector, criteria.get('min_passengers'), criteria.get('max_price')
+
+    def top(self, message, k=RANKED_OPTIONS, cars=None):
+        """
+        The k cars that best fit the message, best first.
+
+        Args:
+            cars: Only rank these cars (e.g. search results); all by default
+
+        Returns:
+            List of car dicts (empty when no car matches), or None when the
+            message states no needs to rank by
+        """
+        query = self.query(message)
+        if query is None:
+            return None
+        vector, min_passengers, max_price = query
+
+        if cars is None:
+            rows = None
+            scores = self.matrix @ vector
+            passengers, prices = self.passengers, self.prices
+        else:
+            rows = np.fromiter((self.positions[car['id']] for car in cars), dtype=np.intp, count=len(cars))
+            scores = self.matrix[rows] @ vector
+            passengers, prices = self.passengers[rows], self.prices[rows]
+
+        # Cars that match none of the needs only score the tie-break
+        valid = scores > TIE_BREAK_VALUE
+        if min_passengers:
+            valid &= passengers >= min_passengers
+        if max_price:
+            valid &= prices <= max_price
+        candidates = np.flatnonzero(valid)
+        k = min(k, len(candidates))
+        if k == 0:
+            return []
+        candidate_scores = scores[candidates]
+        best = np.argpartition(candidate_scores, -k)[-k:]
+        best = best[np.argsort(-candidate_scores[best], kind='stable')]
+        best = candidates[best]
+        if rows is not None:
+            best = rows[best]
+        return [self.cars[i] for i in best]
+
+
+_ranker = (None, None)  # (inventory snapshot, CarRanker)
+_ranker_lock = threading.Lock()
+
+
+def get_ranker():
+    """The ranker for the current inventory snapshot (rebuilt when the fleet changes)"""
+    global _ranker
+    snapshot = database.get_inventory()
+    if _ranker[0] is not snapshot:
+        with _ranker_lock:
+            if _ranker[0] is not snapshot:
+                _ranker = (snapshot, CarRanker(snapshot.cars))
+    return _ranker[1]
+
+
+def rank_cars(message, cars=None, k=RANKED_OPTIONS):
+    """Best k matches for the message among `cars` (default: the fleet); see CarRanker.top()"""
+    return get_ranker().top(message, k, cars)
+
+
+if __name__ == '__main__':
+    database.init_db()
+    message = " ".join(sys.argv[1:]) or "something comfy for a desert road trip with lots of bags"
+    ranked = rank_cars(message)
+    if ranked is None:
+        print("No needs to rank by")
+    for car in ranked or ():
+        print(f"{car['year']} {car['make']} {car['model']} ({car['category']}, {car['passengers']} seats, "
+              f"luggage {car.get('luggage')}, AED {car['daily_price']:.0f}/day): {', '.join(car['features'])}")
@@ -1,9 +1,56 @@
 import os
 from openai import OpenAI
 import instructor
-from database import get_all_cars, search_cars
+from database import get_all_cars, search_cars, iter_search, save_search_page, get_search_page
 from models import ChatbotAction, CarSearchCriteria, GetCarInventory
-import json
+from car_listings import render_car_options, format_tool_results, pick_options, MAX_OPTIONS
+from car_ranker import rank_cars, RANKED_OPTIONS
+from response_cache import get_response_cache
+from local_parser import parse_message
+from history_budget import HistoryBudget, SUMMARY_MAX_TOKENS
+from model_tiers import ModelTiers
+from http_clients import get_http_client
+from metrics import span
+from resilience import get_breaker, CircuitOpenError, DeadlineExceeded
+from inventory_index import cursor_after, walk_key
+import hashlib
+import heapq
+from datetime import date
+from itertools import islice
+
+# How tool results are turned into a reply:
+#   'llm'         - a second completion writes the whole reply (slowest)
+#   'local'       - listings rendered locally, no second completion
+#   'local_intro' - local listings after a short LLM-written opening line
+RESPONSE_RENDERING = os.getenv('RESPONSE_RENDERING', 'local')
+
+# Handle greetings and explicit filter requests without the LLM when possible
+LOCAL_PARSER = os.getenv('LOCAL_PARSER', 'true').lower() == 'true'
+
+FALLBACK_REPLY = "I'm here to help you find a rental car! What kind of car are you looking for?"
+APOLOGY = "I apologize, but I'm having trouble processing your request right now. Could you please try again?"
+
+# With a deadline, an LLM call is not started with less than this many seconds left
+STAGE_MIN_SECONDS = float(os.getenv('STAGE_MIN_SECONDS', 2))
+# Kept back from the router's budget for the tool query and a locally rendered reply
+LOCAL_REPLY_SECONDS = 1.0
+# Degraded answers, served when the router is unavailable or out of time
+DEGRADED_INTRO = "I'm running a little slow right now, but here's what I found:"
+DEGRADED_REPLY = ("I'm running a little slow right now. Could you tell me what you're looking for, "
+                  "like \"an SUV for 5 people under 300 AED\"?")
+NO_MORE_REPLY = ("That's everything I have for that search. Would you like to try other dates, "
+                 "a different budget or another type of car?")
+
+
+def search_page_key(user_message, reply):
+    """Identifies a search reply in the conversation history (see CarRentalChatbot.next_page)"""
+    return hashlib.sha256(f"{user_message}\0{reply}".encode('utf-8')).hexdigest()
+
+
+def has_summary(messages):
+    """Whether build_messages() added a summary of older turns (it follows the system prompt)"""
+    return len(messages) > 1 and messages[1]['role'] == 'system'
+
 
 class CarRentalChatbot:
     def __init__(self):
@@ -12,10 +59,15 @@ class CarRentalChatbot:
         if not api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
 
-        # Keep both regular and Instructor-patched clients
-        self.openai_client = OpenAI(api_key=api_key)
-        self.client = instructor.from_openai(OpenAI(api_key=api_key))
-        self.model = "gpt-4"
+        # Keep both regular and Instructor-patched clients, on the shared connection pool
+        self.openai_client = OpenAI(api_key=api_key, http_client=get_http_client())
+        self.client = instructor.from_openai(self.openai_client)
+        # Single-attempt clients for turns with a deadline; SDK retries would overrun it
+        # (Instructor's own retries are turned off per call, see llm_client())
+        self.deadline_openai_client = self.openai_client.with_options(max_retries=0)
+        self.deadline_client = instructor.from_openai(self.deadline_openai_client)
+        # Model per stage (router, responder, summary, transcription)
+        self.model_tiers = ModelTiers()
 
         # System prompt for the chatbot
         self.system_prompt = """You're a professional car rental assistant. Be warm, helpful, and efficient - like a knowledgeable colleague helping a friend.
@@ -69,95 +121,433 @@ Step 4: Only after they confirm, collect contact information
 - NEVER include image URLs or links in your responses - images are sent separately via WhatsApp
 
 **Available tools:**
-1. search_cars - Filter cars by price, passenger count, category, or fuel type
+1. search_cars - Filter cars by price, passenger count, category, fuel type, or required features, and by availability for pickup/return dates once the customer has given them; sort by price, passengers or year and limit the count when they ask (e.g. "the 5 newest")
 2. get_inventory - Get all available cars
+3. show_more - The next cars of the last search, when they ask to see more options
 
 Use these tools when customers ask about availability or specific requirements."""
+        # Cached replies are only reused while the prompt is unchanged
+        self.prompt_version = hashlib.sha256(self.system_prompt.encode('utf-8')).hexdigest()[:16]
+
+        # Older turns beyond the prompt token budget are sent as a summary
+        self.history_budget = HistoryBudget(self.summarize_history)
 
-    def get_response(self, user_message, conversation_history=None):
+    def get_response(self, user_message, conversation_history=None, phone_number=None, deadline=None):
         """Get a response from the chatbot using Instructor for structured outputs"""
+        return "".join(self.stream_response(user_message, conversation_history, phone_number, deadline))
+
+    def stream_response(self, user_message, conversation_history=None, phone_number=None, deadline=None):
+        """
+        Yield the response in chunks as it is generated.
+
+        The structured tool-selection call always completes first; what is
+        streamed is the final text (the second completion in 'llm' mode).
+        `phone_number` identifies WhatsApp conversations, whose history
+        summary is stored in the database. With a `deadline`
+        (resilience.Deadline) each LLM call gets the time that is left, and
+        stages that cannot finish in time are answered locally instead.
+        """
         if conversation_history is None:
             conversation_history = []
+        with span('history'):
+            messages = self.build_messages(user_message, conversation_history, phone_number)
 
-        # Build messages for OpenAI
-        messages = [{"role": "system", "content": self.system_prompt}]
-
-        # Add conversation history
-        for msg in conversation_history:
-            messages.append(msg)
-
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
-
+        streamed = False
+        degraded = False
         try:
-            # Use Instructor to get structured output
-            action: ChatbotAction = self.client.chat.completions.create(
-                model=self.model,
-                response_model=ChatbotAction,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1500
-            )
+            # Identical conversation openers reuse an earlier reply
+            cache = get_response_cache()
+            if cache:
+                with span('cache_lookup'):
+                    key, versions, cached = cache.lookup(user_message, conversation_history, self.cache_context(),
+                                                         summarized=has_summary(messages))
+                if cached is not None:
+                    yield cached
+                    return
+
+            with span('local_parse'):
+                local = parse_message(user_message, conversation_history) if LOCAL_PARSER else None
+            if local:
+                action = local.action
+            else:
+                action = self.route(messages, deadline)
+                if action is None:
+                    # Answer from whatever filters or needs the message names, without the LLM
+                    degraded = True
+                    local = parse_message(user_message, strict=False)
+                    if local:
+                        action = local.action
+                    elif rank_cars(user_message):
+                        action = ChatbotAction(action_type='get_inventory')
+                    else:
+                        action = ChatbotAction(action_type='direct_response', response=DEGRADED_REPLY)
 
             # Handle different action types
-            if action.action_type == "search_cars" and action.search_criteria:
-                # Convert Pydantic model to dict, excluding None values
-                criteria = action.search_criteria.model_dump(exclude_none=True)
-                cars = search_cars(criteria)
-
-                # Format car results for the final response
-                car_data = json.dumps(cars)
-
-                # Get natural language response with the car data
-                final_messages = messages + [
-                    {"role": "assistant", "content": f"[Searching cars with criteria: {criteria}]"},
-                    {"role": "user", "content": f"Here are the matching cars: {car_data}. Please present these to the customer naturally."}
-                ]
-
-                final_response = self.openai_client.chat.completions.create(
-                    model=self.model,
-                    messages=final_messages,
-                    temperature=0.7,
-                    max_tokens=1500
-                )
-
-                return final_response.choices[0].message.content
-
-            elif action.action_type == "get_inventory":
-                # Get all cars
-                cars = get_all_cars()
-                car_data = json.dumps(cars)
-
-                # Get natural language response with all cars
-                final_messages = messages + [
-                    {"role": "assistant", "content": "[Retrieving all available cars]"},
-                    {"role": "user", "content": f"Here are all available cars: {car_data}. Please present 2-3 good options to the customer naturally."}
-                ]
-
-                final_response = self.openai_client.chat.completions.create(
-                    model=self.model,
-                    messages=final_messages,
-                    temperature=0.7,
-                    max_tokens=1500
-                )
-
-                return final_response.choices[0].message.content
-
+            with span('tool'):
+                tool = self.run_tool(action, local, user_message, conversation_history)
+            more = tool.pop('more', None) if tool else None
+            if tool:
+                chunks = self.present_cars(messages, **tool, deadline=deadline, degraded=degraded)
+            elif action.action_type == "show_more":
+                chunks = [NO_MORE_REPLY]
             elif action.action_type == "direct_response" and action.response:
                 # Direct response without function calling
-                return action.response
-
+                chunks = [action.response]
             else:
                 # Fallback for unexpected cases
-                return "I'm here to help you find a rental car! What kind of car are you looking for?"
+                chunks = [FALLBACK_REPLY]
+
+            parts = []
+            # Includes time the consumer of a stream spends between chunks
+            with span('responder'):
+                for chunk in chunks:
+                    streamed = True
+                    parts.append(chunk)
+                    yield chunk
+
+            if more:
+                self.remember_page(user_message, "".join(parts), more)
+
+            if cache and not degraded:
+                with span('cache_store'):
+                    cache.store(key, versions, "".join(parts))
 
         except Exception as e:
             print(f"Error getting response: {e}")
             import traceback
             traceback.print_exc()
-            return "I apologize, but I'm having trouble processing your request right now. Could you please try again?"
+            yield f"\n\n{APOLOGY}" if streamed else APOLOGY
+
+    def build_messages(self, user_message, conversation_history, phone_number=None):
+        """Messages for the tool-selection call: prompt, summary, recent history, new message"""
+        # The date lets the model resolve "the 12th"
+        system_content = f"{self.system_prompt}\n\nToday's date: {date.today():%A, %Y-%m-%d}"
+        messages = [{"role": "system", "content": system_content}]
+
+        # Add conversation history, within the prompt token budget
+        summary, recent_history = self.history_budget.prepare(
+            system_content, conversation_history, user_message, phone_number
+        )
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        for msg in recent_history:
+            messages.append(msg)
 
-    def format_car_info(self, car):
-        """Format car information for display"""
-        features = ", ".join(car['features'][:3])  # Show top 3 features
-        return f"{car['year']} {car['make']} {car['model']} - AED {car['daily_price']:.2f}/day ({car['passengers']} passengers, {features})"
+        # Add current user message
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def route(self, messages, deadline=None):
+        """
+        The router's ChatbotAction, or None when the LLM is unavailable:
+        its circuit is open, the call failed, or the deadline is too close.
+        """
+        try:
+            client, options = self.llm_client(deadline, reserve=LOCAL_REPLY_SECONDS)
+            # Use Instructor to get structured output
+            with span('router'), get_breaker('openai_chat').call(), self.model_tiers.track('router') as call:
+                action, completion = client.chat.completions.create_with_completion(
+                    model=call.model,
+                    response_model=ChatbotAction,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1500,
+                    **options
+                )
+                call.usage = completion.usage
+            return action
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            print(f"Skipping the router: {e}")
+        except Exception as e:
+            print(f"Router call failed: {e}")
+        return None
+
+    def llm_client(self, deadline, reserve=0.0, structured=True):
+        """
+        (client, extra create() arguments) for a call within `deadline`
+
+        Raises:
+            DeadlineExceeded: Less than STAGE_MIN_SECONDS would be left for the call
+        """
+        if deadline is None:
+            return (self.client if structured else self.openai_client), {}
+        timeout = deadline.budget(reserve=reserve, minimum=STAGE_MIN_SECONDS)
+        if structured:
+            # Instructor retries 3 times by default, each with the full timeout
+            return self.deadline_client, {'timeout': timeout, 'max_retries': 1}
+        return self.deadline_openai_client, {'timeout': timeout}
+
+    def cache_context(self):
+        """Settings a cached reply depends on besides the conversation"""
+        return [self.prompt_version, *self.model_tiers.config_key(), RESPONSE_RENDERING]
+
+    def run_tool(self, action, local=None, user_message=None, conversation_history=None):
+        """
+        Run the database side of a search/inventory/show_more action. When
+        the message describes needs (see car_ranker), only the best matches
+        of a large result are kept, best first. Sorted or limited searches
+        return one page, in order.
+
+        Returns:
+            present_cars() keyword arguments, plus 'more' (see remember_page)
+            when there are cars left to show; None for other actions
+        """
+        if action.action_type == "show_more":
+            return self.next_page(conversation_history or [])
+
+        if action.action_type == "search_cars" and action.search_criteria:
+            # Convert Pydantic model to dict, excluding None values
+            criteria = action.search_criteria.model_dump(exclude_none=True)
+            # "SUV" covers several categories; merge their results
+            categories = list(local.categories) if local and local.categories else None
+            dates_given = 'pickup_at' in criteria and 'return_at' in criteria
+            if criteria.get('sort_by') or criteria.get('limit'):
+                cars, more = self.search_page(criteria, categories)
+                return {
+                    'cars': cars,
+                    'tool_note': f"[Searching cars with criteria: {criteria}, in the order asked for]",
+                    'request': "Here are the matching cars, in the order the customer asked for:\n{cars}\nPlease present all of them to the customer naturally, in this order.",
+                    'dates_given': dates_given,
+                    'ranked': True,
+                    'limit': len(cars) or MAX_OPTIONS,
+                    'more': more,
+                }
+            if categories:
+                cars = sorted(
+                    (car for category in categories for car in search_cars(dict(criteria, category=category))),
+                    key=lambda car: car['id']
+                )
+            else:
+                cars = search_cars(criteria)
+            ranked = rank_cars(user_message, cars) if user_message and len(cars) > RANKED_OPTIONS else None
+            if ranked:
+                return {
+                    'cars': ranked,
+                    'tool_note': f"[Searching cars with criteria: {criteria}, best matches first]",
+                    'request': "Here are the matching cars that best fit the customer's needs, best first:\n{cars}\nPlease present these to the customer naturally.",
+                    'dates_given': dates_given,
+                    'ranked': True,
+                    'more': self.more_state(ranked, criteria, categories, needs=user_message, ranked=True),
+                }
+            return {
+                'cars': cars,
+                'tool_note': f"[Searching cars with criteria: {criteria}]",
+                'request': "Here are the matching cars, one per line:\n{cars}\nPlease present these to the customer naturally.",
+                'dates_given': dates_given,
+                'more': self.more_state(cars, criteria, categories),
+            }
+
+        if action.action_type == "get_inventory":
+            # Free-text needs ("comfy, for a desert trip") rank the fleet instead of listing all of it
+            ranked = rank_cars(user_message) if user_message else None
+            if ranked:
+                return {
+                    'cars': ranked,
+                    'tool_note': "[Ranking all available cars against the customer's needs]",
+                    'request': "Here are the cars that best fit the customer's needs, best first:\n{cars}\nPlease present 2-3 of them naturally, saying briefly why they fit.",
+                    'ranked': True,
+                    'more': self.more_state(ranked, {}, needs=user_message, ranked=True),
+                }
+            # Get all cars
+            cars = get_all_cars()
+            return {
+                'cars': cars,
+                'tool_note': "[Retrieving all available cars]",
+                'request': "Here are the available cars, one per line:\n{cars}\nPlease present 2-3 good options to the customer naturally.",
+                'more': self.more_state(cars, {}),
+            }
+        return None
+
+    def search_page(self, criteria, categories=None, cursor=None, shown=()):
+        """
+        The next `limit` (default MAX_OPTIONS) matching cars in the
+        criteria's sort order after `cursor`, skipping the ids in `shown`.
+
+        Returns:
+            (cars, 'more' state for the page after them, or None)
+        """
+        page_size = criteria.get('limit') or MAX_OPTIONS
+        if categories:
+            walks = [iter_search(dict(criteria, category=category), cursor) for category in categories]
+            cars = heapq.merge(*walks, key=walk_key(criteria))
+        else:
+            cars = iter_search(criteria, cursor)
+        skip = set(shown)
+        page = list(islice((car for car in cars if car['id'] not in skip), page_size + 1))
+        if len(page) <= page_size:
+            return page, None
+        page = page[:page_size]
+        return page, self.more_state(page, criteria, categories, cursor=cursor_after(criteria, page[-1]),
+                                     shown=list(shown))
+
+    def more_state(self, cars, criteria, categories=None, needs=None, ranked=False, cursor=None, shown=None):
+        """
+        What a "show me more" turn needs to continue a search, or None when
+        the reply offers every car (see remember_page). Without a cursor,
+        the cars the reply offers are recorded in `shown` and skipped.
+        """
+        if cursor is None:
+            offered = [car['id'] for car in pick_options(cars, MAX_OPTIONS, ranked)]
+            if needs is None and len(offered) == len(cars):
+                return None
+            shown = (shown or []) + offered
+        saved = dict(criteria)
+        if categories:
+            saved['categories'] = categories
+        if needs:
+            saved['needs'] = needs
+        return {'criteria': saved, 'cursor': cursor, 'shown': shown or []}
+
+    def remember_page(self, user_message, reply, more):
+        """Save where this search reply stopped, keyed by the exchange (errors are only logged)"""
+        try:
+            with span('search_page'):
+                save_search_page(search_page_key(user_message, reply), **more)
+        except Exception as e:
+            print(f"Error saving search page: {e}")
+
+    def next_page(self, conversation_history):
+        """
+        present_cars() arguments for "show me more": the next cars of the
+        search behind the last reply, or None when there are none left.
+
+        Sorted searches continue from their cursor, so a page costs the same
+        however deep it is. Rankings have no keyset, so those are ranked
+        again and the cars already offered are skipped.
+        """
+        if len(conversation_history) < 2:
+            return None
+        question, reply = conversation_history[-2:]
+        if question.get('role') != 'user' or reply.get('role') != 'assistant':
+            return None
+        saved = get_search_page(search_page_key(question['content'], reply['content']))
+        if saved is None:
+            return None
+
+        criteria = saved['criteria']
+        categories = criteria.pop('categories', None)
+        needs = criteria.pop('needs', None)
+        if needs:
+            shown = set(saved['shown'])
+            pool = None
+            if criteria:
+                pool = [car for category in (categories or [criteria.get('category')])
+                        for car in search_cars(dict(criteria, category=category))]
+            ranked = rank_cars(needs, pool, k=len(shown) + MAX_OPTIONS) or []
+            cars = [car for car in ranked if car['id'] not in shown][:MAX_OPTIONS]
+            more = self.more_state(cars, criteria, categories, needs=needs, ranked=True, shown=list(shown))
+        else:
+            cars, more = self.search_page(criteria, categories, saved['cursor'], saved['shown'])
+        if not cars:
+            return None
+        return {
+            'cars': cars,
+            'tool_note': f"[Showing more cars for: {criteria}]",
+            'request': "Here are more matching cars for the customer's last search, in order:\n{cars}\nPlease present them to the customer naturally as further options.",
+            'dates_given': 'pickup_at' in criteria and 'return_at' in criteria,
+            'ranked': True,
+            'limit': len(cars),
+            'more': more,
+        }
+
+    def summarize_history(self, previous_summary, new_messages):
+        """Fold older messages into the rolling conversation summary"""
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in new_messages)
+        prompt = (
+            "Update the summary of this car rental chat for the assistant's memory. Keep what "
+            "matters for the booking: passengers, dates, budget, preferences, cars shown or chosen, "
+            "booking progress and contact details. Max 120 words, no preamble.\n\n"
+            f"Current summary: {previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        with self.model_tiers.track('summary') as call:
+            response = self.openai_client.chat.completions.create(
+                model=call.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=SUMMARY_MAX_TOKENS
+            )
+            call.usage = response.usage
+        return response.choices[0].message.content.strip()
+
+    def present_cars(self, messages, cars, tool_note, request, dates_given=False, ranked=False,
+                     limit=MAX_OPTIONS, deadline=None, degraded=False):
+        """
+        Yield the reply for tool results, as configured by RESPONSE_RENDERING.
+        `request` is the prompt for the 'llm' mode, with a {cars} placeholder.
+        Local rendering shows up to `limit` cars (a whole page when paging).
+        Listings are rendered locally when the LLM cannot write them in time,
+        and always for `degraded` turns.
+        """
+        if degraded:
+            yield render_car_options(cars, intro=DEGRADED_INTRO if cars else None, dates_given=dates_given,
+                                     limit=limit, ranked=ranked)
+            return
+
+        if RESPONSE_RENDERING == 'llm':
+            started = False
+            try:
+                for text in self.stream_listing(messages, cars, tool_note, request, ranked, deadline):
+                    started = True
+                    yield text
+                return
+            except Exception as e:
+                if started:
+                    raise
+                print(f"Rendering listings locally: {e}")
+
+        intro = None
+        if RESPONSE_RENDERING == 'local_intro' and cars:
+            intro = self.write_intro(messages, cars, deadline)
+        yield render_car_options(cars, intro=intro, dates_given=dates_given, limit=limit, ranked=ranked)
+
+    def stream_listing(self, messages, cars, tool_note, request, ranked=False, deadline=None):
+        """Yield the 'llm' mode reply as the responder streams it"""
+        client, options = self.llm_client(deadline, structured=False)
+        with get_breaker('openai_chat').call(), self.model_tiers.track('responder') as call:
+            stream = client.chat.completions.create(
+                model=call.model,
+                messages=self.listing_messages(messages, cars, tool_note, request, ranked),
+                temperature=0.7,
+                max_tokens=1500,
+                stream=True,
+                stream_options={"include_usage": True},
+                **options
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    call.first_token()
+                    yield chunk.choices[0].delta.content
+                call.usage = getattr(chunk, 'usage', None) or call.usage
+
+    def listing_messages(self, messages, cars, tool_note, request, ranked=False):
+        """Messages for the 'llm' mode completion that presents tool results"""
+        return messages + [
+            {"role": "assistant", "content": tool_note},
+            {"role": "user", "content": request.format(cars=format_tool_results(cars, ranked=ranked))}
+        ]
+
+    def write_intro(self, messages, cars, deadline=None):
+        """One short opening sentence for locally rendered listings (None on failure)"""
+        try:
+            client, options = self.llm_client(deadline, structured=False)
+            with get_breaker('openai_chat').call(), self.model_tiers.track('responder') as call:
+                response = client.chat.completions.create(
+                    model=call.model,
+                    messages=self.intro_messages(messages, cars),
+                    temperature=0.7,
+                    max_tokens=40,
+                    **options
+                )
+                call.usage = response.usage
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Error writing listing intro: {e}")
+            return None
+
+    def intro_messages(self, messages, cars):
+        names = ", ".join(f"{car['make']} {car['model']}" for car in cars[:5])
+        return messages + [{
+            "role": "user",
+            "content": f"[{len(cars)} matching cars, including {names}. Write ONE short, warm sentence "
+                       "(max 20 words) introducing the options. No prices, no list, no question.]"
+        }]
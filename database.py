@@ -1,225 +1,503 @@
+import atexit
+import os
 import sqlite3
 import json
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
+
+from availability import AvailabilityIndex, to_timestamp
+from inventory_index import InventoryIndex, SORT_COLUMNS, cursor_after, decode_cursor, sort_order
+from metrics import span
+from write_behind import WriteBehindQueue
 
 DB_NAME = 'car_rental.db'
 
+# Connection tuning (override via environment for larger deployments)
+POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 8))
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 16384))
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+
+# How often (seconds) a cached inventory snapshot re-checks the data version
+INVENTORY_CHECK_INTERVAL = float(os.getenv('INVENTORY_CHECK_INTERVAL', 1.0))
+
+# Number of most recent messages returned as conversation history
+HISTORY_WINDOW = 20
+
+# Cars per page when a sorted search gives no limit
+PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 10))
+
+# Conversation durability: 'sync' commits before save_user_conversation()
+# returns; 'batched' queues the write and commits it in the background
+# (lost only if the process dies within CONVERSATION_BATCH_MS)
+CONVERSATION_WRITE_MODE = os.getenv('CONVERSATION_WRITE_MODE', 'batched')
+CONVERSATION_BATCH_SIZE = int(os.getenv('CONVERSATION_BATCH_SIZE', 64))
+CONVERSATION_BATCH_MS = int(os.getenv('CONVERSATION_BATCH_MS', 50))
+
+
+class ConnectionPool:
+    """
+    Small LIFO pool of persistent SQLite connections.
+
+    Connections are opened in WAL mode so readers never block on the writer,
+    and are handed out to one thread at a time. Idle connections beyond
+    `size` are closed on release, so bursts never leave extra files open.
+    """
+
+    def __init__(self, db_name, size=POOL_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self.pid = os.getpid()
+        self.opened = 0
+        self.reused = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        self.opened += 1
+        return conn
+
+    def acquire(self):
+        """Borrow a connection, opening a new one if none are idle"""
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+        return self._open()
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Pools inherited across fork(); kept referenced so their connections are
+# never closed (or garbage-collected) in the child
+_inherited_pools = []
+
+
+def _get_pool():
+    """Return the process-wide pool, rebuilding it after fork or a DB_NAME change"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid() and pool.db_name == DB_NAME:
+        return pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid() and _pool.db_name != DB_NAME:
+            _pool.close_all()
+        if _pool is None or _pool.pid != os.getpid() or _pool.db_name != DB_NAME:
+            _pool = ConnectionPool(DB_NAME)
+        return _pool
+
+
+def _after_fork_in_child():
+    """Gunicorn forks workers; SQLite connections must never be carried across fork()"""
+    global _pool, _pool_lock, _conversation_writer, _writer_lock
+    # No locks here: another thread may have held the pool's lock at fork time
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_lock = threading.Lock()
+    for cache in VersionedCache.instances:
+        cache.lock = threading.Lock()
+    # The writer thread does not survive fork; the parent commits its own queue
+    _conversation_writer = None
+    _writer_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+_pinned = threading.local()
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled database connection for the duration of a block"""
+    pinned = pinned_connection()
+    if pinned is not None:
+        try:
+            yield pinned
+        except BaseException:
+            if pinned.in_transaction:
+                pinned.rollback()
+            raise
+        return
+
+    pool = _get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
 def get_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    """Get a new, dedicated database connection (caller must close it)"""
+    return _get_pool()._open()
+
+
+def pin_thread_connection():
+    """
+    Give the calling thread its own connection, used by connection() instead
+    of the shared pool (for dedicated worker threads such as the async
+    executor's).
+    """
+    _pinned.conn = get_connection()
+    _pinned.key = (DB_NAME, os.getpid())
+    return _pinned.conn
+
+
+def pinned_connection():
+    """The calling thread's pinned connection, or None"""
+    conn = getattr(_pinned, 'conn', None)
+    if conn is not None and _pinned.key != (DB_NAME, os.getpid()):
+        # Database switched since pinning; open a fresh one for the new file
+        if _pinned.key[1] == os.getpid():
+            conn.close()
+        conn = pin_thread_connection()
     return conn
 
-def init_db():
-    """Initialize database with car inventory"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Create cars table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS cars (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            make TEXT NOT NULL,
-            model TEXT NOT NULL,
-            year INTEGER NOT NULL,
-            category TEXT NOT NULL,
-            daily_price REAL NOT NULL,
-            passengers INTEGER NOT NULL,
-            luggage INTEGER NOT NULL,
-            transmission TEXT NOT NULL,
-            fuel_type TEXT NOT NULL,
-            features TEXT NOT NULL,
-            image_url TEXT,
-            available BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Create conversations table for WhatsApp chat history
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            phone_number TEXT PRIMARY KEY,
-            history TEXT NOT NULL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Check if we already have data
-    cursor.execute('SELECT COUNT(*) FROM cars')
-    count = cursor.fetchone()[0]
-
-    if count == 0:
-        # Insert mock car inventory
-        cars = [
-            # Economy Cars
-            {
-                'make': 'Toyota', 'model': 'Corolla', 'year': 2024, 'category': 'Economy',
-                'daily_price': 35.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Backup Camera']),
-                'image_url': 'https://images.unsplash.com/photo-1621007947382-bb3c3994e3fb?w=800',
-                'available': 1
-            },
-            {
-                'make': 'Honda', 'model': 'Civic', 'year': 2024, 'category': 'Economy',
-                'daily_price': 38.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Lane Assist']),
-                'available': 1
-            },
-            {
-                'make': 'Hyundai', 'model': 'Elantra', 'year': 2023, 'category': 'Economy',
-                'daily_price': 33.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth']),
-                'available': 1
-            },
-
-            # Compact SUVs
-            {
-                'make': 'Mazda', 'model': 'CX-5', 'year': 2024, 'category': 'Compact SUV',
-                'daily_price': 55.00, 'passengers': 5, 'luggage': 3, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Apple CarPlay', 'All-Wheel Drive']),
-                'available': 1
-            },
-            {
-                'make': 'Honda', 'model': 'CR-V', 'year': 2024, 'category': 'Compact SUV',
-                'daily_price': 58.00, 'passengers': 5, 'luggage': 4, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Sunroof', 'Backup Camera']),
-                'available': 1
-            },
-            {
-                'make': 'Toyota', 'model': 'RAV4', 'year': 2023, 'category': 'Compact SUV',
-                'daily_price': 57.00, 'passengers': 5, 'luggage': 3, 'transmission': 'Automatic',
-                'fuel_type': 'Hybrid', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'All-Wheel Drive', 'Lane Assist']),
-                'available': 1
-            },
-
-            # Mid-Size SUVs
-            {
-                'make': 'Chevrolet', 'model': 'Tahoe', 'year': 2024, 'category': 'Full-Size SUV',
-                'daily_price': 85.00, 'passengers': 8, 'luggage': 5, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Third Row Seating', 'Leather Interior', '4WD']),
-                'available': 1
-            },
-            {
-                'make': 'Ford', 'model': 'Explorer', 'year': 2024, 'category': 'Mid-Size SUV',
-                'daily_price': 75.00, 'passengers': 7, 'luggage': 4, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Third Row Seating', 'Apple CarPlay']),
-                'available': 1
-            },
-
-            # Luxury Cars
-            {
-                'make': 'BMW', 'model': '3 Series', 'year': 2024, 'category': 'Luxury',
-                'daily_price': 95.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Premium Sound System', 'Leather Interior', 'Sunroof', 'Navigation', 'Heated Seats']),
-                'available': 1
-            },
-            {
-                'make': 'Mercedes-Benz', 'model': 'C-Class', 'year': 2024, 'category': 'Luxury',
-                'daily_price': 98.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Premium Sound System', 'Leather Interior', 'Sunroof', 'Navigation', 'Massage Seats']),
-                'available': 1
-            },
-            {
-                'make': 'Audi', 'model': 'A4', 'year': 2023, 'category': 'Luxury',
-                'daily_price': 92.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Premium Sound System', 'Leather Interior', 'Virtual Cockpit', 'All-Wheel Drive']),
-                'available': 1
-            },
-
-            # Vans/Large Groups
-            {
-                'make': 'Chrysler', 'model': 'Pacifica', 'year': 2024, 'category': 'Minivan',
-                'daily_price': 70.00, 'passengers': 8, 'luggage': 4, 'transmission': 'Automatic',
-                'fuel_type': 'Hybrid', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Stow-n-Go Seating', 'Rear Entertainment']),
-                'available': 1
-            },
-            {
-                'make': 'Honda', 'model': 'Odyssey', 'year': 2024, 'category': 'Minivan',
-                'daily_price': 68.00, 'passengers': 8, 'luggage': 4, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Power Sliding Doors', 'Backup Camera']),
-                'available': 1
-            },
-
-            # Electric/Hybrid
-            {
-                'make': 'Tesla', 'model': 'Model 3', 'year': 2024, 'category': 'Electric',
-                'daily_price': 88.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Electric', 'features': json.dumps(['Autopilot', 'Premium Sound System', 'Glass Roof', 'Supercharging Included']),
-                'available': 1
-            },
-            {
-                'make': 'Nissan', 'model': 'Leaf', 'year': 2024, 'category': 'Electric',
-                'daily_price': 52.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Electric', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Quick Charging', 'ProPILOT Assist']),
-                'available': 1
-            },
-
-            # Trucks
-            {
-                'make': 'Ford', 'model': 'F-150', 'year': 2024, 'category': 'Pickup Truck',
-                'daily_price': 78.00, 'passengers': 6, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['4WD', 'Towing Package', 'Bed Liner', 'Bluetooth', 'Backup Camera']),
-                'available': 1
-            },
-            {
-                'make': 'Chevrolet', 'model': 'Silverado', 'year': 2024, 'category': 'Pickup Truck',
-                'daily_price': 76.00, 'passengers': 6, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['4WD', 'Towing Package', 'Apple CarPlay', 'Bluetooth']),
-                'available': 1
-            },
-
-            # Sports/Performance
-            {
-                'make': 'Ford', 'model': 'Mustang', 'year': 2024, 'category': 'Sports',
-                'daily_price': 110.00, 'passengers': 4, 'luggage': 2, 'transmission': 'Manual',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Performance Package', 'Premium Sound System', 'Sport Seats', 'Track Apps']),
-                'available': 1
-            },
-            {
-                'make': 'Chevrolet', 'model': 'Camaro', 'year': 2024, 'category': 'Sports',
-                'daily_price': 108.00, 'passengers': 4, 'luggage': 2, 'transmission': 'Automatic',
-                'fuel_type': 'Gasoline', 'features': json.dumps(['Performance Exhaust', 'Sport Suspension', 'Premium Interior', 'Brembo Brakes']),
-                'available': 1
-            }
-        ]
-
-        for car in cars:
-            cursor.execute('''
-                INSERT INTO cars (make, model, year, category, daily_price, passengers,
-                                luggage, transmission, fuel_type, features, image_url, available)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                car['make'], car['model'], car['year'], car['category'], car['daily_price'],
-                car['passengers'], car['luggage'], car['transmission'], car['fuel_type'],
-                car['features'], car.get('image_url'), car['available']
-            ))
 
-        conn.commit()
-        print(f"Database initialized with {len(cars)} cars")
+def close_connections():
+    """Close all pooled connections (e.g. on shutdown or in tests)"""
+    if _pool is not None:
+        _pool.close_all()
 
-    conn.close()
 
-def get_all_cars():
-    """Get all cars from database"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM cars WHERE available = 1')
-    rows = cursor.fetchall()
-    conn.close()
+def get_pool_stats():
+    """Connection pool counters"""
+    pool = _get_pool()
+    return {'opened': pool.opened, 'reused': pool.reused, 'idle': len(pool._idle)}
+
+def init_db():
+    """Create or upgrade the schema and seed data (see migrations.py)"""
+    import migrations  # migrations imports this module
+    migrations.migrate()
+
+
+class InventorySnapshot:
+    """
+    Immutable copy of the available fleet at one inventory version.
+
+    The car dicts are shared by every reader, so callers must treat them as
+    read-only.
+    """
+    __slots__ = ('version', 'cars', 'by_id', 'index')
+
+    def __init__(self, version, cars):
+        self.version = version
+        self.cars = tuple(cars)
+        self.by_id = {car['id']: car for car in self.cars}
+        self.index = InventoryIndex(self.cars)
+
+
+def _read_data_version(conn, name):
+    row = conn.execute('SELECT version FROM data_versions WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+
+class VersionedCache:
+    """
+    Process-wide value derived from a table, rebuilt only when the table's
+    data_versions counter changes.
+
+    Within INVENTORY_CHECK_INTERVAL of the last check get() is a plain
+    attribute read; after that one tiny query compares the stored version.
+    """
+    instances = []
+
+    def __init__(self, name, build):
+        """
+        Args:
+            name: Row in data_versions that triggers bump for this table
+            build: Callable (conn, version) -> value
+        """
+        self.name = name
+        self.build = build
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+        self._value = None
+        self._key = None
+        self._checked_at = 0.0
+        VersionedCache.instances.append(self)
+
+    def _fresh(self):
+        return (self._value is not None and self._key[0] == DB_NAME
+                and time.monotonic() - self._checked_at < INVENTORY_CHECK_INTERVAL)
+
+    def get(self):
+        if self._fresh():
+            self.stats['hits'] += 1
+            return self._value
+
+        with self.lock:
+            if self._fresh():
+                # Another thread refreshed while we waited for the lock
+                self.stats['hits'] += 1
+                return self._value
+
+            with connection() as conn:
+                # Read the version before the rows: a concurrent write then at
+                # worst causes one extra rebuild, never a stale value
+                version = _read_data_version(conn, self.name)
+                if self._value is not None and self._key == (DB_NAME, version):
+                    self._checked_at = time.monotonic()
+                    self.stats['hits'] += 1
+                    return self._value
+                value = self.build(conn, version)
+
+            self._value = value
+            self._key = (DB_NAME, version)
+            self._checked_at = time.monotonic()
+            self.stats['misses'] += 1
+            return value
+
+    def invalidate(self):
+        """Drop the cached value so the next get() rebuilds it"""
+        with self.lock:
+            self._value = None
+            self._key = None
+
+    @property
+    def version(self):
+        return self._key[1] if self._key else None
+
+
+def _load_inventory_rows(conn):
+    # Select every column in table order, but materialise features from
+    # car_features rather than decoding the JSON copy
+    columns = [
+        'NULL AS features' if row['name'] == 'features' else row['name']
+        for row in conn.execute('PRAGMA table_info(cars)')
+    ]
+    rows = conn.execute(
+        f'SELECT {", ".join(columns)} FROM cars WHERE available = 1 ORDER BY id'
+    ).fetchall()
+
+    feature_names = dict(conn.execute('SELECT id, name FROM features').fetchall())
+    features_by_car = {}
+    for car_id, feature_id in conn.execute('''
+        SELECT cf.car_id, cf.feature_id FROM car_features AS cf
+        JOIN cars ON cars.id = cf.car_id
+        WHERE cars.available = 1
+        ORDER BY cf.car_id, cf.position
+    '''):
+        features_by_car.setdefault(car_id, []).append(feature_names[feature_id])
 
     cars = []
     for row in rows:
         car = dict(row)
-        car['features'] = json.loads(car['features'])
+        car['features'] = features_by_car.get(car['id'], [])
         cars.append(car)
-
     return cars
 
+
+def get_feature_names():
+    """Feature dictionary: every feature name known to the fleet"""
+    with connection() as conn:
+        return [row['name'] for row in conn.execute('SELECT name FROM features ORDER BY name')]
+
+
+_inventory_cache = VersionedCache(
+    'inventory', lambda conn, version: InventorySnapshot(version, _load_inventory_rows(conn))
+)
+
+
+def get_inventory():
+    """Get the current inventory snapshot (rebuilt only when the cars table changed)"""
+    return _inventory_cache.get()
+
+
+def invalidate_inventory():
+    """
+    Mark the inventory as changed for every process and drop our snapshot.
+
+    Row changes to `cars` bump the version through triggers already; call this
+    after anything the triggers cannot see, such as ALTER TABLE in a
+    migration script.
+    """
+    with connection() as conn:
+        conn.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'inventory'")
+        conn.commit()
+    _inventory_cache.invalidate()
+
+
+def get_inventory_stats():
+    """Snapshot cache counters"""
+    snapshot = _inventory_cache._value
+    return {
+        **_inventory_cache.stats,
+        'version': _inventory_cache.version,
+        'cars': len(snapshot.cars) if snapshot else 0
+    }
+
+
+def _load_availability(conn, version):
+    # Reservations that already ended can never block a future search
+    rows = conn.execute('''
+        SELECT car_id, pickup_at, return_at FROM reservations
+        WHERE status = 'confirmed' AND return_at > datetime('now')
+        ORDER BY car_id, pickup_at
+    ''').fetchall()
+    return AvailabilityIndex(rows)
+
+
+_availability_cache = VersionedCache('reservations', _load_availability)
+
+
+def get_availability():
+    """Get the current availability index over confirmed reservations"""
+    return _availability_cache.get()
+
+
+def get_data_versions():
+    """(inventory, reservations) versions, for keying caches of derived answers"""
+    inventory = get_inventory().version
+    get_availability()
+    return inventory, _availability_cache.version
+
+
+def book_car(car_id, pickup_at, return_at, customer=None):
+    """
+    Reserve a car for [pickup_at, return_at).
+
+    Returns:
+        The new reservation id, or None if the car is already booked for
+        part of that period
+    """
+    pickup_at, return_at = to_timestamp(pickup_at), to_timestamp(return_at)
+    if return_at <= pickup_at:
+        raise ValueError("return_at must be after pickup_at")
+
+    with connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        clash = conn.execute('''
+            SELECT 1 FROM reservations
+            WHERE car_id = ? AND status = 'confirmed' AND pickup_at < ? AND return_at > ?
+            LIMIT 1
+        ''', (car_id, return_at, pickup_at)).fetchone()
+        if clash:
+            conn.rollback()
+            print(f"Car {car_id} is already booked between {pickup_at} and {return_at}")
+            return None
+        reservation_id = conn.execute('''
+            INSERT INTO reservations (car_id, pickup_at, return_at, customer)
+            VALUES (?, ?, ?, ?)
+        ''', (car_id, pickup_at, return_at, customer)).lastrowid
+        conn.commit()
+
+    # Other processes notice through the version counter; this one must not
+    # offer the car again even within INVENTORY_CHECK_INTERVAL
+    _availability_cache.invalidate()
+    return reservation_id
+
+
+def cancel_reservation(reservation_id):
+    """Cancel a reservation, freeing the car for that period"""
+    with connection() as conn:
+        conn.execute("UPDATE reservations SET status = 'cancelled' WHERE id = ?", (reservation_id,))
+        conn.commit()
+    _availability_cache.invalidate()
+
+
+def _rental_window(criteria):
+    """(pickup, return) timestamps from criteria, or None if not both given"""
+    if criteria.get('pickup_at') and criteria.get('return_at'):
+        return to_timestamp(criteria['pickup_at']), to_timestamp(criteria['return_at'])
+    return None
+
+
+def get_all_cars():
+    """Get all cars from database"""
+    return list(get_inventory().cars)
+
 def search_cars(criteria):
-    """Search cars based on criteria"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    """
+    Search cars based on criteria: in id order, or the first page when the
+    criteria ask for a sort order or a limit (see search_cars_page)
+    """
+    if criteria.get('sort_by') or criteria.get('limit'):
+        return search_cars_page(criteria)[0]
+
+    cars = get_inventory().index.search(criteria)
+
+    window = _rental_window(criteria)
+    if window:
+        cars = get_availability().filter_free(cars, *window)
+
+    return cars
+
+def iter_search(criteria, cursor=None):
+    """Matching free cars in the criteria's sort order, lazily, after `cursor`"""
+    cars = get_inventory().index.ordered(criteria, cursor)
+
+    window = _rental_window(criteria)
+    if window:
+        cars = get_availability().iter_free(cars, *window)
 
+    return cars
+
+def search_cars_page(criteria, cursor=None):
+    """
+    One page of search results: `limit` cars (PAGE_SIZE by default) in the
+    criteria's sort order (cheapest first by default), after `cursor`.
+
+    Only the page and one car past it are taken from the index, so each
+    page costs the same however deep into the results it is.
+
+    Returns:
+        (cars, cursor for the next page, or None after the last page)
+
+    Raises:
+        ValueError: The cursor is malformed or was made for another sort order
+    """
+    limit = criteria.get('limit') or PAGE_SIZE
+    cars = list(islice(iter_search(criteria, cursor), limit + 1))
+    if len(cars) <= limit:
+        return cars, None
+    return cars[:limit], cursor_after(criteria, cars[limit - 1])
+
+def search_cars_sql(criteria, cursor=None):
+    """
+    Search cars with a SQL query against the cars table.
+
+    Reference implementation for search_cars() and search_cars_page(); kept
+    for verification and benchmarking of the in-memory index. Sorted pages
+    use the covering indexes from migration 8 and a keyset condition on
+    the cursor, so SQLite stops after `limit` rows.
+    """
     query = 'SELECT * FROM cars WHERE available = 1'
     params = []
 
@@ -239,9 +517,52 @@ def search_cars(criteria):
         query += ' AND fuel_type = ?'
         params.append(criteria['fuel_type'])
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    if criteria.get('required_features'):
+        names = {name.lower(): name for name in criteria['required_features']}
+        query += f''' AND id IN (
+            SELECT cf.car_id FROM features AS f
+            JOIN car_features AS cf ON cf.feature_id = f.id
+            WHERE f.name IN ({", ".join("?" * len(names))})
+            GROUP BY cf.car_id
+            HAVING COUNT(DISTINCT cf.feature_id) = ?
+        )'''
+        params.extend(names.values())
+        params.append(len(names))
+
+    window = _rental_window(criteria)
+    if window:
+        query += ''' AND id NOT IN (
+            SELECT car_id FROM reservations
+            WHERE status = 'confirmed' AND pickup_at < ? AND return_at > ?
+        )'''
+        params.extend([window[1], window[0]])
+
+    if criteria.get('sort_by') or criteria.get('limit') or cursor:
+        sort_by, descending = sort_order(criteria)
+        column = SORT_COLUMNS[sort_by]
+        after = decode_cursor(cursor, criteria) if cursor else None
+        if sort_by == 'price':
+            order = 'daily_price DESC, id DESC' if descending else 'daily_price, id'
+            if after:
+                query += f' AND (daily_price, id) {"<" if descending else ">"} (?, ?)'
+                params.extend(after)
+        elif descending:
+            order = f'{column} DESC, daily_price, id'
+            if after:
+                query += f' AND ({column} < ? OR ({column} = ? AND (daily_price, id) > (?, ?)))'
+                params.extend([after[0], *after])
+        else:
+            order = f'{column}, daily_price, id'
+            if after:
+                query += f' AND ({column}, daily_price, id) > (?, ?, ?)'
+                params.extend(after)
+        query += f' ORDER BY {order} LIMIT ?'
+        params.append(criteria.get('limit') or PAGE_SIZE)
+    else:
+        query += ' ORDER BY id'
+
+    with connection() as conn:
+        rows = conn.execute(query, params).fetchall()
 
     cars = []
     for row in rows:
@@ -251,41 +572,147 @@ def search_cars(criteria):
 
     return cars
 
-def get_user_conversation(phone_number):
-    """Get conversation history for a WhatsApp user"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT history FROM conversations WHERE phone_number = ?', (phone_number,))
-    row = cursor.fetchone()
-    conn.close()
+_conversation_writer = None
+_writer_lock = threading.Lock()
 
-    if row:
-        return json.loads(row['history'])
-    return []
 
-def save_user_conversation(phone_number, user_msg, bot_msg):
-    """Save conversation history for a WhatsApp user"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def _commit_exchanges(batch):
+    """Commit a batch of queued (phone_number, user_msg, bot_msg) in one transaction"""
+    with span('sqlite_commit'), connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for phone_number, user_msg, bot_msg in batch:
+            _append_exchange(conn, phone_number, user_msg, bot_msg)
+        conn.commit()
 
-    # Get existing history
-    history = get_user_conversation(phone_number)
 
-    # Add new messages
-    history.append({"role": "user", "content": user_msg})
-    history.append({"role": "assistant", "content": bot_msg})
+def _get_conversation_writer():
+    global _conversation_writer
+    if _conversation_writer is None:
+        with _writer_lock:
+            if _conversation_writer is None:
+                writer = WriteBehindQueue(
+                    _commit_exchanges,
+                    max_batch=CONVERSATION_BATCH_SIZE,
+                    max_delay_ms=CONVERSATION_BATCH_MS,
+                    name='conversation-writer'
+                )
+                atexit.register(writer.close)
+                _conversation_writer = writer
+    return _conversation_writer
+
+
+def flush_conversations(timeout=None):
+    """Wait until all queued conversation writes are committed"""
+    if _conversation_writer is not None:
+        return _conversation_writer.flush(timeout)
+    return True
+
+
+def get_conversation_writer_stats():
+    """Write-behind counters (empty when nothing was queued yet)"""
+    writer = _conversation_writer
+    return dict(writer.stats) if writer else {}
+
+
+def _read_history(phone_number, limit):
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT role, content FROM (
+                SELECT seq, role, content FROM messages
+                WHERE phone_number = ?
+                ORDER BY seq DESC
+                LIMIT ?
+            ) ORDER BY seq
+        ''', (phone_number, limit)).fetchall()
+
+    return [{"role": row['role'], "content": row['content']} for row in rows]
+
+def get_user_conversation(phone_number, limit=HISTORY_WINDOW):
+    """Get the last `limit` messages of a WhatsApp user's conversation"""
+    writer = _conversation_writer
+    if writer is None or not writer.has_pending(phone_number):
+        return _read_history(phone_number, limit)
+
+    # Queued messages are newer than anything on disk; hold the commit lock
+    # so a batch cannot move from pending to disk between the two reads
+    with writer.commit_lock:
+        history = _read_history(phone_number, limit) + writer.pending(phone_number)
+    return history[-limit:]
+
+def _append_exchange(conn, phone_number, user_msg, bot_msg):
+    """Append one user/assistant exchange; caller owns the transaction"""
+    conn.executemany('''
+        INSERT INTO messages (phone_number, seq, role, content)
+        SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM messages WHERE phone_number = ?
+    ''', [
+        (phone_number, 'user', user_msg, phone_number),
+        (phone_number, 'assistant', bot_msg, phone_number)
+    ])
+    conn.execute('''
+        INSERT INTO conversations (phone_number, history, updated_at)
+        VALUES (?, '[]', CURRENT_TIMESTAMP)
+        ON CONFLICT(phone_number) DO UPDATE SET updated_at = excluded.updated_at
+    ''', (phone_number,))
+
+def save_search_page(key, criteria, cursor, shown):
+    """
+    Remember where a search reply stopped, for a "show me more" turn.
+
+    Args:
+        key: Identifies the reply (see chatbot.search_page_key)
+        criteria: The search's criteria dict (and 'categories', if several)
+        cursor: Cursor after the last car fetched, or None
+        shown: Ids of the cars already offered
+    """
+    with connection() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO search_pages (key, criteria, cursor, shown) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(criteria, default=str), cursor, json.dumps(shown))
+        )
+        conn.commit()
 
-    # Keep only last 20 messages to avoid token limits
-    history = history[-20:]
+def get_search_page(key):
+    """{'criteria', 'cursor', 'shown'} saved for a reply, or None"""
+    with connection() as conn:
+        row = conn.execute('SELECT criteria, cursor, shown FROM search_pages WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return None
+    return {'criteria': json.loads(row['criteria']), 'cursor': row['cursor'], 'shown': json.loads(row['shown'])}
+
+def get_conversation_summary(phone_number):
+    """(summary, fingerprint of the last summarized messages), or (None, None)"""
+    with connection() as conn:
+        row = conn.execute(
+            'SELECT summary, summary_fingerprint FROM conversations WHERE phone_number = ?',
+            (phone_number,)
+        ).fetchone()
+    return (row['summary'], row['summary_fingerprint']) if row else (None, None)
+
+def save_conversation_summary(phone_number, summary, fingerprint):
+    """Store the rolling summary on the conversation's row"""
+    with connection() as conn:
+        conn.execute(
+            'UPDATE conversations SET summary = ?, summary_fingerprint = ? WHERE phone_number = ?',
+            (summary, fingerprint, phone_number)
+        )
+        conn.commit()
 
-    # Save to database
-    cursor.execute('''
-        INSERT OR REPLACE INTO conversations (phone_number, history, updated_at)
-        VALUES (?, ?, CURRENT_TIMESTAMP)
-    ''', (phone_number, json.dumps(history)))
+def save_user_conversation(phone_number, user_msg, bot_msg):
+    """Save conversation history for a WhatsApp user"""
+    if CONVERSATION_WRITE_MODE == 'batched':
+        _get_conversation_writer().put(
+            phone_number,
+            (phone_number, user_msg, bot_msg),
+            [{"role": "user", "content": user_msg}, {"role": "assistant", "content": bot_msg}]
+        )
+        return
 
-    conn.commit()
-    conn.close()
+    with span('sqlite_commit'), connection() as conn:
+        # Take the write lock up front so concurrent webhooks for the same
+        # number serialize instead of computing the same next seq
+        conn.execute('BEGIN IMMEDIATE')
+        _append_exchange(conn, phone_number, user_msg, bot_msg)
+        conn.commit()
 
 if __name__ == '__main__':
     # Initialize database when run directly
@@ -0,0 +1,182 @@
+"""
+Token budget for the conversation history sent with every LLM call.
+
+The newest messages are kept verbatim for as long as the whole prompt
+(system prompt, summary, history and the new message) fits within
+PROMPT_TOKEN_BUDGET. Older messages are folded into a rolling summary
+that is sent as one short system message instead. WhatsApp conversations
+store the summary on their conversations row; web chats, which carry their
+own history, keep it in memory.
+
+Summaries are refreshed in the background after the turn, so a long
+conversation never waits for a summarization call; until the refresh
+lands, the previous summary is used.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import database
+
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 3000))
+# Upper bound for a summary (max_tokens of the summarization call)
+SUMMARY_MAX_TOKENS = 200
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+# Web chats whose summaries are kept in memory
+MAX_WEB_SUMMARIES = 1000
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English)"""
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message):
+    return estimate_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+
+def fingerprint(messages):
+    """Identifies the end of a run of messages (its last two entries)"""
+    tail = [[msg['role'], msg['content']] for msg in messages[-2:]]
+    return hashlib.sha1(json.dumps(tail).encode('utf-8')).hexdigest()
+
+
+def prefix_hashes(messages):
+    """hashes[i] identifies messages[:i] by content (hashes[0] is the empty prefix)"""
+    hashes = ['']
+    for msg in messages:
+        hashes.append(hashlib.sha1(
+            (hashes[-1] + json.dumps([msg['role'], msg['content']])).encode('utf-8')
+        ).hexdigest())
+    return hashes
+
+
+def fit_history(system_prompt, history, user_message, summary=None, budget=None):
+    """
+    Split history into (kept, overflow): the longest suffix that fits the
+    budget next to the other prompt parts, and everything older.
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    remaining = (budget - estimate_tokens(system_prompt) - MESSAGE_OVERHEAD_TOKENS
+                 - estimate_tokens(user_message) - MESSAGE_OVERHEAD_TOKENS)
+    if summary:
+        remaining -= estimate_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+
+    start = len(history)
+    while start > 0 and message_tokens(history[start - 1]) <= remaining:
+        start -= 1
+        remaining -= message_tokens(history[start])
+    return history[start:], history[:start]
+
+
+def covered_length(history, summary_fingerprint):
+    """How many leading messages of `history` the stored summary covers"""
+    for end in range(len(history), 0, -1):
+        if fingerprint(history[:end]) == summary_fingerprint:
+            return end
+    return 0
+
+
+class HistoryBudget:
+    """Fits history to the prompt budget and maintains rolling summaries"""
+
+    def __init__(self, summarize):
+        """
+        Args:
+            summarize: Callable (previous_summary or None, messages) -> new
+                summary text; called on a background thread
+        """
+        self.summarize = summarize
+        self.stats = {'requests': 0, 'trimmed': 0, 'tokens_before': 0, 'tokens_after': 0,
+                      'summaries': 0, 'summary_errors': 0}
+        self._web_summaries = OrderedDict()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def _load(self, history, phone_number):
+        """(summary, number of leading history messages it covers)"""
+        if phone_number:
+            # WhatsApp history is a sliding window, so the row remembers
+            # where the summary ends rather than how the chat began
+            summary, summary_fingerprint = database.get_conversation_summary(phone_number)
+            return summary, covered_length(history, summary_fingerprint) if summary else 0
+
+        # Web chats send their whole history: summaries are stored under the
+        # content hash of the prefix they cover
+        hashes = prefix_hashes(history)
+        with self._lock:
+            for end in range(len(history), 0, -1):
+                if hashes[end] in self._web_summaries:
+                    self._web_summaries.move_to_end(hashes[end])
+                    return self._web_summaries[hashes[end]], end
+        return None, 0
+
+    def _store(self, phone_number, summarized, summary):
+        if phone_number:
+            database.save_conversation_summary(phone_number, summary, fingerprint(summarized))
+            return
+        key = prefix_hashes(summarized)[-1]
+        with self._lock:
+            self._web_summaries[key] = summary
+            while len(self._web_summaries) > MAX_WEB_SUMMARIES:
+                self._web_summaries.popitem(last=False)
+
+    def prepare(self, system_prompt, history, user_message, phone_number=None):
+        """
+        Returns:
+            (summary or None, kept history messages) for this turn
+        """
+        if not history:
+            return None, []
+
+        summary, covered = self._load(history, phone_number)
+        kept, overflow = fit_history(system_prompt, history, user_message, summary)
+        if not overflow:
+            summary = None
+        elif len(overflow) > covered:
+            self._refresh(phone_number or prefix_hashes(overflow)[-1], phone_number,
+                          summary, overflow, overflow[covered:])
+
+        before = (estimate_tokens(system_prompt) + estimate_tokens(user_message)
+                  + sum(message_tokens(msg) for msg in history) + 2 * MESSAGE_OVERHEAD_TOKENS)
+        after = (estimate_tokens(system_prompt) + estimate_tokens(user_message)
+                 + sum(message_tokens(msg) for msg in kept) + 2 * MESSAGE_OVERHEAD_TOKENS
+                 + (estimate_tokens(summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0))
+        self.stats['requests'] += 1
+        self.stats['tokens_before'] += before
+        self.stats['tokens_after'] += after
+        if overflow:
+            self.stats['trimmed'] += 1
+            print(f"Prompt tokens: ~{before} -> ~{after} "
+                  f"(kept {len(kept)} of {len(history)} messages{', with summary' if summary else ''})")
+        return summary, kept
+
+    def _refresh(self, key, phone_number, summary, summarized, new_messages):
+        """Fold `new_messages` into `summary` in the background; `summarized` is all it covers then"""
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self._in_flight.add(key)
+
+        def run():
+            try:
+                self._store(phone_number, summarized, self.summarize(summary, new_messages))
+                self.stats['summaries'] += 1
+            except Exception as e:
+                self.stats['summary_errors'] += 1
+                print(f"Error summarizing conversation history: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight.discard(key)
+
+        threading.Thread(target=run, name='history-summary', daemon=True).start()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        requests = stats['requests'] or 1
+        stats['avg_tokens_before'] = stats['tokens_before'] / requests
+        stats['avg_tokens_after'] = stats['tokens_after'] / requests
+        return stats
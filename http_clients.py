@@ -0,0 +1,190 @@
+"""
+Process-wide HTTP clients with keep-alive connection pools.
+
+The OpenAI SDK (chat and Whisper) and Twilio media downloads all share one
+httpx connection pool, so repeat calls reuse open TLS connections (HTTP/2
+where the server and the `h2` package allow) instead of handshaking again.
+
+The pools are fork-safe: a gunicorn worker that inherits clients created
+before fork() opens its own connections on first use and never touches the
+parent's sockets. Async clients keep one pool per event loop, since
+connections cannot move between loops.
+
+Environment:
+    HTTP_MAX_CONNECTIONS     connections per pool (default 50)
+    HTTP_MAX_KEEPALIVE       idle connections kept open (default 20)
+    HTTP_KEEPALIVE_SECONDS   idle time before a connection is closed (default 60)
+    HTTP2                    'false' to force HTTP/1.1
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+import weakref
+from collections import defaultdict
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 50))
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', 20))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv('HTTP_KEEPALIVE_SECONDS', 60))
+# HTTP/2 needs the optional h2 package (httpx[http2])
+HTTP2 = os.getenv('HTTP2', 'true').lower() == 'true' and importlib.util.find_spec('h2') is not None
+# Default for calls that don't set their own (the OpenAI SDK always does)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_stats = defaultdict(lambda: {'requests': 0, 'new_connections': 0, 'tls_handshakes': 0, 'http2_requests': 0})
+_stats_lock = threading.Lock()
+
+
+def _limits():
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                        keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+
+
+def _count(host, event_name):
+    """Count connection events reported by httpcore's request tracing"""
+    key = {
+        'connection.connect_tcp.complete': 'new_connections',
+        'connection.start_tls.complete': 'tls_handshakes',
+        'http2.send_request_headers.started': 'http2_requests',
+    }.get(event_name)
+    if key:
+        with _stats_lock:
+            _stats[host][key] += 1
+
+
+def _start_request(request):
+    with _stats_lock:
+        _stats[request.url.host]['requests'] += 1
+
+
+class ForkSafeTransport(httpx.BaseTransport):
+    """Sync transport that opens a fresh connection pool in each process"""
+    instances = weakref.WeakSet()
+
+    def __init__(self):
+        self._transport = None
+        self._pid = None
+        self._lock = threading.Lock()
+        ForkSafeTransport.instances.add(self)
+
+    def _current(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Connections inherited across fork() belong to the parent; drop them unclosed
+                    self._transport = httpx.HTTPTransport(http2=HTTP2, limits=_limits())
+                    self._pid = os.getpid()
+        return self._transport
+
+    def handle_request(self, request):
+        host = request.url.host
+        outer_trace = request.extensions.get('trace')
+
+        def trace(event_name, info):
+            _count(host, event_name)
+            if outer_trace:
+                outer_trace(event_name, info)
+
+        _start_request(request)
+        request.extensions['trace'] = trace
+        return self._current().handle_request(request)
+
+    def close(self):
+        with self._lock:
+            if self._transport is not None and self._pid == os.getpid():
+                self._transport.close()
+            self._transport = None
+            self._pid = None
+
+
+class LoopLocalAsyncTransport(httpx.AsyncBaseTransport):
+    """Async transport with one connection pool per process and event loop"""
+
+    def __init__(self):
+        self._transports = weakref.WeakKeyDictionary()
+        self._pid = os.getpid()
+
+    def _current(self):
+        if self._pid != os.getpid():
+            self._transports = weakref.WeakKeyDictionary()
+            self._pid = os.getpid()
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            transport = self._transports[loop] = httpx.AsyncHTTPTransport(http2=HTTP2, limits=_limits())
+        return transport
+
+    async def handle_async_request(self, request):
+        host = request.url.host
+        outer_trace = request.extensions.get('trace')
+
+        async def trace(event_name, info):
+            _count(host, event_name)
+            if outer_trace:
+                await outer_trace(event_name, info)
+
+        _start_request(request)
+        request.extensions['trace'] = trace
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self):
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+_http_client = None
+_async_http_client = None
+_clients_lock = threading.Lock()
+
+
+def get_http_client():
+    """The process-wide sync httpx client (pass as OpenAI(http_client=...))"""
+    global _http_client
+    if _http_client is None:
+        with _clients_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(transport=ForkSafeTransport(), timeout=HTTP_TIMEOUT)
+    return _http_client
+
+
+def get_async_http_client():
+    """The process-wide async httpx client (pass as AsyncOpenAI(http_client=...))"""
+    global _async_http_client
+    if _async_http_client is None:
+        with _clients_lock:
+            if _async_http_client is None:
+                _async_http_client = httpx.AsyncClient(transport=LoopLocalAsyncTransport(), timeout=HTTP_TIMEOUT)
+    return _async_http_client
+
+
+def _after_fork_in_child():
+    """Transports reconnect on first use; locks held by other threads at fork() are replaced"""
+    global _clients_lock, _stats_lock
+    _clients_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _stats.clear()
+    for transport in ForkSafeTransport.instances:
+        transport._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_stats():
+    """Requests and connection reuse per host since this process started"""
+    with _stats_lock:
+        hosts = {host: dict(counts) for host, counts in _stats.items()}
+    for counts in hosts.values():
+        requests = counts['requests']
+        counts['reuse_rate'] = 1 - counts['new_connections'] / requests if requests else 0.0
+    return {
+        'http2': HTTP2,
+        'max_connections': HTTP_MAX_CONNECTIONS,
+        'max_keepalive': HTTP_MAX_KEEPALIVE,
+        'hosts': hosts,
+    }
@@ -0,0 +1,298 @@
+"""
+Stream a fleet feed into the cars table and sync it incrementally.
+
+The feed is CSV (with a header row) or JSON Lines, one vehicle per row,
+keyed by the cars table `id`. Rows are validated against the live table
+schema, diffed against what is stored, and applied in batched
+transactions: new ids are inserted, changed rows updated, and cars that
+are missing from the feed are deactivated (available = 0).
+
+Optional columns the feed leaves out (e.g. no image_url column) keep
+their stored values, except that a feed without an `available` column
+marks every car it lists as available. Malformed JSON lines count as
+invalid rows. Deactivation is skipped when any row was invalid or
+none was valid, so a broken feed (say, a misspelt header) cannot take the
+whole fleet offline; --force-deactivate overrides the first check.
+
+Usage:
+    python import_fleet.py fleet.csv
+    python import_fleet.py fleet.jsonl --batch-size 10000 --dry-run
+"""
+import argparse
+import csv
+import json
+import sqlite3
+import time
+
+from database import get_connection
+from models import CarCategory, FuelType
+
+CATEGORIES = {c.value for c in CarCategory}
+FUEL_TYPES = {f.value for f in FuelType}
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+
+
+def read_feed(path):
+    """Yield (line_number, raw_row) without loading the whole file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        row = e  # validate_row rejects it like any other bad row
+                    yield line_number, row
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def load_schema(conn):
+    """Writable cars columns as {name: (declared_type, required)}"""
+    schema = {}
+    for col in conn.execute('PRAGMA table_info(cars)'):
+        if col['name'] in ('id', 'created_at'):
+            continue
+        required = bool(col['notnull']) and col['dflt_value'] is None
+        schema[col['name']] = (col['type'].upper(), required)
+    return schema
+
+
+def _coerce(value, declared_type):
+    if declared_type == 'INTEGER':
+        if isinstance(value, str):
+            value = value.strip()
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"expected an integer, got {value!r}")
+        return int(number)
+    if declared_type == 'REAL':
+        return float(value)
+    if declared_type == 'BOOLEAN':
+        if isinstance(value, bool):
+            return int(value)
+        text = str(value).strip().lower()
+        if text in TRUE_VALUES:
+            return 1
+        if text in FALSE_VALUES:
+            return 0
+        raise ValueError(f"expected a boolean, got {value!r}")
+    return str(value).strip()
+
+
+def _features(value):
+    """Features as a JSON list string: JSONL lists, CSV JSON or 'a; b; c'"""
+    if isinstance(value, list):
+        names = value
+    elif isinstance(value, str) and value.strip().startswith('['):
+        names = json.loads(value)
+    else:
+        names = str(value).split(';')
+    names = [str(name).strip() for name in names if str(name).strip()]
+    return json.dumps(names)
+
+
+def _default(name):
+    """Value for an optional column the feed leaves empty"""
+    return 1 if name == 'available' else None
+
+
+def validate_row(raw, schema):
+    """
+    Return (car_id, {column: value}) or raise ValueError. Optional columns
+    absent from the row are left out, so updates keep their stored values;
+    a car without an `available` column is available, being in the feed.
+    """
+    if isinstance(raw, ValueError):
+        raise ValueError(f"malformed JSON: {raw}")
+    if not isinstance(raw, dict):
+        raise ValueError(f"expected an object, got {type(raw).__name__}")
+    raw_id = raw.get('id')
+    if raw_id in (None, ''):
+        raise ValueError("missing id")
+    car_id = _coerce(raw_id, 'INTEGER')
+
+    car = {}
+    for name, (declared_type, required) in schema.items():
+        if name not in raw:
+            if required:
+                raise ValueError(f"missing {name}")
+            if name == 'available':
+                # Reactivates cars a previous feed left out
+                car[name] = 1
+            continue
+        value = raw[name]
+        if value is None or value == '':
+            if required:
+                raise ValueError(f"missing {name}")
+            # Empty cells fall back to the column default
+            car[name] = _default(name)
+            continue
+        if name == 'features':
+            car[name] = _features(value)
+        else:
+            try:
+                car[name] = _coerce(value, declared_type)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid {name}: {value!r}")
+
+    if car['category'] not in CATEGORIES:
+        raise ValueError(f"unknown category {car['category']!r}")
+    if car['fuel_type'] not in FUEL_TYPES:
+        raise ValueError(f"unknown fuel_type {car['fuel_type']!r}")
+    if car['daily_price'] <= 0:
+        raise ValueError("daily_price must be positive")
+    return car_id, car
+
+
+def _normalize_stored(row):
+    values = dict(row)
+    values['features'] = json.dumps(json.loads(values['features']))
+    return values
+
+
+class FleetImporter:
+    """Applies validated feed rows to the cars table in batches"""
+
+    def __init__(self, conn, batch_size=5000, dry_run=False, deactivate_missing=True, force_deactivate=False):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.deactivate_missing = deactivate_missing
+        self.force_deactivate = force_deactivate
+        self.schema = load_schema(conn)
+        self.columns = list(self.schema)
+        self.stats = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0,
+                      'invalid': 0, 'deactivated': 0}
+
+        self._insert_sql = (
+            f"INSERT INTO cars (id, {', '.join(self.columns)}) "
+            f"VALUES (?, {', '.join('?' * len(self.columns))})"
+        )
+        # Ids seen in the feed live in SQLite, so deactivation is one set-based
+        # UPDATE instead of a Python-side diff of the whole table
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS import_seen (id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM import_seen')
+        conn.commit()
+
+    def run(self, rows):
+        batch = []
+        for line_number, raw in rows:
+            self.stats['read'] += 1
+            try:
+                batch.append(validate_row(raw, self.schema))
+            except (ValueError, TypeError) as e:
+                self.stats['invalid'] += 1
+                if self.stats['invalid'] <= 20:
+                    print(f"Skipping line {line_number}: {e}")
+                continue
+            if len(batch) >= self.batch_size:
+                self._apply(batch)
+                batch = []
+        if batch:
+            self._apply(batch)
+        if self.deactivate_missing:
+            valid = self.stats['inserted'] + self.stats['updated'] + self.stats['unchanged']
+            if not valid:
+                print("Not deactivating missing cars: the feed had no valid rows")
+            elif self.stats['invalid'] and not self.force_deactivate:
+                print(f"Not deactivating missing cars: {self.stats['invalid']:,} invalid rows "
+                      "(use --force-deactivate to deactivate anyway)")
+            else:
+                self._deactivate_missing()
+        return self.stats
+
+    def _apply(self, batch):
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            fresh = []
+            for car_id, car in batch:
+                try:
+                    conn.execute('INSERT INTO import_seen (id) VALUES (?)', (car_id,))
+                except sqlite3.IntegrityError:
+                    self.stats['invalid'] += 1
+                    print(f"Skipping duplicate id {car_id} in feed")
+                    continue
+                fresh.append((car_id, car))
+
+            ids = json.dumps([car_id for car_id, _ in fresh])
+            stored = {
+                row['id']: _normalize_stored(row)
+                for row in conn.execute(
+                    f"SELECT id, {', '.join(self.columns)} FROM cars "
+                    f"WHERE id IN (SELECT value FROM json_each(?))", (ids,)
+                )
+            }
+
+            inserts = []
+            updates = {}  # columns in the feed -> rows of (values..., id)
+            for car_id, car in fresh:
+                if car_id not in stored:
+                    inserts.append((car_id,) + tuple(car.get(c, _default(c)) for c in self.columns))
+                    continue
+                columns = tuple(c for c in self.columns if c in car)
+                values = tuple(car[c] for c in columns)
+                if tuple(stored[car_id][c] for c in columns) != values:
+                    updates.setdefault(columns, []).append(values + (car_id,))
+                else:
+                    self.stats['unchanged'] += 1
+
+            if not self.dry_run:
+                conn.executemany(self._insert_sql, inserts)
+                for columns, rows in updates.items():
+                    conn.executemany(
+                        f"UPDATE cars SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?", rows
+                    )
+            self.stats['inserted'] += len(inserts)
+            self.stats['updated'] += sum(len(rows) for rows in updates.values())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _deactivate_missing(self):
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        missing = 'available = 1 AND id NOT IN (SELECT id FROM import_seen)'
+        if self.dry_run:
+            count = conn.execute(f'SELECT COUNT(*) FROM cars WHERE {missing}').fetchone()[0]
+        else:
+            count = conn.execute(f'UPDATE cars SET available = 0 WHERE {missing}').rowcount
+        conn.commit()
+        self.stats['deactivated'] = count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a fleet feed (CSV/JSONL) into the cars table")
+    parser.add_argument('feed', help="Path to a .csv or .jsonl fleet feed")
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help="Rows per transaction (default: 5000)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Validate and diff without changing the database")
+    parser.add_argument('--keep-missing', action='store_true',
+                        help="Don't deactivate cars that are absent from the feed")
+    parser.add_argument('--force-deactivate', action='store_true',
+                        help="Deactivate absent cars even if some feed rows were invalid")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    importer = FleetImporter(conn, batch_size=args.batch_size, dry_run=args.dry_run,
+                             deactivate_missing=not args.keep_missing, force_deactivate=args.force_deactivate)
+
+    start = time.perf_counter()
+    stats = importer.run(read_feed(args.feed))
+    elapsed = time.perf_counter() - start
+    conn.close()
+
+    print(f"\n{'Dry run' if args.dry_run else 'Import'} finished in {elapsed:.1f}s "
+          f"({stats['read'] / elapsed if elapsed else 0:,.0f} rows/sec)")
+    for key, value in stats.items():
+        print(f"  {key:>11}: {value:,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+In-memory columnar search index over an inventory snapshot.
+
+Cars are laid out in price order, so a `max_price` cut is a prefix of the
+layout. Category, fuel type and passenger filters are precomputed bitsets
+(Python ints, one bit per car) that are intersected with `&`. Features get
+one bitset per (case-folded) feature name.
+
+Sorted pages are walked lazily with keyset cursors: by price along the
+layout, by passengers or year through per-value bitsets (cheapest first
+within a value). A cursor holds the sort key of the last car returned, so
+the next page starts right after it, even if the inventory changed in
+between.
+"""
+import base64
+import json
+from bisect import bisect_left, bisect_right
+
+SORT_COLUMNS = {'price': 'daily_price', 'passengers': 'passengers', 'year': 'year'}
+
+
+def _value(value):
+    """Plain value for enum members passed in criteria"""
+    return getattr(value, 'value', value)
+
+
+def sort_order(criteria):
+    """(sort key, descending) of a criteria dict; cheapest first by default"""
+    return _value(criteria.get('sort_by')) or 'price', bool(criteria.get('sort_descending'))
+
+
+def sort_key(car, sort_by):
+    """
+    A car's position in a sort order: its sort value, then price and id.
+    Descending price reverses the whole order; descending passengers or
+    year keep the cheapest car first among equal values.
+    """
+    if sort_by == 'price':
+        return (car['daily_price'], car['id'])
+    return (car[SORT_COLUMNS[sort_by]], car['daily_price'], car['id'])
+
+
+def walk_key(criteria):
+    """Key function that increases along the criteria's sort order (for merging walks)"""
+    sort_by, descending = sort_order(criteria)
+    if not descending:
+        return lambda car: sort_key(car, sort_by)
+    if sort_by == 'price':
+        return lambda car: (-car['daily_price'], -car['id'])
+    column = SORT_COLUMNS[sort_by]
+    return lambda car: (-car[column], car['daily_price'], car['id'])
+
+
+def cursor_after(criteria, car):
+    """Opaque cursor for the cars after `car` in the criteria's sort order"""
+    sort_by, descending = sort_order(criteria)
+    data = json.dumps([sort_by, descending, *sort_key(car, sort_by)])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, criteria):
+    """
+    Sort key stored in a cursor.
+
+    Raises:
+        ValueError: Malformed cursor, or one made for another sort order
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_by, descending, *key = json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid search cursor: {cursor!r}") from e
+    if (sort_by, descending) != sort_order(criteria):
+        raise ValueError(f"Search cursor is for sorting by {sort_by}, not {sort_order(criteria)[0]}")
+    return tuple(key)
+
+
+class InventoryIndex:
+    """Answers CarSearchCriteria dicts without touching SQLite"""
+
+    def __init__(self, cars):
+        """
+        Args:
+            cars: Sequence of car dicts in their canonical (id) order
+        """
+        self._cars = cars
+        # Position in the price-ordered layout -> position in `cars`
+        self._order = sorted(range(len(cars)), key=lambda i: (cars[i]['daily_price'], i))
+        self._prices = [cars[i]['daily_price'] for i in self._order]
+        self._keys = [(cars[i]['daily_price'], cars[i]['id']) for i in self._order]
+        self._all = (1 << len(cars)) - 1
+
+        self._by_category = {}
+        self._by_fuel_type = {}
+        self._by_feature = {}
+        self._by_year = {}
+        by_passengers = {}
+        for position, i in enumerate(self._order):
+            car = cars[i]
+            bit = 1 << position
+            self._by_year[car['year']] = self._by_year.get(car['year'], 0) | bit
+            self._by_category[car['category']] = self._by_category.get(car['category'], 0) | bit
+            self._by_fuel_type[car['fuel_type']] = self._by_fuel_type.get(car['fuel_type'], 0) | bit
+            by_passengers[car['passengers']] = by_passengers.get(car['passengers'], 0) | bit
+            for name in car['features']:
+                key = name.lower()
+                self._by_feature[key] = self._by_feature.get(key, 0) | bit
+
+        # Passenger buckets folded into suffix masks: entry k covers every
+        # car seating at least _passenger_counts[k]
+        self._passenger_counts = sorted(by_passengers)
+        self._passenger_masks = [0] * len(self._passenger_counts)
+        mask = 0
+        for k in range(len(self._passenger_counts) - 1, -1, -1):
+            mask |= by_passengers[self._passenger_counts[k]]
+            self._passenger_masks[k] = mask
+        self._by_passengers = by_passengers
+
+    def __len__(self):
+        return len(self._cars)
+
+    def mask(self, criteria):
+        """Bitset of layout positions matching the criteria"""
+        mask = self._all
+
+        if criteria.get('max_price'):
+            mask &= (1 << bisect_right(self._prices, criteria['max_price'])) - 1
+
+        if criteria.get('min_passengers'):
+            k = bisect_left(self._passenger_counts, criteria['min_passengers'])
+            mask &= self._passenger_masks[k] if k < len(self._passenger_masks) else 0
+
+        if criteria.get('category'):
+            mask &= self._by_category.get(_value(criteria['category']), 0)
+
+        if criteria.get('fuel_type'):
+            mask &= self._by_fuel_type.get(_value(criteria['fuel_type']), 0)
+
+        for name in criteria.get('required_features') or ():
+            mask &= self._by_feature.get(name.lower(), 0)
+
+        return mask
+
+    def search(self, criteria):
+        """Matching cars, in the same order as the input sequence"""
+        mask = self.mask(criteria)
+        if mask == self._all:
+            return list(self._cars)
+        if not mask:
+            return []
+
+        # bin() walks the bitset in C; the reversed string is indexed by position
+        bits = bin(mask)[:1:-1]
+        order = self._order
+        hits = []
+        position = bits.find('1')
+        while position != -1:
+            hits.append(order[position])
+            position = bits.find('1', position + 1)
+        hits.sort()
+
+        cars = self._cars
+        return [cars[i] for i in hits]
+
+    def ordered(self, criteria, cursor=None):
+        """
+        Matching cars in the criteria's sort order (see sort_order), lazily,
+        starting after `cursor`. Each car costs a few bitset operations, so
+        a page does not scan the rest of the result.
+        """
+        mask = self.mask(criteria)
+        sort_by, descending = sort_order(criteria)
+        after = decode_cursor(cursor, criteria) if cursor else None
+
+        if sort_by == 'price':
+            if after:
+                mask = self._cut(mask, after, descending)
+            yield from self._walk(mask, descending)
+            return
+
+        # One bucket per passenger count / model year, cheapest first inside
+        buckets = self._by_passengers if sort_by == 'passengers' else self._by_year
+        for value in sorted(buckets, reverse=descending):
+            if after and (value < after[0] if not descending else value > after[0]):
+                continue
+            bucket = mask & buckets[value]
+            if after and value == after[0]:
+                bucket = self._cut(bucket, after[1:], False)
+            yield from self._walk(bucket, False)
+
+    def _cut(self, mask, key, descending):
+        """Positions of `mask` after the (price, id) `key` in walk order"""
+        if descending:
+            return mask & ((1 << bisect_left(self._keys, tuple(key))) - 1)
+        start = bisect_right(self._keys, tuple(key))
+        return mask >> start << start
+
+    def _walk(self, mask, descending):
+        cars, order = self._cars, self._order
+        if descending:
+            while mask:
+                position = mask.bit_length() - 1
+                mask ^= 1 << position
+                yield cars[order[position]]
+        else:
+            while mask:
+                lowest = mask & -mask
+                mask ^= lowest
+                yield cars[order[lowest.bit_length() - 1]]
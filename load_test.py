@@ -0,0 +1,294 @@
+"""
+HTTP load test for the chat endpoints.
+
+Virtual users replay multi-turn conversations against the app:
+- web chats on /api/chat, which carry their history in the request
+- WhatsApp chats on /whatsapp, as Twilio form posts of text messages
+  and voice notes
+
+The report gives throughput, p50/p95/p99 latency and error rates per
+endpoint. Replies that are apologies count as degraded rather than
+successful.
+
+    # Everything local: a stand-in LLM plus gunicorn on a throwaway database
+    python load_test.py --spawn --users 20 --duration 60 --jitter 0.5
+
+    # An app already running with OPENAI_BASE_URL pointing at stand_in_server.py
+    python load_test.py --url http://127.0.0.1:5000 --stand-in http://127.0.0.1:8089
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+
+from stand_in_server import StandInLLM, twilio_media_url
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+VOICE = object()  # a turn sent as a voice note
+
+# name: (channel, turns, weight)
+SCENARIOS = {
+    'web_browse': ('web', [
+        "Hello",
+        "I need a car for 5 people next weekend",
+        "Show me SUVs under 400 AED",
+        "What about something cheaper?",
+        "I'll take the first one",
+    ], 5),
+    'web_inventory': ('web', [
+        "What cars do you have?",
+        "Any luxury cars?",
+        "Thanks, I'll think about it",
+    ], 2),
+    'whatsapp_text': ('whatsapp', [
+        "Hi",
+        "Do you have economy cars under 150 AED?",
+        "Show me electric cars",
+        "Book the cheapest one please",
+    ], 3),
+    'whatsapp_voice': ('whatsapp', [
+        VOICE,
+        "Show me minivans for 7 people",
+        "Great, what do I need to book it?",
+    ], 2),
+}
+
+DEGRADED_REPLIES = (
+    "having trouble processing your request",
+    "I'm having trouble right now",
+    "couldn't understand your voice message",
+    "running a little slow right now",
+)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Results:
+    """Latencies and outcomes per endpoint, shared by all virtual users"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.degraded = defaultdict(int)
+        self.conversations = 0
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds, outcome):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if outcome == 'error':
+                self.errors[endpoint] += 1
+            elif outcome == 'degraded':
+                self.degraded[endpoint] += 1
+
+    def report(self, elapsed):
+        print(f"\n{'endpoint':>16} {'requests':>9} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+              f"{'errors':>7} {'degraded':>9}")
+        rows = sorted(self.latencies.items())
+        everything = [seconds for _, samples in rows for seconds in samples]
+        rows.append(('all', everything))
+        for endpoint, samples in rows:
+            if not samples:
+                continue
+            errors = sum(self.errors.values()) if endpoint == 'all' else self.errors[endpoint]
+            degraded = sum(self.degraded.values()) if endpoint == 'all' else self.degraded[endpoint]
+            print(f"{endpoint:>16} {len(samples):>9,} {len(samples) / elapsed:>7.1f} "
+                  f"{percentile(samples, 50) * 1e3:>7.0f} {percentile(samples, 95) * 1e3:>7.0f} "
+                  f"{percentile(samples, 99) * 1e3:>7.0f} {errors / len(samples):>7.1%} "
+                  f"{degraded / len(samples):>9.1%}")
+        print(f"\nConversations completed: {self.conversations:,} in {elapsed:.0f}s")
+
+
+class VirtualUser(threading.Thread):
+    """Replays random scenarios over one keep-alive connection until the deadline"""
+
+    def __init__(self, number, args, results, deadline):
+        super().__init__(name=f'user-{number}', daemon=True)
+        self.number = number
+        self.args = args
+        self.results = results
+        self.deadline = deadline
+        self.random = random.Random(args.seed + number)
+        url = urllib.parse.urlsplit(args.url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.conn = None
+        self.runs = 0
+
+    def run(self):
+        names = list(SCENARIOS)
+        weights = [SCENARIOS[name][2] for name in names]
+        while time.monotonic() < self.deadline:
+            channel, turns, _ = SCENARIOS[self.random.choices(names, weights)[0]]
+            self.runs += 1
+            phone = f"whatsapp:+1555{self.number:03d}{self.runs:04d}"
+            history = []
+            for turn in turns:
+                if time.monotonic() >= self.deadline:
+                    return
+                if channel == 'web':
+                    self.web_turn(turn, history)
+                else:
+                    self.whatsapp_turn(turn, phone)
+                # Customers read the reply before typing the next message
+                time.sleep(self.random.expovariate(1 / self.args.think) if self.args.think else 0)
+            with self.results.lock:
+                self.results.conversations += 1
+
+    def post(self, path, body, content_type):
+        """(status, body text) of one POST, reconnecting after connection errors"""
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.args.timeout)
+            try:
+                self.conn.request('POST', path, body=body, headers={'Content-Type': content_type})
+                response = self.conn.getresponse()
+                return response.status, response.read().decode('utf-8', 'replace')
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def timed(self, endpoint, send):
+        """Run send() -> reply text or None; record latency and outcome"""
+        start = time.perf_counter()
+        try:
+            reply = send()
+            outcome = 'error' if reply is None else (
+                'degraded' if any(text in reply for text in DEGRADED_REPLIES) else 'ok')
+        except Exception as e:
+            print(f"{endpoint} request failed: {e}")
+            reply, outcome = None, 'error'
+        self.results.record(endpoint, time.perf_counter() - start, outcome)
+        return reply
+
+    def web_turn(self, message, history):
+        def send():
+            status, body = self.post('/api/chat', json.dumps({'message': message, 'history': history}),
+                                     'application/json')
+            return json.loads(body).get('response') if status == 200 else None
+
+        reply = self.timed('web /api/chat', send)
+        history += [{'role': 'user', 'content': message}, {'role': 'assistant', 'content': reply or ''}]
+
+    def whatsapp_turn(self, message, phone):
+        form = {'From': phone, 'To': 'whatsapp:+14155238886', 'Body': '', 'NumMedia': '0'}
+        if message is VOICE:
+            form.update(NumMedia='1', MediaContentType0='audio/ogg',
+                        MediaUrl0=twilio_media_url(self.args.stand_in, f"{self.number}x{self.runs}"))
+        else:
+            form['Body'] = message
+
+        def send():
+            status, body = self.post('/whatsapp', urllib.parse.urlencode(form), 'application/x-www-form-urlencoded')
+            if status != 200:
+                return None
+            # TwiML: <Response><Message>text</Message></Response>, with <Body> when media is attached
+            return " ".join(ET.fromstring(body).itertext())
+
+        self.timed('whatsapp voice' if message is VOICE else 'whatsapp text', send)
+
+
+def wait_until_up(url, timeout):
+    split = urllib.parse.urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(split.hostname, split.port or 80, timeout=2)
+            conn.request('GET', '/api/cars')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"App did not come up at {url} within {timeout:.0f}s")
+
+
+def spawn_app(args, stand_in):
+    """Start gunicorn against the stand-in, in a temp dir so it gets its own database"""
+    work_dir = tempfile.mkdtemp(prefix='car_rental_load_')
+    env = dict(os.environ,
+               OPENAI_BASE_URL=stand_in.base_url, OPENAI_API_KEY='stand-in',
+               TWILIO_ACCOUNT_SID='ACstandin', TWILIO_AUTH_TOKEN='stand-in',
+               RETENTION_ENABLED='false', PYTHONPATH=REPO_DIR)
+    log_path = os.path.join(work_dir, 'app.log')
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--threads', str(args.threads),
+               '--bind', f'127.0.0.1:{args.port}', '--timeout', '120', 'app:app']
+    print(f"Starting {' '.join(command[2:])} in {work_dir} (log: {log_path})")
+    log = open(log_path, 'w')
+    process = subprocess.Popen(command, cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_until_up(args.url, timeout=60)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/chat and /whatsapp with multi-turn conversations")
+    parser.add_argument('--url', default=None, help="App to test (default: the spawned app)")
+    parser.add_argument('--spawn', action='store_true', help="Start a stand-in LLM and a gunicorn app")
+    parser.add_argument('--stand-in', default='http://127.0.0.1:8089',
+                        help="Root URL of the stand-in server that serves voice notes (without --spawn)")
+    parser.add_argument('--users', type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to run")
+    parser.add_argument('--think', type=float, default=1.0, help="Mean seconds between a user's turns")
+    parser.add_argument('--timeout', type=float, default=60, help="Seconds before a request counts as failed")
+    parser.add_argument('--seed', type=int, default=1)
+    spawn = parser.add_argument_group('with --spawn')
+    spawn.add_argument('--port', type=int, default=5055)
+    spawn.add_argument('--workers', type=int, default=2)
+    spawn.add_argument('--threads', type=int, default=8)
+    spawn.add_argument('--ttft', type=float, default=0.35, help="Stand-in median time to first token")
+    spawn.add_argument('--jitter', type=float, default=0.3, help="Stand-in lognormal latency sigma")
+    spawn.add_argument('--error-rate', type=float, default=0.0, help="Stand-in error rate")
+    args = parser.parse_args()
+
+    stand_in = process = None
+    if args.spawn:
+        stand_in = StandInLLM(ttft=args.ttft, jitter=args.jitter, error_rate=args.error_rate,
+                              action=None, seed=args.seed).start()
+        args.stand_in = stand_in.root_url
+        args.url = args.url or f'http://127.0.0.1:{args.port}'
+        process = spawn_app(args, stand_in)
+    elif not args.url:
+        parser.error("--url is required without --spawn")
+
+    try:
+        print(f"Load testing {args.url}: {args.users} users for {args.duration:.0f}s "
+              f"(think time {args.think:.1f}s)")
+        results = Results()
+        deadline = time.monotonic() + args.duration
+        users = [VirtualUser(i, args, results, deadline) for i in range(args.users)]
+        start = time.perf_counter()
+        for user in users:
+            user.start()
+        for user in users:
+            user.join(args.duration + args.timeout)
+        results.report(time.perf_counter() - start)
+        if stand_in:
+            print(f"Stand-in: {stand_in.stats}")
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+        if stand_in:
+            stand_in.stop()
+
+
+if __name__ == '__main__':
+    main()
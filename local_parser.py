@@ -0,0 +1,291 @@
+"""
+Rule-based fast path for common chat turns, tried before the LLM.
+
+Greetings, "what cars do you have?" and explicit filter requests such as
+"show me SUVs under 300 AED for 7 people" are turned into a ChatbotAction
+locally. A message is only handled here when every word is accounted for
+by a recognised filter or a known filler word; anything else (dates,
+negations, follow-ups like "cheaper ones?") goes to the LLM as before.
+So does every message after the customer has said more than hello: the
+parser only sees the one message, and would drop dates or a passenger
+count given earlier.
+
+Usage:
+    python local_parser.py --report              # user messages in the database
+    python local_parser.py --report corpus.txt   # one message per line
+"""
+import argparse
+import re
+import time
+from collections import Counter
+
+import database
+from migrations import USD_TO_AED
+from models import CarCategory, CarSearchCriteria, ChatbotAction, FuelType
+
+SUV_CATEGORIES = (CarCategory.COMPACT_SUV, CarCategory.MID_SIZE_SUV, CarCategory.FULL_SIZE_SUV)
+
+# Phrase -> category, longest phrases first so "compact suv" wins over "suv"
+CATEGORY_PHRASES = [
+    (r'compact suvs?|small suvs?', CarCategory.COMPACT_SUV),
+    (r'mid ?size suvs?|medium suvs?', CarCategory.MID_SIZE_SUV),
+    (r'full ?size suvs?|large suvs?|big suvs?', CarCategory.FULL_SIZE_SUV),
+    (r'suvs?', None),  # any of SUV_CATEGORIES
+    (r'economy(?: cars?)?', CarCategory.ECONOMY),
+    (r'luxury(?: cars?)?|premium cars?', CarCategory.LUXURY),
+    (r'minivans?|mini vans?|vans?|mpvs?', CarCategory.MINIVAN),
+    (r'pickup trucks?|pick up trucks?|pickups?|trucks?', CarCategory.PICKUP_TRUCK),
+    (r'sports? cars?|sports', CarCategory.SPORTS),
+]
+FUEL_PHRASES = [
+    (r'electric(?: cars?)?|evs?', FuelType.ELECTRIC),
+    (r'hybrids?', FuelType.HYBRID),
+    (r'petrol|gasoline', FuelType.GASOLINE),
+]
+
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+}
+_COUNT = r'(\d{1,2}|' + '|'.join(NUMBER_WORDS) + r')'
+_PEOPLE = r'(?:people|persons|passengers|adults|pax|of us)'
+PASSENGER_PATTERNS = [
+    rf'\b(?:for|seats?|seating|fits?|family of|group of) {_COUNT}(?: {_PEOPLE})?\b',
+    rf'\b{_COUNT} (?:{_PEOPLE}|seats?|seater)\b',
+    rf'\b{_COUNT} ?seaters?\b',
+]
+
+_AMOUNT = r'(\d+(?:\.\d+)?)'
+_CURRENCY = r'(aed|dirhams?|dhs|usd|dollars?)'
+_PER_DAY = r'(?: (?:per|a|/) ?day| daily)?'
+PRICE_PATTERNS = [
+    rf'\b(?:under|below|less than|max|maximum|up to|within|no more than|at most|budget(?: of| is)?) '
+    rf'(?:{_CURRENCY} ?|(\$))?{_AMOUNT}(?: ?{_CURRENCY})?{_PER_DAY}',
+    rf'(?:(\$)|\b){_AMOUNT} ?{_CURRENCY}?{_PER_DAY} (?:or less|or under|max|and under|tops)\b',
+    rf'\b{_AMOUNT} ?{_CURRENCY}{_PER_DAY}',
+]
+
+GREETING = re.compile(
+    r'^(?:(hi|hello|hey|hiya|salam|salaam|marhaba|assalamu alaikum)(?: there)?'
+    r'|good (morning|afternoon|evening))$'
+)
+
+# Words that carry no criteria; a message is only parsed locally when
+# nothing else is left once the filters above are removed
+FILLER = set('''
+    i we me us my our a an the some any all your please pls kindly can could would you do does
+    is are there have has got need want like looking look for with and also to rent rental hire
+    renting options option available show find get give list see browse what which cars car
+    vehicle vehicles ones just only something anything that ok okay hi hello hey thanks
+'''.split())
+LISTING_WORDS = {'show', 'list', 'what', 'which', 'available', 'all', 'see', 'browse', 'options'}
+CAR_NOUNS = {'car', 'cars', 'vehicle', 'vehicles'}
+
+
+class LocalParse:
+    """A locally produced action, plus the categories to merge for "SUV" requests"""
+    __slots__ = ('action', 'categories')
+
+    def __init__(self, action, categories=()):
+        self.action = action
+        self.categories = categories
+
+
+def _normalize(text):
+    text = text.casefold().replace('-', ' ').replace('’', "'")
+    text = re.sub(r"[,!?;:()]|\.(?!\d)", ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _count(value):
+    return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+
+def _take(pattern, text):
+    """All matches of `pattern`, and `text` with them blanked out"""
+    matches = list(re.finditer(pattern, text))
+    for match in reversed(matches):
+        text = text[:match.start()] + ' ' + text[match.end():]
+    return matches, text
+
+
+def _price(match):
+    groups = [g for g in match.groups() if g]
+    amount = float(next(g for g in groups if re.fullmatch(_AMOUNT, g)))
+    if any(g in ('$', 'usd', 'dollar', 'dollars') for g in groups):
+        amount = round(amount * USD_TO_AED)
+    return amount
+
+
+def _greeting_reply(match):
+    time_of_day = match.group(2)
+    opener = f"Good {time_of_day}!" if time_of_day else "Hello!"
+    return (f"{opener} I'd be happy to help you find a rental car. How many passengers will "
+            "be travelling, and when would you like to pick up the car?")
+
+
+_feature_patterns = (None, [])
+
+
+def _feature_patterns_for_inventory():
+    """(regex, canonical name) per feature of the current fleet, longest names first"""
+    global _feature_patterns
+    snapshot = database.get_inventory()
+    if _feature_patterns[0] != snapshot.version:
+        names = {name.casefold(): name for car in snapshot.cars for name in car['features']}
+        patterns = [
+            (r'\b' + re.escape(_normalize(key)) + r'\b', name)
+            for key, name in sorted(names.items(), key=lambda item: -len(item[0]))
+        ]
+        _feature_patterns = (snapshot.version, patterns)
+    return _feature_patterns[1]
+
+
+def has_context(conversation_history):
+    """Whether the customer said anything besides greetings earlier in the conversation"""
+    return any(msg['role'] == 'user' and not GREETING.match(_normalize(msg['content']))
+               for msg in conversation_history or ())
+
+
+def parse_message(user_message, conversation_history=None, strict=True):
+    """
+    Try to handle a message without the LLM.
+
+    With strict=False any filters found are used even if the rest of the
+    message is not understood, and earlier turns are ignored; that is the
+    degraded answer served when the LLM is unavailable.
+
+    Returns:
+        LocalParse, or None when the message should go to the LLM
+    """
+    if strict and has_context(conversation_history):
+        return None
+    text = _normalize(user_message)
+    if not text or len(text) > 200:
+        return None
+
+    greeting = GREETING.match(text)
+    if greeting:
+        return LocalParse(ChatbotAction(action_type='direct_response', response=_greeting_reply(greeting)))
+
+    criteria = {}
+    categories = ()
+
+    prices = []
+    for pattern in PRICE_PATTERNS:
+        matches, text = _take(pattern, text)
+        prices.extend(_price(match) for match in matches)
+    if len(set(prices)) > 1:
+        return None
+    if prices:
+        criteria['max_price'] = prices[0]
+
+    passengers = []
+    for pattern in PASSENGER_PATTERNS:
+        matches, text = _take(pattern, text)
+        passengers.extend(_count(match.group(1)) for match in matches)
+    if len(set(passengers)) > 1:
+        return None
+    if passengers:
+        criteria['min_passengers'] = passengers[0]
+
+    found = []
+    for pattern, category in CATEGORY_PHRASES:
+        matches, text = _take(rf'\b(?:{pattern})\b', text)
+        found.extend([category] * len(matches))
+    if len(set(found)) > 1:
+        return None
+    if found:
+        if found[0] is None:
+            categories = SUV_CATEGORIES
+        else:
+            criteria['category'] = found[0]
+
+    fuels = []
+    for pattern, fuel_type in FUEL_PHRASES:
+        matches, text = _take(rf'\b(?:{pattern})\b', text)
+        fuels.extend([fuel_type] * len(matches))
+    if len(set(fuels)) > 1:
+        return None
+    if fuels:
+        criteria['fuel_type'] = fuels[0]
+
+    features = []
+    for pattern, name in _feature_patterns_for_inventory():
+        matches, text = _take(pattern, text)
+        if matches:
+            features.append(name)
+    if features:
+        criteria['required_features'] = features
+
+    # Confidence check: every remaining word must be filler
+    words = text.split()
+    if strict and any(word not in FILLER for word in words):
+        return None
+
+    if criteria or categories:
+        # A bare "under 300" usually refines an earlier request; leave that to the LLM
+        names_a_car = found or fuels or CAR_NOUNS & set(words) or 'seater' in _normalize(user_message)
+        if strict and not names_a_car:
+            return None
+        return LocalParse(
+            ChatbotAction(action_type='search_cars', search_criteria=CarSearchCriteria(**criteria)),
+            categories
+        )
+
+    if CAR_NOUNS & set(words) and LISTING_WORDS & set(words):
+        return LocalParse(ChatbotAction(action_type='get_inventory'))
+    return None
+
+
+def report(messages, llm_ms):
+    """Print how much of a message corpus the fast path handles, and the time saved"""
+    kinds = Counter()
+    start = time.perf_counter()
+    for message in messages:
+        parsed = parse_message(message)
+        kinds[parsed.action.action_type if parsed else 'llm'] += 1
+    elapsed = time.perf_counter() - start
+
+    total = sum(kinds.values())
+    local = total - kinds['llm']
+    if not total:
+        print("No messages to analyse")
+        return kinds
+    print(f"Messages: {total:,}")
+    for kind in ('direct_response', 'get_inventory', 'search_cars', 'llm'):
+        print(f"  {kind:>15}: {kinds[kind]:>6,} ({kinds[kind] / total:.0%})")
+    print(f"Handled locally: {local / total:.1%} "
+          f"(parser: {elapsed / total * 1e6:.0f} us/message)")
+    print(f"Classification latency saved: {local * llm_ms / 1000:,.0f}s total, "
+          f"{local / total * llm_ms:.0f} ms per message on average (assuming {llm_ms:.0f} ms per LLM call)")
+    return kinds
+
+
+def _database_messages():
+    with database.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT content FROM messages WHERE role = 'user'")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report how much traffic the local parser handles")
+    parser.add_argument('--report', nargs='?', const='', metavar='CORPUS',
+                        help="Corpus file with one message per line (default: user messages in the database)")
+    parser.add_argument('--llm-ms', type=float, default=1500,
+                        help="Latency of one LLM classification call, for the savings estimate")
+    args = parser.parse_args()
+    if args.report is None:
+        parser.print_help()
+        return
+
+    database.init_db()
+    if args.report:
+        with open(args.report, encoding='utf-8') as f:
+            messages = [line.strip() for line in f if line.strip()]
+    else:
+        messages = _database_messages()
+    report(messages, args.llm_ms)
+
+
+if __name__ == '__main__':
+    main()
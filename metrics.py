@@ -0,0 +1,196 @@
+"""
+Latency histograms for every stage of a turn, exported in Prometheus text format.
+
+Code marks stages with spans:
+
+    with metrics.request_span('whatsapp'):
+        with metrics.span('transcription'):
+            ...
+
+Each span adds one observation to a fixed-bucket histogram (a bisect and
+two additions under a lock), so spans are cheap enough for every request. Requests
+slower than SLOW_REQUEST_MS print a one-line breakdown of their stages,
+so a slow WhatsApp reply shows where the time went.
+
+render() returns the histograms plus the counters the other modules keep
+(LLM calls, tokens and cost per stage, cache hit rates, connection reuse,
+history trimming, circuit breakers), for the /metrics endpoint.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 5000))
+# Seconds; spans range from sub-millisecond cache lookups to 30s LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """A Prometheus histogram with one label"""
+
+    def __init__(self, name, help_text, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {label_value: list(series) for label_value, series in self._series.items()}
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for label_value, series in sorted(self.snapshot().items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+
+
+REQUEST_SECONDS = Histogram('chatbot_request_seconds', "End-to-end request latency", 'endpoint')
+STAGE_SECONDS = Histogram('chatbot_stage_seconds', "Latency of each stage of a request", 'stage')
+
+_trace = threading.local()
+
+
+@contextmanager
+def span(stage):
+    """Time one stage; it is also listed in the slow-request breakdown"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        stages = getattr(_trace, 'stages', None)
+        if stages is not None:
+            stages.append((stage, elapsed))
+
+
+@contextmanager
+def request_span(endpoint):
+    """Time a whole request, and print its stages when it is slow"""
+    stages = _trace.stages = []
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _trace.stages = None
+        REQUEST_SECONDS.observe(elapsed, endpoint)
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            breakdown = " ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in stages)
+            print(f"Slow {endpoint} request: {elapsed * 1000:.0f} ms ({breakdown})")
+
+
+def _metric(lines, name, kind, help_text, samples):
+    """Append one counter/gauge family; samples are (labels dict, value)"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+
+def render(chatbot=None):
+    """All metrics in Prometheus text exposition format (version 0.0.4)"""
+    import database
+    import resilience
+    from response_cache import get_response_cache_stats
+
+    lines = []
+    REQUEST_SECONDS.render(lines)
+    STAGE_SECONDS.render(lines)
+
+    if chatbot is not None:
+        tiers = chatbot.model_tiers.get_stats()
+        calls, errors, tokens, cost = [], [], [], []
+        for stage, info in tiers.items():
+            for model, counters in info['models'].items():
+                labels = {'stage': stage, 'model': model}
+                calls.append((labels, counters['calls']))
+                errors.append((labels, counters['errors']))
+                tokens.append(({**labels, 'kind': 'prompt'}, counters['prompt_tokens']))
+                tokens.append(({**labels, 'kind': 'completion'}, counters['completion_tokens']))
+                cost.append((labels, counters['cost_usd']))
+        _metric(lines, 'chatbot_llm_calls_total', 'counter', "LLM calls per stage and model", calls)
+        _metric(lines, 'chatbot_llm_errors_total', 'counter', "Failed LLM calls per stage and model", errors)
+        _metric(lines, 'chatbot_llm_tokens_total', 'counter', "LLM tokens per stage, model and kind", tokens)
+        _metric(lines, 'chatbot_llm_cost_usd_total', 'counter', "Estimated LLM cost in USD", cost)
+        _metric(lines, 'chatbot_llm_downgraded', 'gauge', "1 while a stage runs on its fallback model",
+                [({'stage': stage}, int(info['active'] != info['model'])) for stage, info in tiers.items()])
+
+        budget = chatbot.history_budget.get_stats()
+        _metric(lines, 'chatbot_history_requests_total', 'counter', "Turns sent with conversation history",
+                [({}, budget['requests'])])
+        _metric(lines, 'chatbot_history_trimmed_total', 'counter', "Turns whose history exceeded the budget",
+                [({}, budget['trimmed'])])
+        _metric(lines, 'chatbot_history_tokens_total', 'counter', "Estimated prompt tokens before/after trimming",
+                [({'phase': 'before'}, budget['tokens_before']), ({'phase': 'after'}, budget['tokens_after'])])
+
+    cache = get_response_cache_stats()
+    if cache:
+        _metric(lines, 'chatbot_response_cache_hits_total', 'counter', "Response cache hits", [({}, cache['hits'])])
+        _metric(lines, 'chatbot_response_cache_misses_total', 'counter', "Response cache misses",
+                [({}, cache['misses'])])
+        _metric(lines, 'chatbot_response_cache_hit_ratio', 'gauge', "Response cache hit rate",
+                [({}, round(cache['hit_rate'], 4))])
+        _metric(lines, 'chatbot_response_cache_bytes', 'gauge', "Response cache size", [({}, cache['bytes'])])
+
+    inventory = database.get_inventory_stats()
+    _metric(lines, 'chatbot_inventory_cache_hits_total', 'counter', "Inventory snapshot cache hits",
+            [({}, inventory['hits'])])
+    _metric(lines, 'chatbot_inventory_cache_misses_total', 'counter', "Inventory snapshot rebuilds",
+            [({}, inventory['misses'])])
+
+    pool = database.get_pool_stats()
+    _metric(lines, 'chatbot_sqlite_connections_opened_total', 'counter', "SQLite connections opened",
+            [({}, pool['opened'])])
+    _metric(lines, 'chatbot_sqlite_connections_reused_total', 'counter', "SQLite connections reused from the pool",
+            [({}, pool['reused'])])
+
+    writer = database.get_conversation_writer_stats()
+    if writer:
+        _metric(lines, 'chatbot_conversation_writes_total', 'counter', "Write-behind conversation exchanges",
+                [({'state': 'enqueued'}, writer['enqueued']), ({'state': 'committed'}, writer['committed'])])
+        _metric(lines, 'chatbot_conversation_write_errors_total', 'counter', "Failed write-behind batches",
+                [({}, writer['errors'])])
+
+    breakers = resilience.get_breaker_stats()
+    _metric(lines, 'chatbot_circuit_open', 'gauge', "1 while an upstream's circuit breaker refuses calls",
+            [({'upstream': name}, int(info['state'] == 'open')) for name, info in breakers.items()])
+    _metric(lines, 'chatbot_circuit_trips_total', 'counter', "Times an upstream's circuit breaker opened",
+            [({'upstream': name}, info['trips']) for name, info in breakers.items()])
+    _metric(lines, 'chatbot_circuit_rejected_total', 'counter', "Calls refused by an open circuit breaker",
+            [({'upstream': name}, info['rejected']) for name, info in breakers.items()])
+
+    # Only processes that make outgoing calls have loaded the shared HTTP pool
+    http_clients = sys.modules.get('http_clients')
+    if http_clients:
+        hosts = http_clients.get_stats()['hosts']
+        _metric(lines, 'chatbot_http_requests_total', 'counter', "Outgoing HTTP requests per host",
+                [({'host': host}, counts['requests']) for host, counts in hosts.items()])
+        _metric(lines, 'chatbot_http_connections_opened_total', 'counter', "New outgoing connections per host",
+                [({'host': host}, counts['new_connections']) for host, counts in hosts.items()])
+
+    return "\n".join(lines) + "\n"
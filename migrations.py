@@ -0,0 +1,577 @@
+"""
+Versioned schema and data migrations.
+
+Each migration runs once, in order, and is recorded in the schema_version
+table. The highest applied version is mirrored in SQLite's `PRAGMA
+user_version` header field, so the check on every boot is a single header
+read instead of a table scan. Pending migrations are applied in one
+IMMEDIATE transaction: concurrent workers starting together wait for each
+other, and a failure leaves the database at its previous version.
+
+Usage:
+    python migrations.py              # apply pending migrations
+    python migrations.py --dry-run    # apply, report and roll back
+    python migrations.py --status     # list applied and pending migrations
+"""
+import argparse
+import json
+import os
+
+import database
+
+USD_TO_AED = 3.67
+# Currency of prices in a database created before these migrations; the old
+# convert_to_aed.py script was the documented upgrade, so AED by default
+LEGACY_PRICE_CURRENCY = os.getenv('LEGACY_PRICE_CURRENCY', 'AED').upper()
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register `func(conn)` as migration `version`; versions must increase"""
+    def register(func):
+        assert not MIGRATIONS or version > MIGRATIONS[-1][0], "migrations must be added in order"
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+
+SEED_CARS = [
+    # Economy Cars
+    {
+        'make': 'Toyota', 'model': 'Corolla', 'year': 2024, 'category': 'Economy',
+        'daily_price': 35.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Backup Camera']),
+        'image_url': 'https://images.unsplash.com/photo-1621007947382-bb3c3994e3fb?w=800',
+        'available': 1
+    },
+    {
+        'make': 'Honda', 'model': 'Civic', 'year': 2024, 'category': 'Economy',
+        'daily_price': 38.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Lane Assist']),
+        'available': 1
+    },
+    {
+        'make': 'Hyundai', 'model': 'Elantra', 'year': 2023, 'category': 'Economy',
+        'daily_price': 33.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth']),
+        'available': 1
+    },
+
+    # Compact SUVs
+    {
+        'make': 'Mazda', 'model': 'CX-5', 'year': 2024, 'category': 'Compact SUV',
+        'daily_price': 55.00, 'passengers': 5, 'luggage': 3, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Apple CarPlay', 'All-Wheel Drive']),
+        'available': 1
+    },
+    {
+        'make': 'Honda', 'model': 'CR-V', 'year': 2024, 'category': 'Compact SUV',
+        'daily_price': 58.00, 'passengers': 5, 'luggage': 4, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Sunroof', 'Backup Camera']),
+        'available': 1
+    },
+    {
+        'make': 'Toyota', 'model': 'RAV4', 'year': 2023, 'category': 'Compact SUV',
+        'daily_price': 57.00, 'passengers': 5, 'luggage': 3, 'transmission': 'Automatic',
+        'fuel_type': 'Hybrid', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'All-Wheel Drive', 'Lane Assist']),
+        'available': 1
+    },
+
+    # Mid-Size SUVs
+    {
+        'make': 'Chevrolet', 'model': 'Tahoe', 'year': 2024, 'category': 'Full-Size SUV',
+        'daily_price': 85.00, 'passengers': 8, 'luggage': 5, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Third Row Seating', 'Leather Interior', '4WD']),
+        'available': 1
+    },
+    {
+        'make': 'Ford', 'model': 'Explorer', 'year': 2024, 'category': 'Mid-Size SUV',
+        'daily_price': 75.00, 'passengers': 7, 'luggage': 4, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Third Row Seating', 'Apple CarPlay']),
+        'available': 1
+    },
+
+    # Luxury Cars
+    {
+        'make': 'BMW', 'model': '3 Series', 'year': 2024, 'category': 'Luxury',
+        'daily_price': 95.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Premium Sound System', 'Leather Interior', 'Sunroof', 'Navigation', 'Heated Seats']),
+        'available': 1
+    },
+    {
+        'make': 'Mercedes-Benz', 'model': 'C-Class', 'year': 2024, 'category': 'Luxury',
+        'daily_price': 98.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Premium Sound System', 'Leather Interior', 'Sunroof', 'Navigation', 'Massage Seats']),
+        'available': 1
+    },
+    {
+        'make': 'Audi', 'model': 'A4', 'year': 2023, 'category': 'Luxury',
+        'daily_price': 92.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Premium Sound System', 'Leather Interior', 'Virtual Cockpit', 'All-Wheel Drive']),
+        'available': 1
+    },
+
+    # Vans/Large Groups
+    {
+        'make': 'Chrysler', 'model': 'Pacifica', 'year': 2024, 'category': 'Minivan',
+        'daily_price': 70.00, 'passengers': 8, 'luggage': 4, 'transmission': 'Automatic',
+        'fuel_type': 'Hybrid', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Stow-n-Go Seating', 'Rear Entertainment']),
+        'available': 1
+    },
+    {
+        'make': 'Honda', 'model': 'Odyssey', 'year': 2024, 'category': 'Minivan',
+        'daily_price': 68.00, 'passengers': 8, 'luggage': 4, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Power Sliding Doors', 'Backup Camera']),
+        'available': 1
+    },
+
+    # Electric/Hybrid
+    {
+        'make': 'Tesla', 'model': 'Model 3', 'year': 2024, 'category': 'Electric',
+        'daily_price': 88.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Electric', 'features': json.dumps(['Autopilot', 'Premium Sound System', 'Glass Roof', 'Supercharging Included']),
+        'available': 1
+    },
+    {
+        'make': 'Nissan', 'model': 'Leaf', 'year': 2024, 'category': 'Electric',
+        'daily_price': 52.00, 'passengers': 5, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Electric', 'features': json.dumps(['Air Conditioning', 'Bluetooth', 'Quick Charging', 'ProPILOT Assist']),
+        'available': 1
+    },
+
+    # Trucks
+    {
+        'make': 'Ford', 'model': 'F-150', 'year': 2024, 'category': 'Pickup Truck',
+        'daily_price': 78.00, 'passengers': 6, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['4WD', 'Towing Package', 'Bed Liner', 'Bluetooth', 'Backup Camera']),
+        'available': 1
+    },
+    {
+        'make': 'Chevrolet', 'model': 'Silverado', 'year': 2024, 'category': 'Pickup Truck',
+        'daily_price': 76.00, 'passengers': 6, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['4WD', 'Towing Package', 'Apple CarPlay', 'Bluetooth']),
+        'available': 1
+    },
+
+    # Sports/Performance
+    {
+        'make': 'Ford', 'model': 'Mustang', 'year': 2024, 'category': 'Sports',
+        'daily_price': 110.00, 'passengers': 4, 'luggage': 2, 'transmission': 'Manual',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Performance Package', 'Premium Sound System', 'Sport Seats', 'Track Apps']),
+        'available': 1
+    },
+    {
+        'make': 'Chevrolet', 'model': 'Camaro', 'year': 2024, 'category': 'Sports',
+        'daily_price': 108.00, 'passengers': 4, 'luggage': 2, 'transmission': 'Automatic',
+        'fuel_type': 'Gasoline', 'features': json.dumps(['Performance Exhaust', 'Sport Suspension', 'Premium Interior', 'Brembo Brakes']),
+        'available': 1
+    }
+]
+CATEGORY_IMAGES = {
+    'Economy': 'https://images.unsplash.com/photo-1621007947382-bb3c3994e3fb?w=800',
+    'Compact SUV': 'https://images.unsplash.com/photo-1519641471654-76ce0107ad1b?w=800',
+    'Mid-Size SUV': 'https://images.unsplash.com/photo-1533473359331-0135ef1b58bf?w=800',
+    'Full-Size SUV': 'https://images.unsplash.com/photo-1533473359331-0135ef1b58bf?w=800',
+    'Luxury': 'https://images.unsplash.com/photo-1617814076367-b759c7d7e738?w=800',
+    'Minivan': 'https://images.unsplash.com/photo-1464219789935-c2d9d9aba644?w=800',
+    'Electric': 'https://images.unsplash.com/photo-1560958089-b8a1929cea89?w=800',
+    'Pickup Truck': 'https://images.unsplash.com/photo-1533661837699-e5e4a02b6e4e?w=800',
+    'Sports': 'https://images.unsplash.com/photo-1614162692292-7ac56d7f7f1e?w=800',
+}
+DEFAULT_IMAGE = CATEGORY_IMAGES['Economy']
+
+
+def _set_flag(conn, name, value):
+    conn.execute('INSERT OR REPLACE INTO schema_flags (name, value) VALUES (?, ?)', (name, value))
+
+
+def _get_flag(conn, name):
+    row = conn.execute('SELECT value FROM schema_flags WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else None
+
+
+@migration(1, 'base_schema')
+def create_base_schema(conn):
+    """Cars, conversations, the message log and the row-version counters"""
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cars'").fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            make TEXT NOT NULL,
+            model TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            daily_price REAL NOT NULL,
+            passengers INTEGER NOT NULL,
+            luggage INTEGER NOT NULL,
+            transmission TEXT NOT NULL,
+            fuel_type TEXT NOT NULL,
+            features TEXT NOT NULL,
+            image_url TEXT,
+            available BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Tables created before photos were added lack the column
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(cars)')}
+    if 'image_url' not in columns:
+        conn.execute('ALTER TABLE cars ADD COLUMN image_url TEXT')
+
+    # Facts later migrations decide by, instead of guessing from the data
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_flags (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    if legacy:
+        _set_flag(conn, 'price_currency', LEGACY_PRICE_CURRENCY)
+
+    # Create conversations table for WhatsApp chat history. One row per
+    # phone number tracking last activity; `history` is only read by the
+    # legacy conversion below, messages live in the messages table.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            phone_number TEXT PRIMARY KEY,
+            history TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Append-only message log, clustered by (phone_number, seq)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            phone_number TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (phone_number, seq)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at)'
+    )
+    _move_legacy_history(conn)
+
+    # Row-version counters bumped by triggers, so every process can tell
+    # when its cached copy of a table is stale
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('inventory', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS cars_version_{event.lower()} AFTER {event} ON cars
+            BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = 'inventory';
+            END
+        ''')
+
+
+def _move_legacy_history(conn):
+    """Move JSON `history` blobs from conversations into the messages table"""
+    rows = conn.execute(
+        "SELECT phone_number, history, updated_at FROM conversations WHERE history != '[]'"
+    ).fetchall()
+    for row in rows:
+        history = json.loads(row['history'])
+        conn.executemany('''
+            INSERT OR IGNORE INTO messages (phone_number, seq, role, content, ts)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (row['phone_number'], seq, msg['role'], msg['content'], row['updated_at'])
+            for seq, msg in enumerate(history, 1)
+        ])
+    conn.execute("UPDATE conversations SET history = '[]' WHERE history != '[]'")
+    if rows:
+        print(f"Migrated history for {len(rows)} conversations to the messages table")
+
+
+@migration(2, 'feature_dictionary')
+def create_feature_tables(conn):
+    """
+    Structured feature storage: a feature dictionary plus one row per
+    (car, feature), kept in sync with the legacy cars.features JSON column
+    by triggers so every writer (seed data, imports, scripts) is covered.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS features (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS car_features (
+            car_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            feature_id INTEGER NOT NULL REFERENCES features (id),
+            PRIMARY KEY (car_id, position)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_car_features_feature ON car_features (feature_id, car_id)'
+    )
+    link_features = '''
+        INSERT OR IGNORE INTO features (name) SELECT value FROM json_each(NEW.features);
+        INSERT INTO car_features (car_id, position, feature_id)
+            SELECT NEW.id, je.key, f.id
+            FROM json_each(NEW.features) AS je JOIN features AS f ON f.name = je.value;
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS cars_features_insert AFTER INSERT ON cars
+        BEGIN {link_features} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS cars_features_update AFTER UPDATE OF features ON cars
+        BEGIN
+            DELETE FROM car_features WHERE car_id = OLD.id;
+            {link_features}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS cars_features_delete AFTER DELETE ON cars
+        BEGIN
+            DELETE FROM car_features WHERE car_id = OLD.id;
+        END
+    ''')
+    if not conn.execute('SELECT 1 FROM car_features LIMIT 1').fetchone():
+        # Backfill cars that were inserted before the triggers existed
+        conn.execute('''
+            INSERT OR IGNORE INTO features (name)
+            SELECT je.value FROM cars, json_each(cars.features) AS je
+        ''')
+        conn.execute('''
+            INSERT INTO car_features (car_id, position, feature_id)
+            SELECT cars.id, je.key, f.id
+            FROM cars, json_each(cars.features) AS je JOIN features AS f ON f.name = je.value
+        ''')
+
+
+@migration(3, 'reservations')
+def create_reservations(conn):
+    """
+    Date-range bookings; availability for [pickup_at, return_at) is
+    answered from an in-memory index rebuilt when this table changes.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            car_id INTEGER NOT NULL REFERENCES cars (id),
+            pickup_at TIMESTAMP NOT NULL,
+            return_at TIMESTAMP NOT NULL,
+            customer TEXT,
+            status TEXT NOT NULL DEFAULT 'confirmed',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CHECK (return_at > pickup_at)
+        )
+    ''')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_reservations_car ON reservations (car_id, pickup_at)'
+    )
+    conn.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('reservations', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS reservations_version_{event.lower()} AFTER {event} ON reservations
+            BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = 'reservations';
+            END
+        ''')
+
+
+@migration(4, 'seed_inventory')
+def seed_inventory(conn):
+    """Insert the demo fleet into an empty cars table (USD prices, converted by 006)"""
+    if conn.execute('SELECT 1 FROM cars LIMIT 1').fetchone():
+        return
+    _set_flag(conn, 'price_currency', 'USD')
+    conn.executemany('''
+        INSERT INTO cars (make, model, year, category, daily_price, passengers,
+                        luggage, transmission, fuel_type, features, image_url, available)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(
+        car['make'], car['model'], car['year'], car['category'], car['daily_price'],
+        car['passengers'], car['luggage'], car['transmission'], car['fuel_type'],
+        car['features'], car.get('image_url'), car['available']
+    ) for car in SEED_CARS])
+    print(f"Database initialized with {len(SEED_CARS)} cars")
+
+
+@migration(5, 'category_images')
+def add_category_images(conn):
+    """Give every car without a photo its category's stock image, in one UPDATE"""
+    cases = ' '.join('WHEN ? THEN ?' for _ in CATEGORY_IMAGES)
+    params = [value for pair in CATEGORY_IMAGES.items() for value in pair]
+    updated = conn.execute(
+        f'UPDATE cars SET image_url = CASE category {cases} ELSE ? END WHERE image_url IS NULL',
+        params + [DEFAULT_IMAGE]
+    ).rowcount
+    print(f"Added image URLs to {updated} cars")
+
+
+@migration(6, 'prices_to_aed')
+def convert_prices_to_aed(conn):
+    """
+    Convert daily prices from USD to AED in one UPDATE.
+
+    Only prices recorded as USD are converted: the demo seed (004), or a
+    pre-framework database with LEGACY_PRICE_CURRENCY=USD. Databases that
+    predate this framework were usually converted by the old
+    convert_to_aed.py script, so they are left alone by default.
+    """
+    currency = _get_flag(conn, 'price_currency')
+    if currency != 'USD':
+        print(f"Prices recorded as {currency or 'AED'}, nothing to convert")
+        return
+    updated = conn.execute(
+        'UPDATE cars SET daily_price = ROUND(daily_price * ?, 2)', (USD_TO_AED,)
+    ).rowcount
+    _set_flag(conn, 'price_currency', 'AED')
+    print(f"Converted {updated} car prices to AED (1 USD = {USD_TO_AED} AED)")
+
+
+@migration(7, 'conversation_summaries')
+def add_conversation_summaries(conn):
+    """Rolling summary of turns that no longer fit the prompt budget (see history_budget.py)"""
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(conversations)')}
+    if 'summary' not in columns:
+        conn.execute('ALTER TABLE conversations ADD COLUMN summary TEXT')
+    if 'summary_fingerprint' not in columns:
+        conn.execute('ALTER TABLE conversations ADD COLUMN summary_fingerprint TEXT')
+
+
+# (name, sort columns) for sorted search pages; each index leads with the
+# `available` filter and ends with the other filtered columns, so SQLite
+# filters, orders and stops after one page without touching the table
+SEARCH_INDEXES = [
+    ('idx_cars_price', 'daily_price, id'),
+    ('idx_cars_passengers', 'passengers, daily_price, id'),
+    ('idx_cars_passengers_desc', 'passengers DESC, daily_price, id'),
+    ('idx_cars_year', 'year, daily_price, id'),
+    ('idx_cars_year_desc', 'year DESC, daily_price, id'),
+]
+SEARCH_INDEX_FILTERS = ['daily_price', 'passengers', 'year', 'category', 'fuel_type']
+
+
+@migration(8, 'search_sort_indexes')
+def add_search_sort_indexes(conn):
+    """Covering indexes for keyset-paginated searches (see database.search_cars_sql)"""
+    for name, order in SEARCH_INDEXES:
+        sorted_by = {part.split()[0] for part in order.split(', ')}
+        filters = [column for column in SEARCH_INDEX_FILTERS if column not in sorted_by]
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON cars (available, {order}, {", ".join(filters)})')
+
+
+@migration(9, 'search_pages')
+def add_search_pages(conn):
+    """Where each search reply stopped, for "show me more" (see database.save_search_page)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_pages (
+            key TEXT PRIMARY KEY,
+            criteria TEXT NOT NULL,
+            cursor TEXT,
+            shown TEXT NOT NULL DEFAULT '[]',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_search_pages_created_at ON search_pages (created_at)')
+
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def applied_versions(conn):
+    """Versions recorded in schema_version"""
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute('SELECT version FROM schema_version')}
+
+
+def migrate(dry_run=False, target=None):
+    """
+    Apply pending migrations up to `target` (default: all).
+
+    With `dry_run` the migrations run inside the transaction and are then
+    rolled back, so their output shows what would change.
+
+    Returns:
+        List of (version, name) that were (or would be) applied
+    """
+    target = LATEST_VERSION if target is None else target
+    conn = database.get_connection()
+    try:
+        # Cheap boot path: one read of the database header
+        if not dry_run and conn.execute('PRAGMA user_version').fetchone()[0] >= target:
+            return []
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-checked under the write lock: another worker may have just migrated
+            applied = applied_versions(conn)
+            ran = []
+            for version, name, apply in MIGRATIONS:
+                if version > target or version in applied:
+                    continue
+                print(f"{'Would apply' if dry_run else 'Applying'} migration {version:03d}_{name}")
+                apply(conn)
+                conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+                ran.append((version, name))
+            conn.execute(f'PRAGMA user_version = {max(applied | {v for v, _ in ran}, default=0)}')
+        except Exception:
+            conn.rollback()
+            raise
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        return ran
+    finally:
+        conn.close()
+
+
+def print_status():
+    conn = database.get_connection()
+    try:
+        conn.execute('BEGIN')
+        applied = applied_versions(conn)
+        conn.rollback()
+        print(f"user_version: {conn.execute('PRAGMA user_version').fetchone()[0]}")
+    finally:
+        conn.close()
+    for version, name, _ in MIGRATIONS:
+        print(f"  [{'x' if version in applied else ' '}] {version:03d}_{name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply versioned schema and data migrations")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Run pending migrations and roll them back")
+    parser.add_argument('--status', action='store_true', help="List applied and pending migrations")
+    parser.add_argument('--target', type=int, help="Stop after this migration version")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status()
+        return
+    ran = migrate(dry_run=args.dry_run, target=args.target)
+    if not ran:
+        print(f"Database is up to date (version {LATEST_VERSION})")
+    elif args.dry_run:
+        print(f"Dry run: {len(ran)} migration(s) rolled back, nothing changed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Per-stage model selection with latency budgets.
+
+Each LLM stage of a turn has its own model:
+
+    router         ChatbotAction tool choice (a classification; small model)
+    responder      customer-facing text: listings in 'llm' mode, intros
+    summary        background history summaries
+    transcription  WhatsApp voice messages
+
+configured with <STAGE>_MODEL, <STAGE>_FALLBACK_MODEL and <STAGE>_BUDGET_MS
+(e.g. RESPONDER_MODEL=gpt-4, RESPONDER_BUDGET_MS=2500). A stage's latency is
+the time until its reply starts arriving (first token for streamed calls).
+When the moving average of the primary model exceeds the budget, the stage
+downgrades to its fallback model; every MODEL_PROBE_EVERY calls one is sent
+to the primary again so the stage upgrades once it recovers.
+
+Calls, errors, latency, tokens and estimated cost are counted per stage and
+model; see ModelTiers.get_stats().
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# stage: (model, fallback model or None, latency budget in ms or None)
+DEFAULT_STAGES = {
+    'router': ('gpt-4o-mini', None, 1500),
+    'responder': ('gpt-4', 'gpt-4o-mini', 2500),
+    'summary': ('gpt-4o-mini', None, None),
+    'transcription': ('whisper-1', None, 5000),
+}
+
+# USD per million (input, output) tokens, for the cost counters
+MODEL_PRICES = {
+    'gpt-4': (30.0, 60.0),
+    'gpt-4-turbo': (10.0, 30.0),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4o-mini': (0.15, 0.6),
+    'gpt-3.5-turbo': (0.5, 1.5),
+}
+
+MODEL_PROBE_EVERY = int(os.getenv('MODEL_PROBE_EVERY', 20))
+# Weight of the newest sample in the moving average
+LATENCY_SMOOTHING = 0.2
+LATENCY_SAMPLES = 200
+
+
+def load_stages():
+    """DEFAULT_STAGES with environment overrides applied"""
+    stages = {}
+    for stage, (model, fallback, budget_ms) in DEFAULT_STAGES.items():
+        prefix = stage.upper()
+        budget = os.getenv(f'{prefix}_BUDGET_MS')
+        stages[stage] = (
+            os.getenv(f'{prefix}_MODEL', model),
+            os.getenv(f'{prefix}_FALLBACK_MODEL', fallback) or None,
+            float(budget) if budget else budget_ms,
+        )
+    return stages
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """USD cost of one call, or 0.0 for models without a known price"""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+
+
+class StageCall:
+    """One tracked call: read `model`, set `usage` and call first_token() if streaming"""
+    __slots__ = ('stage', 'model', 'usage', 'started', 'first_token_at')
+
+    def __init__(self, stage, model):
+        self.stage = stage
+        self.model = model
+        self.usage = None
+        self.started = time.perf_counter()
+        self.first_token_at = None
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+
+class ModelTiers:
+    """Chooses the model for each stage and keeps per-stage latency and cost counters"""
+
+    def __init__(self, stages=None, probe_every=None):
+        self.stages = stages or load_stages()
+        self.probe_every = MODEL_PROBE_EVERY if probe_every is None else probe_every
+        self._lock = threading.Lock()
+        self._average_ms = {}
+        self._downgraded = {stage: False for stage in self.stages}
+        self._since_probe = {stage: 0 for stage in self.stages}
+        self._models = {}
+
+    def config_key(self):
+        """The configured models, for cache keys"""
+        return [f"{stage}={model}" for stage, (model, _, _) in sorted(self.stages.items())]
+
+    def model_for(self, stage):
+        """The model to use for the next call of `stage`"""
+        model, fallback, _ = self.stages[stage]
+        with self._lock:
+            if not (fallback and self._downgraded[stage]):
+                return model
+            self._since_probe[stage] += 1
+            if self._since_probe[stage] >= self.probe_every:
+                # Probe the primary so the stage can recover
+                self._since_probe[stage] = 0
+                return model
+            return fallback
+
+    @contextmanager
+    def track(self, stage):
+        """
+        Choose the model for one call and record how it went:
+
+            with tiers.track('router') as call:
+                response = client.chat.completions.create(model=call.model, ...)
+                call.usage = response.usage
+        """
+        call = StageCall(stage, self.model_for(stage))
+        error = False
+        try:
+            yield call
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(call, error)
+
+    def record(self, call, error=False):
+        end = time.perf_counter()
+        latency_ms = ((call.first_token_at or end) - call.started) * 1000
+        model, fallback, budget_ms = self.stages[call.stage]
+        usage = call.usage
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+
+        with self._lock:
+            counters = self._models.setdefault((call.stage, call.model), {
+                'calls': 0, 'errors': 0, 'over_budget': 0, 'total_ms': 0.0,
+                'latencies': deque(maxlen=LATENCY_SAMPLES),
+                'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0,
+            })
+            counters['calls'] += 1
+            counters['errors'] += error
+            counters['total_ms'] += latency_ms
+            counters['latencies'].append(latency_ms)
+            counters['prompt_tokens'] += prompt_tokens
+            counters['completion_tokens'] += completion_tokens
+            counters['cost_usd'] += estimate_cost(call.model, prompt_tokens, completion_tokens)
+            if budget_ms and latency_ms > budget_ms:
+                counters['over_budget'] += 1
+
+            if call.model != model or not budget_ms:
+                return
+            previous = self._average_ms.get(call.stage)
+            average = latency_ms if previous is None else (
+                LATENCY_SMOOTHING * latency_ms + (1 - LATENCY_SMOOTHING) * previous)
+            self._average_ms[call.stage] = average
+            at_risk = average > budget_ms
+            if fallback and at_risk != self._downgraded[call.stage]:
+                self._downgraded[call.stage] = at_risk
+                self._since_probe[call.stage] = 0
+                if at_risk:
+                    print(f"Model tiers: {call.stage} averaging {average:.0f} ms > {budget_ms:.0f} ms budget, "
+                          f"switching {model} -> {fallback}")
+                else:
+                    print(f"Model tiers: {call.stage} back within budget ({average:.0f} ms), using {model}")
+
+    def get_stats(self):
+        """Per stage: configuration, current model and counters per model"""
+        with self._lock:
+            stats = {}
+            for stage, (model, fallback, budget_ms) in self.stages.items():
+                stats[stage] = {
+                    'model': model, 'fallback': fallback, 'budget_ms': budget_ms,
+                    'active': fallback if fallback and self._downgraded[stage] else model,
+                    'average_ms': self._average_ms.get(stage),
+                    'models': {},
+                }
+            for (stage, model), counters in self._models.items():
+                latencies = sorted(counters['latencies'])
+                stats[stage]['models'][model] = {
+                    'calls': counters['calls'],
+                    'errors': counters['errors'],
+                    'over_budget': counters['over_budget'],
+                    'avg_ms': counters['total_ms'] / counters['calls'],
+                    'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                    'prompt_tokens': counters['prompt_tokens'],
+                    'completion_tokens': counters['completion_tokens'],
+                    'cost_usd': round(counters['cost_usd'], 6),
+                }
+            return stats
+
+
+def print_stats(stats):
+    print(f"{'stage':>14} {'model':>14} {'calls':>6} {'errors':>6} {'avg ms':>7} {'p95 ms':>7} "
+          f"{'over':>5} {'cost $':>9}")
+    for stage, info in stats.items():
+        for model, counters in info['models'].items():
+            print(f"{stage:>14} {model:>14} {counters['calls']:>6} {counters['errors']:>6} "
+                  f"{counters['avg_ms']:>7.0f} {counters['p95_ms']:>7.0f} {counters['over_budget']:>5} "
+                  f"{counters['cost_usd']:>9.4f}")
@@ -1,8 +1,9 @@
 """
 Pydantic models for structured chatbot outputs using Instructor
 """
-from pydantic import BaseModel, Field
-from typing import Optional, Literal, Union
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, Literal, Union, List
+from datetime import datetime
 from enum import Enum
 
 
@@ -26,14 +27,21 @@ class FuelType(str, Enum):
     ELECTRIC = "Electric"
 
 
+class SortKey(str, Enum):
+    """Orders for search results; ties go to the cheaper car"""
+    PRICE = "price"
+    PASSENGERS = "passengers"
+    YEAR = "year"
+
+
 class CarSearchCriteria(BaseModel):
     """
     Search criteria for filtering available rental cars.
-    Use this when a customer specifies preferences like budget, passenger count, or vehicle type.
+    Use this when a customer specifies preferences like budget, passenger count, vehicle type, or features.
     """
     max_price: Optional[float] = Field(
         None,
-        description="Maximum daily rental price in dollars (e.g., 50.00)",
+        description="Maximum daily rental price in AED (e.g., 200.00)",
         gt=0
     )
     min_passengers: Optional[int] = Field(
@@ -50,6 +58,38 @@ class CarSearchCriteria(BaseModel):
         None,
         description="Preferred fuel type (Gasoline, Hybrid, or Electric)"
     )
+    required_features: Optional[List[str]] = Field(
+        None,
+        description="Features the car must have (e.g., ['Apple CarPlay', 'All-Wheel Drive'])"
+    )
+    pickup_at: Optional[datetime] = Field(
+        None,
+        description="Pickup date and time, to only show cars free for the whole rental (e.g., 2024-06-12T10:00)"
+    )
+    return_at: Optional[datetime] = Field(
+        None,
+        description="Return date and time; used together with pickup_at"
+    )
+    sort_by: Optional[SortKey] = Field(
+        None,
+        description="Order results by price, passengers or year (e.g. 'cheapest', 'biggest', 'newest')"
+    )
+    sort_descending: Optional[bool] = Field(
+        None,
+        description="True for highest first (most expensive, most seats, newest)"
+    )
+    limit: Optional[int] = Field(
+        None,
+        description="How many cars the customer asked to see (e.g. 'the 5 cheapest')",
+        ge=1,
+        le=12
+    )
+
+    @model_validator(mode='after')
+    def check_rental_period(self):
+        if self.pickup_at and self.return_at and self.return_at <= self.pickup_at:
+            raise ValueError("return_at must be after pickup_at")
+        return self
 
     class Config:
         use_enum_values = True
@@ -81,7 +121,7 @@ class ChatbotAction(BaseModel):
     The action the chatbot should take based on user input.
     This is a discriminated union of all possible actions.
     """
-    action_type: Literal["search_cars", "get_inventory", "direct_response"] = Field(
+    action_type: Literal["search_cars", "get_inventory", "show_more", "direct_response"] = Field(
         description="Type of action to perform"
     )
     search_criteria: Optional[CarSearchCriteria] = Field(
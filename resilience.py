@@ -0,0 +1,188 @@
+"""
+Request deadlines and per-upstream circuit breakers.
+
+A Deadline is created when a request arrives (Twilio gives the WhatsApp
+webhook about 15 seconds) and passed down to every stage. Each stage asks
+it for a budget: the time left, capped by the stage's own timeout and
+minus what later stages need. A stage without enough time left is
+skipped, and the caller serves its degraded answer instead.
+
+A CircuitBreaker per upstream (chat completions, transcription, Twilio
+media) watches recent calls. Once failures or slow calls pass
+BREAKER_FAILURE_RATIO of at least BREAKER_MIN_CALLS calls within
+BREAKER_WINDOW_SECONDS, the breaker opens. Calls are then refused at once
+for BREAKER_OPEN_SECONDS. After that a single probe call is let through,
+and it decides whether the breaker closes or opens again.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+WEBHOOK_DEADLINE_SECONDS = float(os.getenv('WEBHOOK_DEADLINE_SECONDS', 13))
+BREAKER_FAILURE_RATIO = float(os.getenv('BREAKER_FAILURE_RATIO', 0.5))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', 5))
+BREAKER_WINDOW_SECONDS = float(os.getenv('BREAKER_WINDOW_SECONDS', 60))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', 30))
+
+# upstream: seconds after which a successful call still counts as a failure
+SLOW_CALL_SECONDS = {
+    'openai_chat': 10.0,
+    'openai_audio': 8.0,
+    'twilio_media': 5.0,
+}
+
+
+class DeadlineExceeded(Exception):
+    """Not enough time left for a stage"""
+
+
+class CircuitOpenError(Exception):
+    """The upstream's breaker is refusing calls"""
+
+
+class Deadline:
+    """The point in time by which a request must be answered"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def budget(self, cap=None, reserve=0.0, minimum=0.5):
+        """
+        Seconds a stage may take: the time left after `reserve` (needed by
+        later stages), at most `cap`.
+
+        Raises:
+            DeadlineExceeded: Less than `minimum` seconds would be left
+        """
+        available = self.remaining() - reserve
+        if available < minimum:
+            raise DeadlineExceeded(f"{available:.1f}s left of {self.seconds:.0f}s")
+        return available if cap is None else min(cap, available)
+
+
+class CircuitBreaker:
+    """Closed -> open after sustained failures -> half-open probe -> closed"""
+
+    def __init__(self, name, slow_call_seconds=None, failure_ratio=None, min_calls=None,
+                 window_seconds=None, open_seconds=None):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_ratio = BREAKER_FAILURE_RATIO if failure_ratio is None else failure_ratio
+        self.min_calls = BREAKER_MIN_CALLS if min_calls is None else min_calls
+        self.window_seconds = BREAKER_WINDOW_SECONDS if window_seconds is None else window_seconds
+        self.open_seconds = BREAKER_OPEN_SECONDS if open_seconds is None else open_seconds
+        self.state = 'closed'
+        self.stats = {'calls': 0, 'failures': 0, 'slow': 0, 'rejected': 0, 'trips': 0}
+        self._calls = deque()  # (finished at, ok)
+        self._opened_at = 0.0
+        self._probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead now (claims the probe when half-open)"""
+        with self.lock:
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'closed' or (self.state == 'half_open' and not self._probing):
+                self._probing = self.state == 'half_open'
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def record(self, ok, seconds=0.0):
+        now = time.monotonic()
+        slow = ok and self.slow_call_seconds is not None and seconds > self.slow_call_seconds
+        ok = ok and not slow
+        with self.lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += not ok
+            self.stats['slow'] += slow
+            if self.state == 'half_open':
+                self._probing = False
+                self._calls.clear()
+                if ok:
+                    self.state = 'closed'
+                    print(f"Circuit {self.name}: probe succeeded, closed")
+                else:
+                    self._trip(now)
+                return
+
+            self._calls.append((now, ok))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+            failures = sum(1 for _, call_ok in self._calls if not call_ok)
+            if (self.state == 'closed' and len(self._calls) >= self.min_calls
+                    and failures / len(self._calls) >= self.failure_ratio):
+                self._trip(now)
+
+    def _trip(self, now):
+        self.state = 'open'
+        self._opened_at = now
+        self._calls.clear()
+        self.stats['trips'] += 1
+        print(f"Circuit {self.name}: open for {self.open_seconds:g}s")
+
+    @contextmanager
+    def call(self):
+        """
+        Guard one upstream call:
+
+            with get_breaker('openai_chat').call():
+                response = client.chat.completions.create(...)
+
+        Raises:
+            CircuitOpenError: The breaker refused the call
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        start = time.monotonic()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # A consumer abandoning a stream (GeneratorExit) is not the upstream's fault
+            self.record(not failed, time.monotonic() - start)
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, 'state': self.state}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream):
+    """The process-wide breaker for an upstream (see SLOW_CALL_SECONDS)"""
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(upstream)
+            if breaker is None:
+                breaker = _breakers[upstream] = CircuitBreaker(upstream, SLOW_CALL_SECONDS.get(upstream))
+    return breaker
+
+
+def get_breaker_stats():
+    return {name: breaker.get_stats() for name, breaker in list(_breakers.items())}
+
+
+def _after_fork_in_child():
+    global _breakers_lock
+    _breakers_lock = threading.Lock()
+    for breaker in _breakers.values():
+        breaker.lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
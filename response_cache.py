@@ -0,0 +1,283 @@
+"""
+Cache of complete chatbot replies for repeated conversation turns.
+
+Many conversations open with the same few messages ("Hi", "What cars do
+you have?"), so their replies are cached under a hash of the normalized
+message, the whole history, the system prompt, the model, today's date
+and the inventory/reservation data versions. Only opening turns are
+cached: a turn with more than RESPONSE_CACHE_HISTORY history messages or
+a rolling summary depends on more than its key, and skips the cache. A change to
+either table produces new keys; entries stamped with older versions are
+purged the next time the cache sees the new ones.
+
+RESPONSE_CACHE selects the backend: 'memory' (per process, default),
+'sqlite' (shared by workers, survives restarts) or 'off'.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import database
+
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', 'memory')
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', 'response_cache.db')
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', 6 * 3600))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+# Longest history (in messages) a cached turn may have
+RESPONSE_CACHE_HISTORY = int(os.getenv('RESPONSE_CACHE_HISTORY', 2))
+
+
+def normalize_text(text):
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r'\s+', ' ', text).strip().casefold().rstrip('.!? ')
+
+
+def cache_key(user_message, conversation_history, context):
+    """
+    Hash identifying a turn.
+
+    Args:
+        context: Everything else the reply depends on (prompt, model,
+            rendering mode...), as a JSON-serializable value
+    """
+    payload = json.dumps({
+        'message': normalize_text(user_message),
+        'history': [[msg['role'], normalize_text(msg['content'])] for msg in conversation_history],
+        'context': context,
+        'date': date.today().isoformat(),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryResponseCache:
+    """LRU + TTL cache bounded by the total size of its keys and replies"""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'puts': 0, 'evictions': 0, 'expired': 0, 'purged': 0}
+        self._entries = OrderedDict()  # key -> (reply, versions, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            if entry[2] <= time.time():
+                self._remove(key)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+
+    def put(self, key, reply, versions):
+        size = len(key) + len(reply.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (reply, versions, time.time() + self.ttl, size)
+            self._bytes += size
+            self.stats['puts'] += 1
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def purge(self, versions):
+        """Drop entries built from data other than `versions`"""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[1] != versions]
+            for key in stale:
+                self._remove(key)
+            self.stats['purged'] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def size(self):
+        return len(self._entries), self._bytes
+
+
+class SQLiteResponseCache:
+    """
+    Same interface as MemoryResponseCache, stored in its own SQLite file so
+    the cache is shared by worker processes and survives restarts.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 ttl=RESPONSE_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'puts': 0, 'evictions': 0, 'expired': 0, 'purged': 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=database.BUSY_TIMEOUT_MS / 1000,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                reply TEXT NOT NULL,
+                versions TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_used ON response_cache (used_at)')
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT reply, expires_at FROM response_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            if row[1] <= now:
+                self._conn.execute('DELETE FROM response_cache WHERE key = ?', (key,))
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE response_cache SET used_at = ? WHERE key = ?', (now, key))
+            self.stats['hits'] += 1
+            return row[0]
+
+    def put(self, key, reply, versions):
+        size = len(key) + len(reply.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('''
+                    INSERT OR REPLACE INTO response_cache (key, reply, versions, size, expires_at, used_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (key, reply, json.dumps(versions), size, now + self.ttl, now))
+                self._conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+                total = self._conn.execute('SELECT SUM(size) FROM response_cache').fetchone()[0]
+                if total > self.max_bytes:
+                    # Least recently used first, until the total fits again
+                    for old_key, old_size in self._conn.execute(
+                        'SELECT key, size FROM response_cache ORDER BY used_at'
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        self._conn.execute('DELETE FROM response_cache WHERE key = ?', (old_key,))
+                        total -= old_size
+                        self.stats['evictions'] += 1
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self.stats['puts'] += 1
+
+    def purge(self, versions):
+        with self._lock:
+            purged = self._conn.execute(
+                'DELETE FROM response_cache WHERE versions != ?', (json.dumps(versions),)
+            ).rowcount
+            self.stats['purged'] += purged
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM response_cache')
+
+    def size(self):
+        with self._lock:
+            count, total = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache'
+            ).fetchone()
+        return count, total
+
+
+class ResponseCache:
+    """Keys turns against the current data versions and purges on change"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._versions = None
+
+    def _current_versions(self):
+        versions = list(database.get_data_versions())
+        if versions != self._versions:
+            if self._versions is not None:
+                self.backend.purge(versions)
+            self._versions = versions
+        return versions
+
+    def lookup(self, user_message, conversation_history, context, summarized=False):
+        """
+        Args:
+            summarized: Older turns were folded into a rolling summary
+
+        Returns:
+            (key, versions, cached reply or None); pass key and versions
+            back to store() after generating a reply on a miss. The key is
+            None for turns that are not cached.
+        """
+        if summarized or len(conversation_history) > RESPONSE_CACHE_HISTORY:
+            return None, None, None
+        versions = self._current_versions()
+        key = cache_key(user_message, conversation_history, [context, versions])
+        return key, versions, self.backend.get(key)
+
+    def store(self, key, versions, reply):
+        if key is None:
+            return
+        self.backend.put(key, reply, versions)
+
+    def get_stats(self):
+        stats = dict(self.backend.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['entries'], stats['bytes'] = self.backend.size()
+        return stats
+
+
+_response_cache = None
+_response_cache_pid = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """The process-wide cache selected by RESPONSE_CACHE, or None when it is off"""
+    global _response_cache, _response_cache_pid
+    if RESPONSE_CACHE == 'off':
+        return None
+    # SQLite connections must not cross a fork, so each worker opens its own
+    if _response_cache is None or _response_cache_pid != os.getpid():
+        with _response_cache_lock:
+            if _response_cache is None or _response_cache_pid != os.getpid():
+                if RESPONSE_CACHE == 'sqlite':
+                    backend = SQLiteResponseCache()
+                else:
+                    backend = MemoryResponseCache()
+                _response_cache = ResponseCache(backend)
+                _response_cache_pid = os.getpid()
+    return _response_cache
+
+
+def get_response_cache_stats():
+    cache = get_response_cache()
+    return cache.get_stats() if cache else {}
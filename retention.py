@@ -0,0 +1,297 @@
+"""
+Conversation retention: archive idle WhatsApp conversations and keep the
+hot SQLite file compact.
+
+Conversations idle for longer than CONVERSATION_TTL_DAYS are written to
+gzip-compressed JSON Lines files in ARCHIVE_DIR and removed from the
+messages/conversations tables, and saved "show me more" search positions
+older than SEARCH_PAGE_TTL_DAYS are deleted. Maintenance then returns
+freed pages to the OS (incremental vacuum), refreshes query planner
+statistics and truncates the WAL.
+
+Incremental vacuum needs a one-time full VACUUM to switch the database's
+auto_vacuum mode. That rewrites the whole file, so it only runs from the
+command line (--enable-vacuum), never from the workers' background thread.
+
+Usage:
+    python retention.py --once          # archive + maintenance, then exit
+    python retention.py --stats         # print table sizes only
+    python retention.py --enable-vacuum # one-time switch to incremental vacuum
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import database
+
+CONVERSATION_TTL_DAYS = float(os.getenv('CONVERSATION_TTL_DAYS', 30))
+SEARCH_PAGE_TTL_DAYS = float(os.getenv('SEARCH_PAGE_TTL_DAYS', 2))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archives')
+RETENTION_INTERVAL_SECONDS = int(os.getenv('RETENTION_INTERVAL_SECONDS', 3600))
+ARCHIVE_BATCH_SIZE = 500
+# Archive files are written under this suffix and renamed once their batch commits
+PARTIAL_SUFFIX = '.partial'
+VACUUM_PAGES_PER_RUN = 5000
+
+
+def _archive_path(archive_dir):
+    os.makedirs(archive_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f')
+    return os.path.join(archive_dir, f"conversations-{stamp}-{os.getpid()}.jsonl.gz")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # already settled by another worker's recover_partial_archives()
+
+
+def recover_partial_archives(conn, archive_dir):
+    """
+    Settle .partial archive files left by a run that stopped between
+    writing a batch and renaming it: keep the ones whose rows were deleted
+    (the batch committed), drop the ones whose rows are still here.
+    Call while holding the write lock, so no batch is in flight.
+    """
+    if not os.path.isdir(archive_dir):
+        return
+    for name in sorted(os.listdir(archive_dir)):
+        if not name.endswith(PARTIAL_SUFFIX):
+            continue
+        path = os.path.join(archive_dir, name)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as archive:
+                records = [json.loads(line) for line in archive]
+        except FileNotFoundError:
+            continue
+        except (OSError, EOFError, ValueError):
+            # Cut short before its fsync, so the batch never committed
+            records = None
+        committed = records is not None and not any(conn.execute(
+            'SELECT 1 FROM conversations WHERE phone_number = ? AND updated_at = ?',
+            (record['phone_number'], record['updated_at'])
+        ).fetchone() for record in records)
+        if committed:
+            os.replace(path, path[:-len(PARTIAL_SUFFIX)])
+            print(f"Recovered archive {path[:-len(PARTIAL_SUFFIX)]}")
+        else:
+            _remove(path)
+            print(f"Discarded uncommitted archive {path}")
+
+
+def archive_idle_conversations(ttl_days=None, archive_dir=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move conversations idle for more than `ttl_days` into archive files.
+
+    Each batch is selected, archived and deleted inside one write
+    transaction, so workers running this concurrently never archive the
+    same conversation twice. The file only gets its final name after the
+    commit; if the commit fails it is removed, and the next run settles
+    files left by a crash (see recover_partial_archives). That can be
+    another worker's run renaming this batch's file between the commit
+    and our own rename.
+
+    Returns:
+        Number of conversations archived
+    """
+    ttl_days = CONVERSATION_TTL_DAYS if ttl_days is None else ttl_days
+    archive_dir = archive_dir or ARCHIVE_DIR
+    archived = 0
+
+    with database.connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        recover_partial_archives(conn, archive_dir)
+        conn.rollback()
+
+    while True:
+        with database.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            idle = conn.execute('''
+                SELECT phone_number, updated_at FROM conversations
+                WHERE updated_at < datetime('now', ?)
+                ORDER BY updated_at
+                LIMIT ?
+            ''', (f'-{ttl_days} days', batch_size)).fetchall()
+            if not idle:
+                conn.rollback()
+                return archived
+
+            path = _archive_path(archive_dir)
+            partial = path + PARTIAL_SUFFIX
+            try:
+                _write_archive(conn, idle, partial)
+                phones = json.dumps([row['phone_number'] for row in idle])
+                conn.execute('DELETE FROM messages WHERE phone_number IN (SELECT value FROM json_each(?))',
+                             (phones,))
+                conn.execute('DELETE FROM conversations WHERE phone_number IN (SELECT value FROM json_each(?))',
+                             (phones,))
+                conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                _remove(partial)
+                raise
+            try:
+                os.replace(partial, path)
+            except FileNotFoundError:
+                # Another worker's recover_partial_archives saw the commit and renamed it first
+                if not os.path.exists(path):
+                    raise
+
+        archived += len(idle)
+        print(f"Archived {len(idle)} idle conversations to {path}")
+
+
+def _write_archive(conn, idle, path):
+    """Write the idle conversations' messages to a durable gzip JSON Lines file"""
+    with open(path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+            for row in idle:
+                messages = conn.execute('''
+                    SELECT seq, role, content, ts FROM messages
+                    WHERE phone_number = ? ORDER BY seq
+                ''', (row['phone_number'],)).fetchall()
+                archive.write((json.dumps({
+                    'phone_number': row['phone_number'],
+                    'updated_at': row['updated_at'],
+                    'messages': [dict(m) for m in messages]
+                }) + '\n').encode('utf-8'))
+        # The caller deletes the rows next, so the archive must be durable first
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def prune_search_pages(ttl_days=None):
+    """Delete saved search positions older than `ttl_days`; returns how many"""
+    ttl_days = SEARCH_PAGE_TTL_DAYS if ttl_days is None else ttl_days
+    with database.connection() as conn:
+        deleted = conn.execute(
+            "DELETE FROM search_pages WHERE created_at < datetime('now', ?)", (f'-{ttl_days} days',)
+        ).rowcount
+        conn.commit()
+    return deleted
+
+
+def ensure_incremental_vacuum():
+    """
+    Switch the database to auto_vacuum=INCREMENTAL (one full VACUUM, first
+    time only). Rewrites the whole file; run it from the CLI, not a worker.
+    """
+    conn = database.get_connection()
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            print("Enabling incremental auto-vacuum (one-time VACUUM)...")
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+def run_maintenance():
+    """
+    Release free pages, refresh planner statistics and truncate the WAL.
+    Pages are only released once --enable-vacuum has been run.
+    """
+    with database.connection() as conn:
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES_PER_RUN})').fetchall()
+        # optimize runs ANALYZE only on tables whose statistics are stale
+        conn.execute('PRAGMA analysis_limit = 400')
+        conn.execute('PRAGMA optimize')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+
+
+def table_stats():
+    """Row counts per table and on-disk size of the database"""
+    with database.connection() as conn:
+        tables = [row['name'] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        stats = {
+            'rows': {name: conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in tables},
+            'page_size': conn.execute('PRAGMA page_size').fetchone()[0],
+            'page_count': conn.execute('PRAGMA page_count').fetchone()[0],
+            'freelist_count': conn.execute('PRAGMA freelist_count').fetchone()[0],
+        }
+    stats['file_bytes'] = stats['page_size'] * stats['page_count']
+    wal_path = database.DB_NAME + '-wal'
+    stats['wal_bytes'] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    return stats
+
+
+def print_stats(stats):
+    print(f"Database: {stats['file_bytes'] / 1024:,.0f} KB "
+          f"({stats['freelist_count']} free pages), WAL: {stats['wal_bytes'] / 1024:,.0f} KB")
+    for name, count in stats['rows'].items():
+        print(f"  {name:>20}: {count:,} rows")
+
+
+def run_retention_once(ttl_days=None):
+    """Archive idle conversations, then compact; returns table stats"""
+    archived = archive_idle_conversations(ttl_days)
+    pruned = prune_search_pages()
+    run_maintenance()
+    stats = table_stats()
+    print(f"Retention run complete: archived {archived} conversations, pruned {pruned} search pages")
+    print_stats(stats)
+    return stats
+
+
+class RetentionWorker:
+    """Runs retention periodically on a daemon thread"""
+
+    def __init__(self, interval=RETENTION_INTERVAL_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # Let the app finish booting before the first pass
+        delay = min(self.interval, 60)
+        while not self._stop.wait(delay):
+            delay = self.interval
+            try:
+                run_retention_once()
+            except Exception as e:
+                print(f"Error in retention run: {e}")
+                import traceback
+                traceback.print_exc()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive idle conversations and compact the database")
+    parser.add_argument('--once', action='store_true', help="Run one retention pass and exit")
+    parser.add_argument('--stats', action='store_true', help="Only print table sizes")
+    parser.add_argument('--enable-vacuum', action='store_true',
+                        help="Switch to incremental auto-vacuum (one full VACUUM; stop the app first)")
+    parser.add_argument('--ttl-days', type=float, help="Override CONVERSATION_TTL_DAYS")
+    args = parser.parse_args()
+
+    if args.stats:
+        print_stats(table_stats())
+    elif args.enable_vacuum:
+        ensure_incremental_vacuum()
+    elif args.once:
+        run_retention_once(args.ttl_days)
+    else:
+        worker = RetentionWorker().start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            worker.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Local stand-in for the OpenAI and Twilio endpoints the app calls.
+
+- POST /v1/chat/completions: a time to first token, then tokens at a
+  steady rate. Calls that carry `tools` (Instructor's structured output)
+  return a tool call with a ChatbotAction. The action is routed from the
+  last user message (greetings, categories, budgets, "all cars"), or it
+  is scripted. Plain calls return filler text, and `stream: true` calls
+  stream it as Server-Sent Events.
+- POST /v1/audio/transcriptions: a Whisper-style {"text": ...} after
+  `transcription_seconds`.
+- GET .../Media/<id> (Twilio media URLs): a redirect to the media store,
+  which serves a small OGG voice note, like api.twilio.com does.
+
+Latencies are medians; `jitter` adds lognormal spread around them. Rate
+limits, server errors and slow responses can be injected at random or
+scripted per call. That makes retries, timeouts, hedging and capacity
+testable without network access or credentials.
+
+Point the app or a benchmark at it with:
+
+    python stand_in_server.py --port 8089 --error-rate 0.05 --jitter 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stand-in python app.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ACTION = {'action_type': 'search_cars', 'search_criteria': {'category': 'Economy'}}
+ERROR_TYPES = {429: 'rate_limit_error', 500: 'server_error', 502: 'server_error', 503: 'server_error'}
+
+# Keyword -> category for routed actions; checked in order
+ROUTE_CATEGORIES = [
+    ('suv', 'Mid-Size SUV'), ('economy', 'Economy'), ('cheap', 'Economy'), ('luxury', 'Luxury'),
+    ('van', 'Minivan'), ('truck', 'Pickup Truck'), ('pickup', 'Pickup Truck'), ('sport', 'Sports'),
+    ('electric', 'Electric'),
+]
+TRANSCRIPTS = [
+    "Hi, I need a car for this weekend",
+    "Do you have any SUVs for five people?",
+    "Show me economy cars under 150 dirhams",
+    "What cars do you have available?",
+]
+# An OGG page header followed by silence; enough for a realistic download
+VOICE_NOTE = b'OggS\x00\x02' + bytes(24 * 1024)
+
+
+def route_action(messages):
+    """A plausible ChatbotAction for the last user message"""
+    text = next((msg.get('content') or '' for msg in reversed(messages) if msg.get('role') == 'user'), '')
+    text = text.lower()
+    if re.match(r'^(hi|hello|hey|good (morning|afternoon|evening))\b', text) and len(text.split()) <= 4:
+        return {'action_type': 'direct_response',
+                'response': "Hello! How many passengers will be travelling, and when do you need the car?"}
+    criteria = {}
+    for word, category in ROUTE_CATEGORIES:
+        if word in text:
+            criteria['category'] = category
+            break
+    price = re.search(r'(?:under|below|max) (?:aed )?(\d+)', text)
+    if price:
+        criteria['max_price'] = float(price.group(1))
+    people = re.search(r'(\d+) (?:people|passengers|adults)', text)
+    if people:
+        criteria['min_passengers'] = int(people.group(1))
+    if criteria:
+        return {'action_type': 'search_cars', 'search_criteria': criteria}
+    if re.search(r'\b(all|inventory|what cars|which cars)\b', text):
+        return {'action_type': 'get_inventory', 'get_inventory': {'retrieve_all': True}}
+    return {'action_type': 'direct_response',
+            'response': "Great choice! When would you like to pick up the car, and when will you return it?"}
+
+
+def twilio_media_url(root_url, media_id):
+    """A Twilio-style MediaUrl0 on a stand-in server at `root_url`"""
+    return f"{root_url}/2010-04-01/Accounts/ACstandin/Messages/MM{media_id}/Media/ME{media_id}"
+
+
+class StandInLLM:
+    """A stand-in OpenAI/Twilio server on a background thread"""
+
+    def __init__(self, port=0, ttft=0.35, tokens_per_sec=50, reply_tokens=180, action=DEFAULT_ACTION,
+                 error_rate=0.0, error_status=429, slow_rate=0.0, slow_seconds=5.0,
+                 jitter=0.0, transcription_seconds=1.0, media_seconds=0.15, seed=None):
+        """
+        Args:
+            port: Port to listen on (0 picks a free one)
+            ttft: Median seconds before the first token
+            tokens_per_sec: Generation speed after the first token
+            reply_tokens: Length of plain text replies (capped by max_tokens)
+            action: ChatbotAction fields for structured calls, or None to
+                route each call from its last user message
+            error_rate: Fraction of calls answered with `error_status`
+            slow_rate: Fraction of calls delayed by an extra `slow_seconds`
+            jitter: Lognormal sigma applied to every latency (0 = fixed)
+            transcription_seconds: Median latency of a transcription
+            media_seconds: Median latency of a media download
+        """
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.action = action
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.jitter = jitter
+        self.transcription_seconds = transcription_seconds
+        self.media_seconds = media_seconds
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'errors': 0, 'slow': 0, 'in_flight': 0, 'max_in_flight': 0,
+                      'transcriptions': 0, 'media_downloads': 0}
+        self._scripted = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def root_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def base_url(self):
+        """OPENAI_BASE_URL for this server"""
+        return f"{self.root_url}/v1"
+
+    def media_url(self, media_id):
+        """A Twilio-style MediaUrl0 served by this server"""
+        return twilio_media_url(self.root_url, media_id)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='stand-in-llm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail_next(self, count, status=429):
+        """Answer the next `count` calls with an HTTP error"""
+        with self._lock:
+            self._scripted.extend([('error', status)] * count)
+
+    def slow_next(self, count, seconds):
+        """Delay the next `count` calls by an extra `seconds`"""
+        with self._lock:
+            self._scripted.extend([('slow', seconds)] * count)
+
+    def clear_script(self):
+        """Drop failures and delays queued by fail_next()/slow_next() that were not used"""
+        with self._lock:
+            self._scripted.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.update(requests=0, errors=0, slow=0, max_in_flight=self.stats['in_flight'],
+                              transcriptions=0, media_downloads=0)
+
+    def _latency(self, median):
+        if not self.jitter or not median:
+            return median
+        with self._lock:
+            return median * self.random.lognormvariate(0, self.jitter)
+
+    def _plan(self):
+        """(error status or None, extra delay) for the next call"""
+        with self._lock:
+            if self._scripted:
+                kind, value = self._scripted.pop(0)
+                return (value, 0.0) if kind == 'error' else (None, value)
+            if self.random.random() < self.error_rate:
+                return self.error_status, 0.0
+            if self.random.random() < self.slow_rate:
+                return None, self.slow_seconds
+        return None, 0.0
+
+    def _handler_class(self):
+        llm = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if '/Media/' in self.path:
+                    # Twilio answers media URLs with a redirect to its media store
+                    self.send_response(307)
+                    self.send_header('Location', '/media-store/' + self.path.rsplit('/', 1)[-1])
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                elif self.path.startswith('/media-store/'):
+                    self._serve(llm._media, self)
+                else:
+                    self._send_json(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'not_found'}})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path.endswith('/chat/completions'):
+                    self._serve(llm._complete, self, json.loads(body or b'{}'))
+                elif self.path.endswith('/audio/transcriptions'):
+                    self._serve(llm._transcribe, self)
+                else:
+                    self._send_json(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'not_found'}})
+
+            def _serve(self, func, *args):
+                with llm._lock:
+                    llm.stats['requests'] += 1
+                    llm.stats['in_flight'] += 1
+                    llm.stats['max_in_flight'] = max(llm.stats['max_in_flight'], llm.stats['in_flight'])
+                try:
+                    if not llm._inject_failure(self):
+                        func(*args)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout or hedge cancelled)
+                finally:
+                    with llm._lock:
+                        llm.stats['in_flight'] -= 1
+
+            def _send_json(self, status, payload, headers=None):
+                self._send(status, json.dumps(payload).encode('utf-8'), 'application/json', headers)
+
+            def _send(self, status, data, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def _inject_failure(self, handler):
+        """Apply the planned error or stall; True when the call was answered with an error"""
+        status, extra_delay = self._plan()
+        if status:
+            with self._lock:
+                self.stats['errors'] += 1
+            time.sleep(0.01)
+            handler._send_json(status, {'error': {'message': f"Stand-in error {status}",
+                                                  'type': ERROR_TYPES.get(status, 'server_error')}},
+                               headers={'Retry-After': '0'} if status == 429 else None)
+            return True
+        if extra_delay:
+            with self._lock:
+                self.stats['slow'] += 1
+            time.sleep(extra_delay)
+        return False
+
+    def _transcribe(self, handler):
+        time.sleep(self._latency(self.transcription_seconds))
+        with self._lock:
+            self.stats['transcriptions'] += 1
+            text = TRANSCRIPTS[self.stats['transcriptions'] % len(TRANSCRIPTS)]
+        handler._send_json(200, {'text': text})
+
+    def _media(self, handler):
+        time.sleep(self._latency(self.media_seconds))
+        with self._lock:
+            self.stats['media_downloads'] += 1
+        handler._send(200, VOICE_NOTE, 'audio/ogg')
+
+    def _complete(self, handler, request):
+        model = request.get('model', 'stand-in')
+        created = int(time.time())
+        completion_id = f"chatcmpl-standin-{self.stats['requests']}"
+        time.sleep(self._latency(self.ttft))
+
+        if request.get('tools'):
+            # Instructor's tool mode: the model "calls" the response model's function
+            arguments = json.dumps(self.action or route_action(request.get('messages', [])))
+            time.sleep(len(arguments) / 4 / self.tokens_per_sec)
+            name = request['tools'][0]['function']['name']
+            message = {'role': 'assistant', 'content': None, 'tool_calls': [{
+                'id': 'call_standin', 'type': 'function',
+                'function': {'name': name, 'arguments': arguments},
+            }]}
+            handler._send_json(200, self._completion(completion_id, created, model, message, 'tool_calls'))
+            return
+
+        tokens = min(request.get('max_tokens') or self.reply_tokens, self.reply_tokens)
+        if not request.get('stream'):
+            time.sleep(tokens / self.tokens_per_sec)
+            message = {'role': 'assistant', 'content': 'word ' * tokens}
+            handler._send_json(200, self._completion(completion_id, created, model, message, 'stop'))
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+        for i in range(tokens + 1):
+            if i:
+                time.sleep(1 / self.tokens_per_sec)
+            done = i == tokens
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                     'choices': [{'index': 0, 'delta': {} if done else {'content': 'word '},
+                                  'finish_reason': 'stop' if done else None}]}
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            handler.wfile.flush()
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+    def _completion(self, completion_id, created, model, message, finish_reason):
+        return {
+            'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+            'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the OpenAI and Twilio media APIs")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--ttft', type=float, default=0.35, help="Median seconds before the first token")
+    parser.add_argument('--tokens-per-sec', type=float, default=50)
+    parser.add_argument('--jitter', type=float, default=0.0, help="Lognormal sigma of all latencies")
+    parser.add_argument('--transcription-seconds', type=float, default=1.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls that fail")
+    parser.add_argument('--error-status', type=int, default=429)
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="Fraction of calls delayed")
+    parser.add_argument('--slow-seconds', type=float, default=5.0)
+    parser.add_argument('--scripted-action', action='store_true',
+                        help="Always return the default search action instead of routing messages")
+    args = parser.parse_args()
+
+    llm = StandInLLM(port=args.port, ttft=args.ttft, tokens_per_sec=args.tokens_per_sec,
+                     action=DEFAULT_ACTION if args.scripted_action else None,
+                     error_rate=args.error_rate, error_status=args.error_status,
+                     slow_rate=args.slow_rate, slow_seconds=args.slow_seconds,
+                     jitter=args.jitter, transcription_seconds=args.transcription_seconds)
+    print(f"Stand-in LLM listening on {llm.base_url} (media: {llm.media_url('1')})")
+    try:
+        llm.server.serve_forever()
+    except KeyboardInterrupt:
+        llm.stop()
+
+
+if __name__ == '__main__':
+    main()
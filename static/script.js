@@ -18,13 +18,9 @@ function getTimestamp() {
     });
 }
 
-// Add message to chat
-function addMessage(content, isUser = false) {
-    const messageDiv = document.createElement('div');
-    messageDiv.className = `message ${isUser ? 'user-message' : 'bot-message'}`;
-
-    const messageContent = document.createElement('div');
-    messageContent.className = 'message-content';
+// Render message text (bold, --- separators) into a message-content element
+function renderContent(messageContent, content, time) {
+    messageContent.innerHTML = '';
 
     // Process content line by line
     const lines = content.split('\n');
@@ -54,11 +50,26 @@ function addMessage(content, isUser = false) {
 
     const timestamp = document.createElement('span');
     timestamp.className = 'timestamp';
-    timestamp.textContent = getTimestamp();
+    timestamp.textContent = time;
     messageContent.appendChild(timestamp);
+}
+
+// Create an empty message bubble; returns its content element
+function createMessage(isUser) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${isUser ? 'user-message' : 'bot-message'}`;
+
+    const messageContent = document.createElement('div');
+    messageContent.className = 'message-content';
 
     messageDiv.appendChild(messageContent);
     chatMessages.appendChild(messageDiv);
+    return messageContent;
+}
+
+// Add message to chat
+function addMessage(content, isUser = false) {
+    renderContent(createMessage(isUser), content, getTimestamp());
 
     // Scroll to bottom
     scrollToBottom();
@@ -119,6 +130,80 @@ async function sendMessage(message) {
     }
 }
 
+// Parse one Server-Sent Event block into {type, data}
+function parseEvent(block) {
+    let type = 'message';
+    let data = '';
+    block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) type = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+    });
+    return { type, data: data ? JSON.parse(data) : {} };
+}
+
+// Stream the bot response into a new message bubble as it arrives.
+// Returns the full text, or '' if nothing arrived.
+async function streamMessage(message) {
+    const response = await fetch('/api/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            message: message,
+            history: conversationHistory
+        })
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error('Network response was not ok');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const time = getTimestamp();
+    let buffer = '';
+    let content = '';
+    let bubble = null;
+
+    try {
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const event = parseEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+
+                if (event.type === 'done') {
+                    console.log(`Reply: first token ${event.data.ttft_ms} ms, total ${event.data.total_ms} ms`);
+                    continue;
+                }
+
+                content += event.data.delta;
+                if (!bubble) {
+                    hideTyping();
+                    bubble = createMessage(false);
+                }
+                renderContent(bubble, content, time);
+                scrollToBottom();
+            }
+        }
+    } catch (error) {
+        // Keep whatever was already shown rather than asking again
+        if (!content) throw error;
+        console.error('Stream interrupted:', error);
+    }
+
+    if (content) {
+        conversationHistory.push({ role: 'assistant', content: content });
+    }
+    return content;
+}
+
 // Handle form submission
 chatForm.addEventListener('submit', async (e) => {
     e.preventDefault();
@@ -139,14 +224,19 @@ chatForm.addEventListener('submit', async (e) => {
     // Show typing indicator
     showTyping();
 
-    // Get bot response
-    const botResponse = await sendMessage(message);
-
-    // Hide typing indicator
-    hideTyping();
+    // Stream the bot response, falling back to the plain endpoint
+    let streamed = '';
+    try {
+        streamed = await streamMessage(message);
+    } catch (error) {
+        console.error('Streaming failed:', error);
+    }
 
-    // Add bot response
-    addMessage(botResponse, false);
+    if (!streamed) {
+        const botResponse = await sendMessage(message);
+        hideTyping();
+        addMessage(botResponse, false);
+    }
 
     // Re-enable input
     messageInput.disabled = false;
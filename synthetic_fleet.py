@@ -0,0 +1,91 @@
+"""
+Synthetic fleet generator for benchmarks and tests.
+
+Produces car dicts in the same shape as the seed inventory in database.py,
+with a realistic spread of categories, prices, seats and features.
+"""
+import json
+import random
+
+from models import CarCategory, FuelType
+
+# (makes/models, price range in AED, passenger choices, luggage choices)
+CATEGORY_PROFILES = {
+    CarCategory.ECONOMY.value: (
+        [('Toyota', 'Corolla'), ('Honda', 'Civic'), ('Hyundai', 'Elantra'), ('Kia', 'Cerato')],
+        (110, 160), [4, 5], [1, 2]),
+    CarCategory.COMPACT_SUV.value: (
+        [('Mazda', 'CX-5'), ('Honda', 'CR-V'), ('Toyota', 'RAV4'), ('Nissan', 'Rogue')],
+        (180, 230), [5], [3, 4]),
+    CarCategory.MID_SIZE_SUV.value: (
+        [('Ford', 'Explorer'), ('Toyota', 'Highlander'), ('Hyundai', 'Santa Fe')],
+        (240, 300), [5, 7], [4]),
+    CarCategory.FULL_SIZE_SUV.value: (
+        [('Chevrolet', 'Tahoe'), ('Nissan', 'Patrol'), ('Toyota', 'Land Cruiser')],
+        (290, 420), [7, 8], [5, 6]),
+    CarCategory.LUXURY.value: (
+        [('BMW', '3 Series'), ('Mercedes-Benz', 'C-Class'), ('Audi', 'A4'), ('Lexus', 'ES')],
+        (320, 480), [5], [2, 3]),
+    CarCategory.MINIVAN.value: (
+        [('Chrysler', 'Pacifica'), ('Honda', 'Odyssey'), ('Kia', 'Carnival')],
+        (230, 280), [7, 8], [4, 5]),
+    CarCategory.ELECTRIC.value: (
+        [('Tesla', 'Model 3'), ('Nissan', 'Leaf'), ('Hyundai', 'Ioniq 5')],
+        (180, 340), [5], [2, 3]),
+    CarCategory.PICKUP_TRUCK.value: (
+        [('Ford', 'F-150'), ('Chevrolet', 'Silverado'), ('Toyota', 'Hilux')],
+        (260, 300), [5, 6], [2]),
+    CarCategory.SPORTS.value: (
+        [('Ford', 'Mustang'), ('Chevrolet', 'Camaro'), ('Porsche', '718 Cayman')],
+        (380, 620), [2, 4], [1, 2]),
+}
+
+FEATURES = [
+    'Air Conditioning', 'Bluetooth', 'Backup Camera', 'Lane Assist', 'Apple CarPlay',
+    'All-Wheel Drive', '4WD', 'Sunroof', 'Third Row Seating', 'Leather Interior',
+    'Premium Sound System', 'Navigation', 'Heated Seats', 'Towing Package',
+    'Rear Entertainment', 'Power Sliding Doors', 'Autopilot', 'Quick Charging',
+    'Sport Seats', 'Performance Package',
+]
+
+
+def generate_cars(count, seed=0, available_ratio=0.9):
+    """Generate `count` car dicts with JSON-encoded features, like the seed data"""
+    rng = random.Random(seed)
+    categories = list(CATEGORY_PROFILES)
+    cars = []
+    for _ in range(count):
+        category = rng.choice(categories)
+        models, (low, high), passengers, luggage = CATEGORY_PROFILES[category]
+        make, model = rng.choice(models)
+        if category == CarCategory.ELECTRIC.value:
+            fuel_type = FuelType.ELECTRIC.value
+        else:
+            fuel_type = rng.choice([FuelType.GASOLINE.value] * 3 + [FuelType.HYBRID.value])
+        cars.append({
+            'make': make,
+            'model': model,
+            'year': rng.choice([2022, 2023, 2024]),
+            'category': category,
+            # Whole-dirham prices give plenty of ties to exercise range cuts
+            'daily_price': float(rng.randint(low, high)),
+            'passengers': rng.choice(passengers),
+            'luggage': rng.choice(luggage),
+            'transmission': rng.choice(['Automatic'] * 9 + ['Manual']),
+            'fuel_type': fuel_type,
+            'features': json.dumps(rng.sample(FEATURES, rng.randint(2, 5))),
+            'image_url': None,
+            'available': 1 if rng.random() < available_ratio else 0,
+        })
+    return cars
+
+
+def insert_cars(conn, cars):
+    """Bulk-insert generated cars and commit"""
+    conn.executemany('''
+        INSERT INTO cars (make, model, year, category, daily_price, passengers,
+                          luggage, transmission, fuel_type, features, image_url, available)
+        VALUES (:make, :model, :year, :category, :daily_price, :passengers,
+                :luggage, :transmission, :fuel_type, :features, :image_url, :available)
+    ''', cars)
+    conn.commit()
@@ -0,0 +1,124 @@
+"""
+Test the async chatbot engine against the local stand-in LLM server:
+retries, the concurrency limit, hedging and timeouts
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import database
+import response_cache
+from stand_in_server import StandInLLM
+
+llm_server = StandInLLM(ttft=0.05, tokens_per_sec=2000).start()
+os.environ['OPENAI_BASE_URL'] = llm_server.base_url
+os.environ['OPENAI_API_KEY'] = 'stand-in'
+
+import async_chatbot  # noqa: E402  (reads OPENAI_BASE_URL when clients are created)
+import chatbot  # noqa: E402
+
+
+def make_bot(**llm_options):
+    llm_options.setdefault('retry_base_delay', 0.01)
+    return async_chatbot.AsyncCarRentalChatbot(llm=async_chatbot.LLMCaller(**llm_options))
+
+
+def setup_module():
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_async_chatbot.db')
+    database.init_db()
+    # Every turn must reach the stand-in server
+    response_cache.RESPONSE_CACHE = 'off'
+    chatbot.LOCAL_PARSER = False
+    chatbot.RESPONSE_RENDERING = 'local'
+
+
+def setup_function():
+    # A test that fails early must not leave scripted failures for the next one
+    llm_server.clear_script()
+    llm_server.reset_stats()
+
+
+def teardown_module():
+    llm_server.stop()
+
+
+def test_retries_rate_limits():
+    """Two 429s in a row are retried and the customer still gets cars"""
+
+    print("=== Testing Retries ===\n")
+    bot = make_bot(hedge_after=0)
+    llm_server.fail_next(2, status=429)
+    reply = asyncio.run(bot.get_response_async("Show me economy cars"))
+    print(f"Bot: {reply[:80]}...")
+    print(f"Stats: {bot.llm.get_stats()}\n")
+    assert 'AED' in reply
+    assert bot.llm.stats['retries'] == 2 and bot.llm.stats['failures'] == 0
+
+    # Each asyncio.run() gets its own bot: the SDK's connections belong to one loop
+    bot = make_bot(hedge_after=0)
+    llm_server.fail_next(1, status=400)
+    reply = asyncio.run(bot.get_response_async("Show me economy cars"))
+    assert reply == chatbot.APOLOGY, "client errors are not retried"
+    assert bot.llm.stats['retries'] == 0
+    print("=== Test Complete ===\n")
+
+
+def test_concurrency_limit():
+    """No more than `concurrency` calls reach the server at once"""
+
+    print("=== Testing Concurrency Limit ===\n")
+    bot = make_bot(concurrency=4, hedge_after=0)
+    llm_server.reset_stats()
+
+    async def burst():
+        return await asyncio.gather(*(bot.get_response_async(f"Show me economy cars ({i})")
+                                      for i in range(20)))
+
+    replies = asyncio.run(burst())
+    print(f"Server stats: {llm_server.stats}\n")
+    assert all('AED' in reply for reply in replies)
+    assert llm_server.stats['max_in_flight'] <= 4
+    print("=== Test Complete ===\n")
+
+
+def test_hedging_cuts_tail_latency():
+    """A stalled call is hedged and the turn finishes long before the stall ends"""
+
+    print("=== Testing Hedging ===\n")
+    bot = make_bot(hedge_after=0.2)
+    llm_server.slow_next(1, seconds=3.0)
+    start = time.perf_counter()
+    reply = asyncio.run(bot.get_response_async("Show me economy cars"))
+    elapsed = time.perf_counter() - start
+    print(f"Turn took {elapsed * 1000:.0f} ms; stats: {bot.llm.get_stats()}\n")
+    assert 'AED' in reply
+    assert elapsed < 1.5
+    assert bot.llm.stats['hedges'] == 1 and bot.llm.stats['hedge_wins'] == 1
+    print("=== Test Complete ===\n")
+
+
+def test_timeout_gives_up():
+    """Attempts that exceed the timeout are abandoned and the turn apologises"""
+
+    print("=== Testing Timeouts ===\n")
+    bot = make_bot(timeout=0.2, max_retries=1, hedge_after=0)
+    llm_server.slow_next(2, seconds=2.0)
+    start = time.perf_counter()
+    reply = asyncio.run(bot.get_response_async("Show me economy cars"))
+    elapsed = time.perf_counter() - start
+    print(f"Gave up after {elapsed * 1000:.0f} ms; stats: {bot.llm.get_stats()}\n")
+    assert reply == chatbot.APOLOGY
+    assert bot.llm.stats['timeouts'] == 2 and elapsed < 1.0
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    setup_module()
+    try:
+        for test in (test_retries_rate_limits, test_concurrency_limit, test_hedging_cuts_tail_latency,
+                     test_timeout_gives_up):
+            setup_function()
+            test()
+    finally:
+        teardown_module()
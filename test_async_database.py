@@ -0,0 +1,119 @@
+"""
+Test the async database façade: the event loop must stay responsive
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import async_database
+import database
+from synthetic_fleet import generate_cars, insert_cars
+
+
+def use_temp_database(fleet_size):
+    database.flush_conversations()
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_async.db')
+    database.init_db()
+    with database.connection() as conn:
+        insert_cars(conn, generate_cars(fleet_size, seed=1))
+
+
+async def max_loop_lag(work):
+    """Run `work` while a heartbeat measures the worst event-loop stall"""
+    lag = 0.0
+    done = asyncio.Event()
+
+    async def heartbeat():
+        nonlocal lag
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - start - 0.005)
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.01)  # let the heartbeat start ticking
+    await work()
+    done.set()
+    await beat
+    return lag
+
+
+def test_loop_stays_responsive():
+    """200 concurrent searches and history reads don't stall the loop"""
+
+    print("=== Testing Event Loop Responsiveness ===\n")
+    use_temp_database(20_000)
+
+    async def concurrent_load():
+        tasks = []
+        for i in range(100):
+            tasks.append(async_database.search_cars_async({'max_price': 150 + i}))
+            tasks.append(async_database.get_user_conversation_async(f"whatsapp:+1555000{i:04d}"))
+        results = await asyncio.gather(*tasks)
+        assert len(results) == 200
+
+    async def blocking_load():
+        # What an async handler calling database.py directly would do
+        for i in range(100):
+            database.search_cars({'max_price': 150 + i})
+            database.get_user_conversation(f"whatsapp:+1555000{i:04d}")
+
+    async def main():
+        blocking = await max_loop_lag(blocking_load)
+        responsive = await max_loop_lag(concurrent_load)
+        return blocking, responsive
+
+    blocking, responsive = asyncio.run(main())
+    print(f"Worst loop stall calling database.py directly: {blocking * 1e3:.1f} ms")
+    print(f"Worst loop stall through async_database:       {responsive * 1e3:.1f} ms")
+    assert responsive < 0.1
+    assert responsive < blocking
+    print("=== Test Complete ===\n")
+
+
+def test_timeout_interrupts_query():
+    """A timed-out call raises and its query is interrupted, freeing the worker"""
+
+    print("=== Testing Timeout and Cancellation ===\n")
+    use_temp_database(100)
+
+    def runaway_query():
+        with database.connection() as conn:
+            return conn.execute('''
+                WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n)
+                SELECT COUNT(*) FROM n
+            ''').fetchone()
+
+    async def main():
+        start = time.perf_counter()
+        try:
+            await async_database.run_in_db(runaway_query, timeout=0.1)
+            raise AssertionError("expected a timeout")
+        except asyncio.TimeoutError:
+            print(f"Timed out after {time.perf_counter() - start:.2f}s")
+
+        # Every worker must be free again: a burst of real calls completes quickly
+        start = time.perf_counter()
+        cars = await asyncio.gather(*[
+            async_database.get_all_cars_async(timeout=2) for _ in range(async_database.ASYNC_DB_WORKERS * 2)
+        ])
+        print(f"Follow-up calls finished in {(time.perf_counter() - start) * 1e3:.0f} ms")
+        assert all(cars)
+
+        task = asyncio.create_task(async_database.run_in_db(runaway_query, timeout=10))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            print("Cancelled a running query")
+        assert await async_database.get_all_cars_async(timeout=2)
+
+    asyncio.run(main())
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_loop_stays_responsive()
+    test_timeout_interrupts_query()
@@ -0,0 +1,56 @@
+"""
+Test local rendering of car listings (no LLM involved)
+"""
+import os
+import tempfile
+
+import database
+from car_listings import format_car_listing, format_tool_results, render_car_options, NO_MATCHES, MAX_TOOL_ROWS
+
+
+def test_render_car_options():
+    """Replies follow the system prompt's listing format and name the cars app.py sends photos for"""
+
+    print("=== Testing Local Listing Rendering ===\n")
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_listings.db')
+    database.init_db()
+
+    corolla = next(car for car in database.get_all_cars() if car['model'] == 'Corolla')
+    listing = format_car_listing(corolla)
+    print(listing + "\n")
+    assert listing.startswith("**2024 Toyota Corolla** - AED 128.45/day\nSeats 5 passengers")
+
+    reply = render_car_options(database.get_all_cars())
+    print(reply + "\n")
+    assert reply.count("/day") == 3
+    assert reply.count("\n---\n") == 2
+    # A broad result shows three different categories
+    titles = [line for line in reply.splitlines() if line.startswith("**")]
+    categories = {car['category'] for car in database.get_all_cars()
+                  if f"{car['make']} {car['model']}**" in " ".join(titles)}
+    assert len(categories) == 3
+
+    assert render_car_options([]) == NO_MATCHES
+    print("=== Test Complete ===\n")
+
+
+def test_tool_results_are_compact():
+    """The LLM payload is a capped table with rounded prices and no internal columns"""
+
+    print("=== Testing Compact Tool Results ===\n")
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_tool_results.db')
+    database.init_db()
+    cars = database.get_all_cars()
+    payload = format_tool_results(cars)
+    print(payload + "\n")
+    lines = payload.splitlines()
+    assert lines[0] == 'year|make|model|category|AED/day|seats|fuel|features'
+    assert len(lines) == 1 + MAX_TOOL_ROWS + 1 and lines[-1].startswith(f"({len(cars) - MAX_TOOL_ROWS} more")
+    assert 'unsplash' not in payload and '128.45' not in payload
+    assert '2024|Toyota|Corolla|Economy|128|5|Gasoline|' in payload
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_render_car_options()
+    test_tool_results_are_compact()
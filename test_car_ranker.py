@@ -0,0 +1,66 @@
+"""
+Test ranking the fleet against free-text needs
+"""
+import os
+import tempfile
+
+import car_ranker
+import database
+from synthetic_fleet import generate_cars, insert_cars
+
+
+def use_fresh_database():
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_car_ranker.db')
+    database.init_db()
+
+
+def test_free_text_needs():
+    """Phrases without any CarSearchCriteria field still pick fitting cars"""
+
+    print("=== Testing free-text ranking ===\n")
+    use_fresh_database()
+
+    ranked = car_ranker.rank_cars("something comfy for a desert road trip with lots of bags")
+    for car in ranked:
+        print(f"  {car['make']} {car['model']} ({car['category']}): {', '.join(car['features'])}")
+    assert 0 < len(ranked) <= car_ranker.RANKED_OPTIONS
+    assert ranked[0]['category'] == 'Full-Size SUV' and '4WD' in ranked[0]['features']
+
+    family = car_ranker.rank_cars("we're a family of 7 with kids")
+    assert family and all(car['passengers'] >= 7 for car in family), "seat counts are hard limits"
+    eco = car_ranker.rank_cars("eco friendly please")
+    assert eco[0]['fuel_type'] == 'Electric'
+    assert all(car['fuel_type'] in ('Electric', 'Hybrid') for car in eco), "unmatched cars are left out"
+
+    assert car_ranker.rank_cars("what cars do you have?") is None, "nothing to rank by"
+    assert car_ranker.rank_cars("a fast car for 12 people") == []
+    print("\n=== Test Complete ===\n")
+
+
+def test_large_fleet_and_subsets():
+    """Rankings follow inventory changes, and can be limited to search results"""
+
+    print("=== Testing a 20,000 car fleet ===\n")
+    use_fresh_database()
+    small = car_ranker.get_ranker()
+    with database.connection() as conn:
+        insert_cars(conn, generate_cars(20_000, seed=7))
+    database.invalidate_inventory()
+    ranker = car_ranker.get_ranker()
+    assert ranker is not small and len(ranker) > 17_000
+
+    cheap = car_ranker.rank_cars("a cheap car for the city under 150 AED", k=10)
+    print(f"Cheapest city cars: {[car['daily_price'] for car in cheap]}")
+    assert len(cheap) == 10 and all(car['daily_price'] <= 150 for car in cheap)
+    assert cheap[0]['category'] == 'Economy'
+
+    suvs = database.search_cars({'category': 'Full-Size SUV'})
+    ranked = car_ranker.rank_cars("towing a boat through the desert", cars=suvs)
+    assert ranked and {car['id'] for car in ranked} <= {car['id'] for car in suvs}
+    assert all('Towing Package' in car['features'] for car in ranked[:3])
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_free_text_needs()
+    test_large_fleet_and_subsets()
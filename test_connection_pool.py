@@ -0,0 +1,67 @@
+"""
+Test the SQLite connection pool across fork()
+"""
+import os
+import signal
+import tempfile
+import threading
+import time
+
+import database
+
+
+def test_fork_while_pool_is_busy():
+    """A worker forked while another thread holds the pool's lock still gets connections"""
+
+    print("=== Testing fork() with a busy pool ===\n")
+    if not hasattr(os, 'fork'):
+        print("Skipped: no fork() on this platform\n")
+        return
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_pool.db')
+    database.init_db()
+    with database.connection() as conn:
+        conn.execute('SELECT 1')
+
+    pool = database._get_pool()
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with pool._lock:
+            locked.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    locked.wait()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            ok = False
+            try:
+                with database.connection() as conn:
+                    ok = conn.execute('SELECT COUNT(*) FROM cars').fetchone()[0] > 0
+            finally:
+                os._exit(0 if ok else 1)
+        # A child deadlocked in the at-fork hook is killed rather than hanging the test
+        deadline = time.monotonic() + 5
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done or time.monotonic() > deadline:
+                break
+            time.sleep(0.02)
+        if not done:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+    finally:
+        release.set()
+        holder.join()
+    assert done and os.waitstatus_to_exitcode(status) == 0, "the child must not wait for the parent's pool lock"
+
+    # The parent's pool is untouched
+    with database.connection() as conn:
+        assert conn.execute('SELECT 1').fetchone()[0] == 1
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_fork_while_pool_is_busy()
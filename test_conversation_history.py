@@ -0,0 +1,131 @@
+"""
+Test the append-only WhatsApp conversation store (no LLM needed)
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+import database
+
+
+def use_temp_database():
+    database.flush_conversations()
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_history.db')
+    database.init_db()
+
+
+def test_append_and_window():
+    """Appends keep order and reads return only the most recent window"""
+
+    print("=== Testing Conversation Append/Window ===\n")
+    use_temp_database()
+
+    phone = "whatsapp:+1234567890"
+    for i in range(15):
+        database.save_user_conversation(phone, f"question {i}", f"answer {i}")
+
+    history = database.get_user_conversation(phone)
+    print(f"Stored 30 messages, window returned {len(history)}")
+    assert len(history) == database.HISTORY_WINDOW
+    assert history[-1] == {"role": "assistant", "content": "answer 14"}
+    assert history[0] == {"role": "user", "content": "question 5"}
+
+    assert database.get_user_conversation(phone, limit=4)[0]["content"] == "question 13"
+    assert database.get_user_conversation("whatsapp:+0000000000") == []
+    print("=== Test Complete ===\n")
+
+
+def test_concurrent_appends():
+    """Racing webhooks for one number must not lose or interleave exchanges"""
+
+    print("=== Testing Concurrent Appends ===\n")
+    use_temp_database()
+
+    phone = "whatsapp:+1987654321"
+
+    def webhook(i):
+        for j in range(10):
+            database.save_user_conversation(phone, f"user {i}.{j}", f"bot {i}.{j}")
+
+    threads = [threading.Thread(target=webhook, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    history = database.get_user_conversation(phone, limit=1000)
+    print(f"8 threads x 10 exchanges -> {len(history)} messages")
+    assert len(history) == 160
+    for user, bot in zip(history[::2], history[1::2]):
+        assert user["role"] == "user" and bot["role"] == "assistant"
+        assert user["content"].split()[1] == bot["content"].split()[1]
+    print("=== Test Complete ===\n")
+
+
+def test_migrates_legacy_history():
+    """JSON history blobs from the old conversations table become message rows"""
+
+    print("=== Testing Legacy History Migration ===\n")
+    database.flush_conversations()
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_legacy.db')
+
+    legacy = sqlite3.connect(database.DB_NAME)
+    legacy.execute('''
+        CREATE TABLE conversations (
+            phone_number TEXT PRIMARY KEY,
+            history TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    old_history = [
+        {"role": "user", "content": "Hi, I need a car"},
+        {"role": "assistant", "content": "Hello! How many passengers?"},
+    ]
+    legacy.execute("INSERT INTO conversations (phone_number, history) VALUES (?, ?)",
+                   ("whatsapp:+15550000000", json.dumps(old_history)))
+    legacy.commit()
+    legacy.close()
+
+    database.init_db()
+    database.init_db()  # Running twice must not duplicate messages
+
+    history = database.get_user_conversation("whatsapp:+15550000000")
+    print(f"Migrated history: {history}")
+    assert history == old_history
+
+    database.save_user_conversation("whatsapp:+15550000000", "7 people", "Here are some options")
+    assert len(database.get_user_conversation("whatsapp:+15550000000")) == 4
+    print("=== Test Complete ===")
+
+
+def test_write_behind_reads_pending():
+    """Queued exchanges are visible before they are committed, then land on disk"""
+
+    print("=== Testing Write-Behind Conversation Writes ===\n")
+    use_temp_database()
+    database.CONVERSATION_WRITE_MODE = 'batched'
+
+    phone = "whatsapp:+14440000000"
+    for i in range(50):
+        database.save_user_conversation(phone, f"question {i}", f"answer {i}")
+        # Read-your-writes even if the batch has not been committed yet
+        assert database.get_user_conversation(phone)[-1]["content"] == f"answer {i}"
+
+    assert database.flush_conversations(timeout=5)
+    with database.connection() as conn:
+        stored = conn.execute('SELECT COUNT(*) FROM messages WHERE phone_number = ?',
+                              (phone,)).fetchone()[0]
+    stats = database.get_conversation_writer_stats()
+    print(f"Committed {stored} messages, writer stats: {stats}")
+    assert stored == 100
+    assert stats['batches'] <= stats['committed']
+    print("=== Test Complete ===\n")
+
+
+if __name__ == "__main__":
+    test_append_and_window()
+    test_concurrent_appends()
+    test_migrates_legacy_history()
+    test_write_behind_reads_pending()
@@ -0,0 +1,87 @@
+"""
+Test the prompt token budget and rolling history summaries
+"""
+import os
+import tempfile
+import time
+
+import database
+from history_budget import HistoryBudget, estimate_tokens, message_tokens, PROMPT_TOKEN_BUDGET
+
+SYSTEM_PROMPT = "You're a professional car rental assistant. " * 40
+
+
+def make_history(exchanges):
+    history = []
+    for i in range(exchanges):
+        history.append({"role": "user", "content": f"Message {i}: I need a car for {i % 8 + 1} people " * 5})
+        history.append({"role": "assistant", "content": f"Reply {i}: here are some options for you " * 25})
+    return history
+
+
+def summarize(previous, messages):
+    """Deterministic stand-in for the LLM summary: counts what it has seen"""
+    seen = int(previous.split()[1]) if previous else 0
+    return f"Covered {seen + len(messages)} messages"
+
+
+def prompt_tokens(summary, kept, user_message):
+    tokens = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user_message) + 8
+    tokens += sum(message_tokens(msg) for msg in kept)
+    return tokens + (estimate_tokens(summary) + 4 if summary else 0)
+
+
+def wait_for_summaries(budget, count):
+    deadline = time.time() + 5
+    while budget.stats['summaries'] < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_whatsapp_rolling_summary():
+    """Long WhatsApp chats stay under budget and the summary rolls forward on the conversation row"""
+
+    print("=== Testing Token Budget (WhatsApp) ===\n")
+    database.flush_conversations()
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_budget.db')
+    database.init_db()
+    database.CONVERSATION_WRITE_MODE = 'sync'
+
+    phone = "whatsapp:+15551230000"
+    budget = HistoryBudget(summarize)
+    for i in range(30):
+        database.save_user_conversation(phone, *[msg['content'] for msg in make_history(i + 1)[-2:]])
+        history = database.get_user_conversation(phone)
+        summary, kept = budget.prepare(SYSTEM_PROMPT, history, "Any SUVs?", phone_number=phone)
+        assert prompt_tokens(summary, kept, "Any SUVs?") <= PROMPT_TOKEN_BUDGET
+        wait_for_summaries(budget, budget.stats['summaries'] + (len(kept) < len(history)))
+
+    summary, fingerprint = database.get_conversation_summary(phone)
+    stats = budget.get_stats()
+    print(f"Stored summary: {summary!r}")
+    print(f"Prompt tokens per request: {stats['avg_tokens_before']:.0f} -> {stats['avg_tokens_after']:.0f}")
+    assert summary and fingerprint
+    assert stats['tokens_after'] < stats['tokens_before']
+    print("=== Test Complete ===\n")
+
+
+def test_web_history_summary():
+    """Web histories (sent by the browser) reuse their in-memory summary on the next turn"""
+
+    print("=== Testing Token Budget (web) ===\n")
+    budget = HistoryBudget(summarize)
+    history = make_history(40)
+    summary, kept = budget.prepare(SYSTEM_PROMPT, history, "Hello")
+    assert summary is None and len(kept) < len(history)
+    wait_for_summaries(budget, 1)
+
+    history += make_history(1)
+    summary, kept = budget.prepare(SYSTEM_PROMPT, history, "Hello")
+    print(f"Summary: {summary!r}, kept {len(kept)} of {len(history)} messages")
+    assert summary is not None
+    assert prompt_tokens(summary, kept, "Hello") <= PROMPT_TOKEN_BUDGET
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_whatsapp_rolling_summary()
+    test_web_history_summary()
@@ -0,0 +1,86 @@
+"""
+Test the shared HTTP client pool: keep-alive reuse, per-loop async pools and fork safety
+"""
+import asyncio
+import os
+
+import http_clients
+from stand_in_server import StandInLLM
+
+BODY = {'model': 'gpt-4o-mini', 'messages': [], 'max_tokens': 5}
+
+
+def local_host_stats():
+    """Counters for the stand-in's host; they are process-global, so tests compare deltas"""
+    host = http_clients.get_stats()['hosts'].get('127.0.0.1', {})
+    return {key: host.get(key, 0) for key in ('requests', 'new_connections')}
+
+
+def delta(before):
+    after = local_host_stats()
+    return {key: after[key] - before[key] for key in before}
+
+
+def test_connection_reuse():
+    """Ten calls to the same host open one connection"""
+
+    print("=== Testing Connection Reuse ===\n")
+    llm = StandInLLM(ttft=0.0, tokens_per_sec=10_000).start()
+    client = http_clients.get_http_client()
+    before = local_host_stats()
+    for _ in range(10):
+        response = client.post(f"{llm.base_url}/chat/completions", json=BODY)
+        assert response.status_code == 200
+
+    host = delta(before)
+    print(f"Stats: {host}\n")
+    assert host['requests'] == 10 and host['new_connections'] == 1
+
+    # Each event loop gets its own pool; the client object is shared
+    async def burst():
+        async_client = http_clients.get_async_http_client()
+        for _ in range(5):
+            response = await async_client.post(f"{llm.base_url}/chat/completions", json=BODY)
+            assert response.status_code == 200
+
+    asyncio.run(burst())
+    asyncio.run(burst())
+    host = delta(before)
+    print(f"After two event loops: {host}\n")
+    assert host['requests'] == 20 and host['new_connections'] == 3
+    llm.stop()
+    print("=== Test Complete ===\n")
+
+
+def test_fork_opens_new_connections():
+    """A forked worker never reuses the parent's sockets"""
+
+    print("=== Testing Fork Safety ===\n")
+    if not hasattr(os, 'fork'):
+        print("Skipped: no fork() on this platform\n")
+        return
+    llm = StandInLLM(ttft=0.0, tokens_per_sec=10_000).start()
+    client = http_clients.get_http_client()
+    client.post(f"{llm.base_url}/chat/completions", json=BODY)
+
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            response = client.post(f"{llm.base_url}/chat/completions", json=BODY)
+            host = http_clients.get_stats()['hosts']['127.0.0.1']
+            ok = response.status_code == 200 and host == {**host, 'requests': 1, 'new_connections': 1}
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0, "child must open its own connection"
+
+    # The parent's connection is still usable
+    assert client.post(f"{llm.base_url}/chat/completions", json=BODY).status_code == 200
+    llm.stop()
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_connection_reuse()
+    test_fork_opens_new_connections()
@@ -0,0 +1,129 @@
+"""
+Test the fleet importer: broken feeds and partial feeds must not damage the stored fleet
+"""
+import csv
+import json
+import os
+import tempfile
+
+import database
+from import_fleet import FleetImporter, read_feed
+
+COLUMNS = ['id', 'make', 'model', 'year', 'category', 'daily_price', 'passengers', 'luggage',
+           'transmission', 'fuel_type', 'features']
+
+
+def use_fresh_database():
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_import_fleet.db')
+    database.init_db()
+
+
+def stored_cars():
+    with database.connection() as conn:
+        return {row['id']: dict(row) for row in conn.execute('SELECT * FROM cars')}
+
+
+def write_feed(rows, header):
+    path = os.path.join(tempfile.mkdtemp(), 'fleet.csv')
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def run_import(path, **options):
+    conn = database.get_connection()
+    try:
+        return FleetImporter(conn, **options).run(read_feed(path))
+    finally:
+        conn.close()
+
+
+def test_broken_feed_deactivates_nothing():
+    """A misspelt header makes every row invalid; the fleet stays online"""
+
+    print("=== Testing a broken feed ===\n")
+    use_fresh_database()
+    before = stored_cars()
+    rows = [dict(car, price=car['daily_price']) for car in before.values()]
+    header = [('price' if column == 'daily_price' else column) for column in COLUMNS]
+    stats = run_import(write_feed(rows, header))
+    print(f"Stats: {stats}")
+    assert stats['invalid'] == len(before) and stats['deactivated'] == 0
+    assert all(car['available'] for car in stored_cars().values())
+
+    # One bad row among good ones also keeps missing cars online, unless forced
+    good = list(before.values())[:10]
+    rows = good + [dict(good[0], id=999, category='Spaceship')]
+    stats = run_import(write_feed(rows, COLUMNS))
+    assert stats['invalid'] == 1 and stats['deactivated'] == 0
+    stats = run_import(write_feed(rows, COLUMNS), force_deactivate=True)
+    assert stats['deactivated'] == len(before) - 10
+    print("\n=== Test Complete ===\n")
+
+
+def test_partial_feed_keeps_missing_columns():
+    """Columns the feed does not have (image_url, available) keep their stored values"""
+
+    print("=== Testing a feed without image_url ===\n")
+    use_fresh_database()
+    before = stored_cars()
+    rows = [dict(car) for car in before.values()]
+    rows[0]['daily_price'] = 999.0
+    new_car = dict(rows[1], id=500, model='Prototype')
+    stats = run_import(write_feed(rows + [new_car], COLUMNS))
+    print(f"Stats: {stats}")
+    assert stats['updated'] == 1 and stats['inserted'] == 1 and stats['deactivated'] == 0
+
+    after = stored_cars()
+    assert after[rows[0]['id']]['daily_price'] == 999.0
+    assert all(after[car_id]['image_url'] == car['image_url'] for car_id, car in before.items()), \
+        "images survive a feed without an image_url column"
+    assert after[500]['image_url'] is None and after[500]['available'] == 1
+    print("\n=== Test Complete ===\n")
+
+
+def test_returning_car_is_reactivated():
+    """A car missing one night and back the next is available again"""
+
+    print("=== Testing a returning car ===\n")
+    use_fresh_database()
+    rows = list(stored_cars().values())
+    stats = run_import(write_feed(rows[1:], COLUMNS))
+    assert stats['deactivated'] == 1 and stored_cars()[rows[0]['id']]['available'] == 0
+
+    stats = run_import(write_feed(rows, COLUMNS))
+    print(f"Stats: {stats}")
+    assert stats['updated'] == 1 and stats['deactivated'] == 0
+    assert all(car['available'] for car in stored_cars().values())
+    print("\n=== Test Complete ===\n")
+
+
+def test_malformed_jsonl_lines_are_skipped():
+    """Broken JSON and non-object lines count as invalid; the rest of the feed applies"""
+
+    print("=== Testing malformed JSONL ===\n")
+    use_fresh_database()
+    before = stored_cars()
+    rows = [{column: car[column] for column in COLUMNS} for car in before.values()]
+    rows[-1]['daily_price'] = 1.5
+    path = os.path.join(tempfile.mkdtemp(), 'fleet.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, row in enumerate(rows):
+            if i == 2:
+                f.write('{"id": 3, "make": \n')
+                f.write('[1, 2, 3]\n')
+            f.write(json.dumps(row) + '\n')
+    stats = run_import(path)
+    print(f"Stats: {stats}")
+    assert stats['invalid'] == 2 and stats['updated'] == 1 and stats['deactivated'] == 0
+    assert stored_cars()[rows[-1]['id']]['daily_price'] == 1.5
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_broken_feed_deactivates_nothing()
+    test_partial_feed_keeps_missing_columns()
+    test_returning_car_is_reactivated()
+    test_malformed_jsonl_lines_are_skipped()
@@ -0,0 +1,64 @@
+"""
+Test the local fast-path parser against a small recorded-style corpus
+"""
+import os
+import tempfile
+
+import database
+from local_parser import parse_message, report
+
+# (message, expected action_type or None for "goes to the LLM", expected criteria)
+CORPUS = [
+    ("Hi", 'direct_response', None),
+    ("Good afternoon!", 'direct_response', None),
+    ("What cars do you have?", 'get_inventory', None),
+    ("show me SUVs under 300 AED for 7 people", 'search_cars', {'max_price': 300, 'min_passengers': 7}),
+    ("Economy cars under $50 a day", 'search_cars', {'max_price': 184, 'category': 'Economy'}),
+    ("any electric cars?", 'search_cars', {'fuel_type': 'Electric'}),
+    ("minivan for 8", 'search_cars', {'min_passengers': 8, 'category': 'Minivan'}),
+    ("a 7 seater please", 'search_cars', {'min_passengers': 7}),
+    ("compact SUV with sunroof", 'search_cars', {'category': 'Compact SUV', 'required_features': ['Sunroof']}),
+    ("I need a car", None, None),
+    ("under 300", None, None),
+    ("I need an SUV from the 12th to the 15th", None, None),
+    ("no SUVs please", None, None),
+    ("SUV or minivan", None, None),
+    ("I'll take the Toyota Corolla", None, None),
+    ("for 5 days", None, None),
+]
+
+
+def test_corpus():
+    """Confident messages are parsed locally with the right criteria; the rest go to the LLM"""
+
+    print("=== Testing Local Parser ===\n")
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_parser.db')
+    database.init_db()
+
+    for message, expected_action, expected_criteria in CORPUS:
+        parsed = parse_message(message)
+        action = parsed.action.action_type if parsed else None
+        assert action == expected_action, f"{message!r}: got {action}, expected {expected_action}"
+        if expected_criteria is not None:
+            criteria = parsed.action.search_criteria.model_dump(exclude_none=True)
+            assert criteria == expected_criteria, f"{message!r}: got {criteria}"
+
+    suvs = parse_message("show me SUVs")
+    assert {c.value for c in suvs.categories} == {'Compact SUV', 'Mid-Size SUV', 'Full-Size SUV'}
+
+    # Follow-ups go to the LLM, which sees the dates and passengers given earlier
+    greeted = [{"role": "user", "content": "Hello!"}, {"role": "assistant", "content": "Hello! How can I help?"}]
+    assert parse_message("any electric cars?", greeted).action.action_type == 'search_cars'
+    history = greeted + [{"role": "user", "content": "We are 5, from the 12th to the 15th"},
+                         {"role": "assistant", "content": "Great, what kind of car?"}]
+    assert parse_message("any electric cars?", history) is None
+    assert parse_message("any electric cars?", history, strict=False) is not None
+
+    print()
+    kinds = report([message for message, _, _ in CORPUS], llm_ms=1500)
+    assert kinds['llm'] == 7
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_corpus()
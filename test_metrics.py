@@ -0,0 +1,60 @@
+"""
+Test stage spans, histograms and the Prometheus rendering
+"""
+import os
+import tempfile
+
+import database
+import metrics
+
+
+def test_histogram_buckets():
+    """Observations land in cumulative buckets with a sum and count"""
+
+    print("=== Testing Histogram ===\n")
+    histogram = metrics.Histogram('test_seconds', "Test latencies", 'stage', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, 'router')
+    lines = []
+    histogram.render(lines)
+    print("\n".join(lines) + "\n")
+    assert 'test_seconds_bucket{stage="router",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{stage="router",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{stage="router",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="router"} 4' in lines
+    assert 'test_seconds_sum{stage="router"} 3.650000' in lines
+    print("=== Test Complete ===\n")
+
+
+def test_spans_and_render():
+    """Spans feed the stage histogram; slow requests print their breakdown"""
+
+    print("=== Testing Spans ===\n")
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_metrics.db')
+    database.init_db()
+
+    metrics.SLOW_REQUEST_MS = 0  # print the breakdown for this request
+    with metrics.request_span('whatsapp'):
+        with metrics.span('load_history'):
+            database.get_user_conversation('whatsapp:+15550001111')
+        with metrics.span('tool'):
+            database.search_cars({'category': 'Economy'})
+        database.save_user_conversation('whatsapp:+15550001111', 'Hi', 'Hello!')
+    database.flush_conversations()
+
+    text = metrics.render()
+    print("\n" + "\n".join(line for line in text.splitlines() if '_count' in line or 'cache' in line) + "\n")
+    assert 'chatbot_request_seconds_count{endpoint="whatsapp"} 1' in text
+    for stage in ('load_history', 'tool', 'sqlite_commit'):
+        assert f'chatbot_stage_seconds_count{{stage="{stage}"}}' in text, stage
+    assert 'chatbot_inventory_cache_misses_total' in text
+    # Every sample line is "name{labels} value" or "name value"
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            float(line.rsplit(' ', 1)[1])
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_histogram_buckets()
+    test_spans_and_render()
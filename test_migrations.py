@@ -0,0 +1,110 @@
+"""
+Test the migration runner on fresh and legacy databases
+"""
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import closing, contextmanager
+
+import database
+import migrations
+
+
+@contextmanager
+def temp_database(name):
+    """Point the database module at a new file for the block, then back"""
+    saved = database.DB_NAME
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), name)
+    try:
+        yield
+    finally:
+        database.DB_NAME = saved
+
+
+def test_fresh_database():
+    """A new database is created, seeded and converted exactly once"""
+
+    print("=== Testing Fresh Database Migration ===\n")
+    with temp_database('test_migrations.db'):
+        planned = migrations.migrate(dry_run=True)
+        assert len(planned) == migrations.LATEST_VERSION
+        with closing(database.get_connection()) as conn:
+            assert not conn.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'cars'").fetchone(), "dry run left tables behind"
+
+        database.init_db()
+        database.init_db()
+        with database.connection() as conn:
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == migrations.LATEST_VERSION
+            prices = [row[0] for row in conn.execute('SELECT daily_price FROM cars ORDER BY id')]
+            missing_images = conn.execute('SELECT COUNT(*) FROM cars WHERE image_url IS NULL').fetchone()[0]
+    print(f"Seeded {len(prices)} cars, cheapest AED {min(prices):.2f}")
+    assert prices[0] == round(35.00 * migrations.USD_TO_AED, 2)
+    assert missing_images == 0
+    print("=== Test Complete ===\n")
+
+
+def create_legacy_database():
+    """A pre-framework database at DB_NAME: no image_url column, prices already in AED"""
+    # The original cars table had no image_url column
+    legacy = sqlite3.connect(database.DB_NAME)
+    legacy.execute('''
+        CREATE TABLE cars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, make TEXT NOT NULL, model TEXT NOT NULL,
+            year INTEGER NOT NULL, category TEXT NOT NULL, daily_price REAL NOT NULL,
+            passengers INTEGER NOT NULL, luggage INTEGER NOT NULL, transmission TEXT NOT NULL,
+            fuel_type TEXT NOT NULL, features TEXT NOT NULL, available BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    legacy.execute('''
+        INSERT INTO cars (make, model, year, category, daily_price, passengers, luggage,
+                          transmission, fuel_type, features)
+        VALUES ('Toyota', 'Corolla', 2024, 'Economy', 128.45, 5, 2, 'Automatic', 'Gasoline', ?),
+               ('BMW', '3 Series', 2024, 'Luxury', 348.65, 5, 2, 'Automatic', 'Gasoline', ?),
+               ('Kia', 'Picanto', 2023, 'Economy', 89.00, 4, 1, 'Automatic', 'Gasoline', ?)
+    ''', (json.dumps(['Bluetooth']), json.dumps(['Sunroof']), json.dumps([])))
+    legacy.commit()
+    legacy.close()
+
+
+def test_legacy_database():
+    """A pre-framework database keeps its data; prices already in AED are not converted again"""
+
+    print("=== Testing Legacy Database Migration ===\n")
+    with temp_database('test_legacy_schema.db'):
+        create_legacy_database()
+        database.init_db()
+        cars = {car['model']: car for car in database.get_all_cars()}
+        print(f"Migrated cars: {[(c['model'], c['daily_price'], c['features']) for c in cars.values()]}")
+        assert len(cars) == 3, "seed data must not be added to an existing fleet"
+        assert cars['Corolla']['daily_price'] == 128.45
+        assert cars['Picanto']['daily_price'] == 89.00, "cheap AED cars are not taken for USD"
+        assert cars['3 Series']['image_url'] == migrations.CATEGORY_IMAGES['Luxury']
+        assert database.search_cars({'required_features': ['sunroof']})[0]['model'] == '3 Series'
+    print("=== Test Complete ===\n")
+
+
+def test_legacy_usd_database():
+    """LEGACY_PRICE_CURRENCY=USD converts a pre-framework fleet once"""
+
+    print("=== Testing Legacy USD Database Migration ===\n")
+    with temp_database('test_legacy_usd.db'):
+        create_legacy_database()
+        migrations.LEGACY_PRICE_CURRENCY = 'USD'
+        try:
+            database.init_db()
+        finally:
+            migrations.LEGACY_PRICE_CURRENCY = 'AED'
+        database.init_db()
+        cars = {car['model']: car for car in database.get_all_cars()}
+    print(f"Converted prices: {[(c['model'], c['daily_price']) for c in cars.values()]}")
+    assert cars['Picanto']['daily_price'] == round(89.00 * migrations.USD_TO_AED, 2)
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_fresh_database()
+    test_legacy_database()
+    test_legacy_usd_database()
@@ -0,0 +1,93 @@
+"""
+Test per-stage model tiering: budget downgrades, recovery probes and counters
+"""
+import os
+from types import SimpleNamespace
+
+import model_tiers
+from model_tiers import ModelTiers, print_stats
+
+
+def fake_call(tiers, stage, latency_ms, usage=None):
+    """Record one call of `stage` that took `latency_ms`; returns the model used"""
+    with tiers.track(stage) as call:
+        call.started -= latency_ms / 1000
+        call.usage = usage
+    return call.model
+
+
+def test_downgrade_and_recovery():
+    """A slow primary switches the stage to its fallback until a probe finds it fast again"""
+
+    print("=== Testing Budget Downgrade ===\n")
+    tiers = ModelTiers(stages={'responder': ('gpt-4', 'gpt-4o-mini', 2500)}, probe_every=5)
+
+    models = [fake_call(tiers, 'responder', 1000) for _ in range(3)]
+    assert models == ['gpt-4'] * 3
+
+    # A latency spike pushes the moving average over budget
+    assert fake_call(tiers, 'responder', 9000) == 'gpt-4'
+    assert tiers.get_stats()['responder']['active'] == 'gpt-4o-mini'
+
+    # Fallback calls don't move the primary's average; every 5th call probes it
+    models = [fake_call(tiers, 'responder', 800) for _ in range(5)]
+    print(f"While downgraded: {models}")
+    assert models == ['gpt-4o-mini'] * 4 + ['gpt-4']
+
+    # Probes at normal latency bring the average back under budget
+    for _ in range(30):
+        fake_call(tiers, 'responder', 500)
+    stats = tiers.get_stats()
+    print(f"Average after recovery: {stats['responder']['average_ms']:.0f} ms\n")
+    assert stats['responder']['active'] == 'gpt-4'
+    assert fake_call(tiers, 'responder', 500) == 'gpt-4'
+    print("=== Test Complete ===\n")
+
+
+def test_counters():
+    """Latency, errors, tokens and cost are counted per stage and model"""
+
+    print("=== Testing Stage Counters ===\n")
+    tiers = ModelTiers(stages={'router': ('gpt-4o-mini', None, 1500), 'summary': ('gpt-4o-mini', None, None)})
+    usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100)
+    fake_call(tiers, 'router', 400, usage)
+    fake_call(tiers, 'router', 2000, usage)
+    try:
+        with tiers.track('router'):
+            raise TimeoutError("stand-in timeout")
+    except TimeoutError:
+        pass
+    fake_call(tiers, 'summary', 3000)
+
+    stats = tiers.get_stats()
+    print_stats(stats)
+    router = stats['router']['models']['gpt-4o-mini']
+    assert router['calls'] == 3 and router['errors'] == 1 and router['over_budget'] == 1
+    assert router['prompt_tokens'] == 2000 and router['completion_tokens'] == 200
+    assert abs(router['cost_usd'] - 2 * (1000 * 0.15 + 100 * 0.6) / 1e6) < 1e-9
+    # No fallback and no budget: nothing to downgrade to
+    assert stats['router']['active'] == 'gpt-4o-mini'
+    assert stats['summary']['models']['gpt-4o-mini']['over_budget'] == 0
+    print("\n=== Test Complete ===\n")
+
+
+def test_environment_overrides():
+    """<STAGE>_MODEL, <STAGE>_FALLBACK_MODEL and <STAGE>_BUDGET_MS override the defaults"""
+
+    print("=== Testing Environment Overrides ===\n")
+    os.environ.update(ROUTER_MODEL='gpt-4o', ROUTER_FALLBACK_MODEL='gpt-4o-mini', ROUTER_BUDGET_MS='900')
+    try:
+        stages = model_tiers.load_stages()
+    finally:
+        for name in ('ROUTER_MODEL', 'ROUTER_FALLBACK_MODEL', 'ROUTER_BUDGET_MS'):
+            del os.environ[name]
+    print(f"Stages: {stages}\n")
+    assert stages['router'] == ('gpt-4o', 'gpt-4o-mini', 900.0)
+    assert stages['responder'] == model_tiers.DEFAULT_STAGES['responder']
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_downgrade_and_recovery()
+    test_counters()
+    test_environment_overrides()
@@ -0,0 +1,134 @@
+"""
+Test request deadlines, circuit breakers and the degraded local parse
+"""
+import os
+import tempfile
+import time
+
+import database
+from local_parser import parse_message
+from resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded
+
+
+def test_deadline_budget():
+    """Budgets shrink with the time left, keep the reserve, and run out"""
+
+    print("=== Testing Deadline ===\n")
+    deadline = Deadline(3)
+    budget = deadline.budget(cap=10, reserve=1)
+    print(f"Budget with 1s reserve: {budget:.2f}s")
+    assert 1.9 < budget <= 2.0
+    assert deadline.budget(cap=0.8) == 0.8
+    try:
+        deadline.budget(reserve=2.8)
+    except DeadlineExceeded as e:
+        print(f"Out of time: {e}")
+    else:
+        raise AssertionError("a stage with 0.2s left should not start")
+    print("\n=== Test Complete ===\n")
+
+
+def fail(breaker):
+    try:
+        with breaker.call():
+            raise TimeoutError("upstream timed out")
+    except TimeoutError:
+        pass
+
+
+def test_circuit_breaker():
+    """Sustained failures open the circuit; a successful probe closes it"""
+
+    print("=== Testing CircuitBreaker ===\n")
+    breaker = CircuitBreaker('test', min_calls=4, failure_ratio=0.5, open_seconds=0.2)
+    with breaker.call():
+        pass
+    for _ in range(2):
+        fail(breaker)
+    assert breaker.state == 'closed', "2 failures in 3 calls is below min_calls"
+    fail(breaker)
+    assert breaker.state == 'open'
+
+    try:
+        with breaker.call():
+            raise AssertionError("an open circuit must not call the upstream")
+    except CircuitOpenError as e:
+        print(f"Refused: {e}")
+
+    time.sleep(0.25)
+    assert breaker.allow(), "the first call after the cool-down is the probe"
+    assert not breaker.allow(), "only one probe at a time"
+    breaker.record(False)
+    assert breaker.state == 'open', "a failed probe reopens the circuit"
+
+    time.sleep(0.25)
+    with breaker.call():
+        pass
+    stats = breaker.get_stats()
+    print(f"Stats: {stats}")
+    assert stats['state'] == 'closed'
+    assert stats['trips'] == 2 and stats['rejected'] == 2
+    print("\n=== Test Complete ===\n")
+
+
+def test_slow_calls_trip():
+    """Calls that succeed but exceed slow_call_seconds count as failures"""
+
+    print("=== Testing slow calls ===\n")
+    breaker = CircuitBreaker('slow', slow_call_seconds=1.0, min_calls=3, failure_ratio=0.6)
+    for seconds in (0.2, 4.0, 6.0):
+        breaker.record(True, seconds)
+    stats = breaker.get_stats()
+    print(f"Stats: {stats}")
+    assert stats['state'] == 'open' and stats['slow'] == 2
+    print("\n=== Test Complete ===\n")
+
+
+def test_degraded_parse():
+    """With strict=False, filters are used even when the rest is not understood"""
+
+    print("=== Testing degraded parsing ===\n")
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_resilience.db')
+    database.init_db()
+
+    message = "my wife and kids are coming, we need an SUV for 5 people under 400 AED from friday"
+    assert parse_message(message) is None, "the fast path leaves this to the LLM"
+    parsed = parse_message(message, strict=False)
+    criteria = parsed.action.search_criteria.model_dump(exclude_none=True)
+    print(f"{message!r} -> {criteria}")
+    assert parsed.action.action_type == 'search_cars'
+    assert criteria == {'max_price': 400, 'min_passengers': 5} and len(parsed.categories) == 3
+    assert parse_message("I'll take the first one", strict=False) is None
+    print("\n=== Test Complete ===")
+
+
+def test_router_keeps_deadline():
+    """A slow upstream costs the router one attempt, within the deadline"""
+
+    print("=== Testing the router against a slow upstream ===\n")
+    from stand_in_server import StandInLLM
+    llm = StandInLLM(ttft=0.0, tokens_per_sec=10_000).start()
+    os.environ['OPENAI_BASE_URL'] = llm.base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'stand-in')
+    try:
+        import chatbot
+        bot = chatbot.CarRentalChatbot()
+        llm.slow_next(3, seconds=3.0)
+        start = time.perf_counter()
+        action = bot.route([{"role": "user", "content": "Show me economy cars"}], Deadline(4))
+        elapsed = time.perf_counter() - start
+        print(f"Router gave up after {elapsed:.2f}s with {llm.stats['requests']} request(s)")
+        assert action is None and elapsed < 4
+        assert llm.stats['requests'] == 1, "no retries inside the deadline"
+    finally:
+        llm.clear_script()
+        llm.stop()
+    print("\n=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_deadline_budget()
+    test_circuit_breaker()
+    test_slow_calls_trip()
+    test_degraded_parse()
+    test_router_keeps_deadline()
@@ -0,0 +1,105 @@
+"""
+Test the reply cache: LRU/TTL/size bounds, SQLite persistence and
+invalidation when the inventory changes
+"""
+import os
+import tempfile
+import time
+
+import database
+from response_cache import MemoryResponseCache, SQLiteResponseCache, ResponseCache, cache_key
+
+
+def test_memory_bounds():
+    """Entries are evicted least-recently-used first to stay under max_bytes, and expire after ttl"""
+
+    print("=== Testing Memory Cache Bounds ===\n")
+    cache = MemoryResponseCache(max_bytes=3 * (64 + 100), ttl=0.2)
+    keys = [cache_key(f"message {i}", [], 'ctx') for i in range(4)]
+    for key in keys[:3]:
+        cache.put(key, 'x' * 100, [1, 1])
+    assert cache.get(keys[0]) is not None  # keys[0] is now most recently used
+    cache.put(keys[3], 'x' * 100, [1, 1])
+    assert cache.get(keys[1]) is None, "least recently used entry should be evicted"
+    assert cache.get(keys[0]) is not None
+    print(f"After eviction: {cache.size()[0]} entries, {cache.size()[1]} bytes, {cache.stats}")
+    assert cache.size()[1] <= cache.max_bytes
+
+    time.sleep(0.25)
+    assert cache.get(keys[0]) is None
+    assert cache.stats['expired'] == 1
+    print("=== Test Complete ===\n")
+
+
+def test_key_normalization():
+    """Case, spacing and trailing punctuation don't split the cache; context does"""
+
+    print("=== Testing Key Normalization ===\n")
+    assert cache_key("Hi!", [], 'ctx') == cache_key("  hi ", [], 'ctx')
+    assert cache_key("Hi", [], 'ctx') != cache_key("Hi", [], 'other prompt')
+    history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hello! How can I help?"}]
+    assert cache_key("Yes", history, 'ctx') != cache_key("Yes", [], 'ctx')
+    print("=== Test Complete ===\n")
+
+
+def test_sqlite_persists_and_invalidates():
+    """A SQLite-backed cache survives reopening; inventory changes purge stale replies"""
+
+    print("=== Testing SQLite Cache and Inventory Invalidation ===\n")
+    tmp_dir = tempfile.mkdtemp()
+    database.DB_NAME = os.path.join(tmp_dir, 'test_response_cache.db')
+    database.init_db()
+    path = os.path.join(tmp_dir, 'responses.db')
+
+    cache = ResponseCache(SQLiteResponseCache(path))
+    key, versions, cached = cache.lookup("What cars do you have?", [], 'ctx')
+    assert cached is None
+    cache.store(key, versions, "Here are our cars...")
+
+    # A restarted process finds the reply
+    cache = ResponseCache(SQLiteResponseCache(path))
+    _, _, cached = cache.lookup("what cars do you have", [], 'ctx')
+    assert cached == "Here are our cars..."
+
+    with database.connection() as conn:
+        conn.execute("UPDATE cars SET daily_price = daily_price + 10 WHERE model = 'Corolla'")
+        conn.commit()
+    database.invalidate_inventory()
+
+    _, _, cached = cache.lookup("What cars do you have?", [], 'ctx')
+    stats = cache.get_stats()
+    print(f"After price change: cached={cached!r}, stats={stats}")
+    assert cached is None
+    assert stats['purged'] == 1 and stats['entries'] == 0
+    assert stats['hit_rate'] == 0.5
+    print("=== Test Complete ===\n")
+
+
+def test_only_openers_are_cached():
+    """Turns after a longer history, or with a summary, never share a cached reply"""
+
+    print("=== Testing Which Turns Are Cached ===\n")
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_response_cache.db')
+    database.init_db()
+    cache = ResponseCache(MemoryResponseCache())
+    opener = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello! How can I help?"}]
+    key, versions, _ = cache.lookup("What cars do you have?", opener, 'ctx')
+    assert key is not None
+    cache.store(key, versions, "Here are our cars...")
+
+    # Same last exchange, different earlier turns: not cacheable
+    later = [{"role": "user", "content": "SUVs for 7 from the 12th"},
+             {"role": "assistant", "content": "Here are the SUVs..."}] + opener
+    assert cache.lookup("What cars do you have?", later, 'ctx') == (None, None, None)
+    assert cache.lookup("What cars do you have?", opener, 'ctx', summarized=True) == (None, None, None)
+    cache.store(None, None, "not stored")
+    assert cache.get_stats()['entries'] == 1
+    assert cache.lookup("What cars do you have?", opener, 'ctx')[2] == "Here are our cars..."
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_memory_bounds()
+    test_key_normalization()
+    test_sqlite_persists_and_invalidates()
+    test_only_openers_are_cached()
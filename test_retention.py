@@ -0,0 +1,158 @@
+"""
+Test conversation retention: archiving, deleting, crash recovery and the worker
+"""
+import gzip
+import json
+import os
+import tempfile
+import time
+
+import database
+import retention
+
+
+def use_fresh_database(idle=3, active=2):
+    """Fresh database with `idle` conversations 40 days old and `active` recent ones"""
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_retention.db')
+    database.CONVERSATION_WRITE_MODE = 'sync'
+    database.init_db()
+    for i in range(idle + active):
+        database.save_user_conversation(f'whatsapp:+1000000{i:04d}', f"Hello {i}", f"Hello! ({i})")
+    with database.connection() as conn:
+        conn.execute("UPDATE conversations SET updated_at = datetime('now', '-40 days') WHERE rowid <= ?",
+                     (idle,))
+        conn.commit()
+    return tempfile.mkdtemp()
+
+
+def archived_records(archive_dir):
+    records = []
+    for name in sorted(os.listdir(archive_dir)):
+        assert not name.endswith(retention.PARTIAL_SUFFIX), f"left behind {name}"
+        with gzip.open(os.path.join(archive_dir, name), 'rt', encoding='utf-8') as archive:
+            records += [json.loads(line) for line in archive]
+    return records
+
+
+def remaining_conversations():
+    with database.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+
+
+def test_archive_and_delete():
+    """Idle conversations move to the archive with their messages; recent ones stay"""
+
+    print("=== Testing archiving ===\n")
+    archive_dir = use_fresh_database()
+    assert retention.archive_idle_conversations(ttl_days=30, archive_dir=archive_dir, batch_size=2) == 3
+    records = archived_records(archive_dir)
+    print(f"Archived {[record['phone_number'] for record in records]}")
+    assert len(records) == 3 and len(os.listdir(archive_dir)) == 2
+    assert [m['role'] for m in records[0]['messages']] == ['user', 'assistant']
+    assert remaining_conversations() == 2
+    assert database.get_user_conversation(records[0]['phone_number']) == []
+    assert retention.archive_idle_conversations(ttl_days=30, archive_dir=archive_dir) == 0
+    print("\n=== Test Complete ===\n")
+
+
+def test_failed_commit_is_archived_once():
+    """A batch that fails to commit leaves no file, and is archived once on the next run"""
+
+    print("=== Testing a failed batch ===\n")
+    archive_dir = use_fresh_database()
+    with database.connection() as conn:
+        conn.execute("CREATE TRIGGER fail_delete BEFORE DELETE ON conversations "
+                     "BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+        conn.commit()
+    try:
+        retention.archive_idle_conversations(ttl_days=30, archive_dir=archive_dir)
+    except Exception as e:
+        print(f"Batch failed: {e}")
+    else:
+        raise AssertionError("the delete should have failed")
+    assert os.listdir(archive_dir) == [] and remaining_conversations() == 5
+
+    with database.connection() as conn:
+        conn.execute('DROP TRIGGER fail_delete')
+        conn.commit()
+    assert retention.archive_idle_conversations(ttl_days=30, archive_dir=archive_dir) == 3
+    assert len(archived_records(archive_dir)) == 3
+    print("\n=== Test Complete ===\n")
+
+
+def test_partial_files_are_settled():
+    """After a crash, committed batches keep their file and uncommitted ones lose it"""
+
+    print("=== Testing crash recovery ===\n")
+    archive_dir = use_fresh_database(idle=2)
+    with database.connection() as conn:
+        rows = conn.execute('SELECT phone_number, updated_at FROM conversations ORDER BY rowid').fetchall()
+        # Crashed before its commit: the conversation is still in the database
+        retention._write_archive(conn, rows[:1], os.path.join(archive_dir, 'a.jsonl.gz.partial'))
+        # Crashed after its commit: only the partial file holds the conversation
+        retention._write_archive(conn, rows[1:2], os.path.join(archive_dir, 'b.jsonl.gz.partial'))
+        conn.execute('DELETE FROM messages WHERE phone_number = ?', (rows[1]['phone_number'],))
+        conn.execute('DELETE FROM conversations WHERE phone_number = ?', (rows[1]['phone_number'],))
+        conn.commit()
+
+    assert retention.archive_idle_conversations(ttl_days=30, archive_dir=archive_dir) == 1
+    phones = sorted(record['phone_number'] for record in archived_records(archive_dir))
+    print(f"Archive holds {phones}")
+    assert phones == sorted([rows[0]['phone_number'], rows[1]['phone_number']]), "each conversation exactly once"
+    print("\n=== Test Complete ===\n")
+
+
+def test_recovery_renames_first():
+    """Another worker settling this run's file right after the commit is not an error"""
+
+    print("=== Testing a concurrent recovery ===\n")
+    archive_dir = use_fresh_database()
+    replace = os.replace
+
+    def recover_then_replace(src, dst):
+        retention.os.replace = replace
+        if src.endswith(retention.PARTIAL_SUFFIX):
+            with database.connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                retention.recover_partial_archives(conn, archive_dir)
+                conn.rollback()
+        replace(src, dst)
+
+    retention.os.replace = recover_then_replace
+    try:
+        assert retention.archive_idle_conversations(ttl_days=30, archive_dir=archive_dir) == 3
+    finally:
+        retention.os.replace = replace
+    assert len(archived_records(archive_dir)) == 3
+    print("\n=== Test Complete ===\n")
+
+
+def test_worker_runs_retention():
+    """The background worker archives and prunes on its own"""
+
+    print("=== Testing RetentionWorker ===\n")
+    archive_dir = use_fresh_database()
+    retention.ARCHIVE_DIR = archive_dir
+    database.save_search_page('old', {'sort_by': 'price'}, None, [1])
+    with database.connection() as conn:
+        conn.execute("UPDATE search_pages SET created_at = datetime('now', '-10 days')")
+        conn.commit()
+
+    worker = retention.RetentionWorker(interval=0.05).start()
+    try:
+        deadline = time.monotonic() + 10
+        while remaining_conversations() > 2 or database.get_search_page('old'):
+            assert time.monotonic() < deadline, "the worker did not run"
+            time.sleep(0.05)
+    finally:
+        worker.stop()
+    assert len(archived_records(archive_dir)) == 3
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_archive_and_delete()
+    test_failed_commit_is_archived_once()
+    test_partial_files_are_settled()
+    test_recovery_renames_first()
+    test_worker_runs_retention()
@@ -0,0 +1,153 @@
+"""
+Property test: the in-memory search index must agree with the SQL path
+"""
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+import database
+from models import CarCategory, CarSearchCriteria, FuelType, SortKey
+from synthetic_fleet import FEATURES, generate_cars, insert_cars
+
+
+def random_criteria(rng):
+    """Random CarSearchCriteria dict, shaped like the one chatbot.py builds"""
+    fields = {}
+    if rng.random() < 0.5:
+        # Whole and fractional prices, including exact boundaries of the fleet
+        fields['max_price'] = rng.choice([rng.randint(100, 650), rng.uniform(100, 650)])
+    if rng.random() < 0.5:
+        fields['min_passengers'] = rng.randint(1, 9)
+    if rng.random() < 0.5:
+        fields['category'] = rng.choice(list(CarCategory))
+    if rng.random() < 0.3:
+        fields['fuel_type'] = rng.choice(list(FuelType))
+    if rng.random() < 0.4:
+        # Mixed case and the occasional unknown feature must behave like SQL
+        names = rng.sample(FEATURES + ['Jet Pack'], rng.randint(1, 2))
+        fields['required_features'] = [rng.choice([n, n.lower(), n.upper()]) for n in names]
+    return CarSearchCriteria(**fields).model_dump(exclude_none=True)
+
+
+def test_index_matches_sql():
+    """search_cars() and search_cars_sql() return the same cars for random fleets"""
+
+    print("=== Testing In-Memory Search Index ===\n")
+
+    rng = random.Random(42)
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_index.db')
+    database.init_db()
+
+    checked = 0
+    for fleet_seed in range(5):
+        with database.connection() as conn:
+            insert_cars(conn, generate_cars(rng.randint(0, 400), seed=fleet_seed))
+        database.invalidate_inventory()
+
+        for _ in range(200):
+            criteria = random_criteria(rng)
+            indexed = [car['id'] for car in database.search_cars(criteria)]
+            expected = [car['id'] for car in database.search_cars_sql(criteria)]
+            assert indexed == expected, f"Mismatch for {criteria}"
+            checked += 1
+
+        print(f"Fleet {fleet_seed}: {len(database.get_all_cars())} available cars OK")
+
+    print(f"\n{checked} random queries matched the SQL path")
+    print("=== Test Complete ===")
+
+
+def test_availability_matches_sql():
+    """Date-range searches agree with the SQL NOT IN (reservations) path"""
+
+    print("=== Testing Availability Index ===\n")
+
+    rng = random.Random(7)
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_availability.db')
+    database.init_db()
+    with database.connection() as conn:
+        insert_cars(conn, generate_cars(300, seed=3))
+    car_ids = [car['id'] for car in database.get_all_cars()]
+
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    booked = rejected = 0
+    for _ in range(1500):
+        pickup = start + timedelta(hours=rng.randint(0, 24 * 60))
+        if database.book_car(rng.choice(car_ids), pickup, pickup + timedelta(hours=rng.randint(4, 24 * 7))):
+            booked += 1
+        else:
+            rejected += 1
+    print(f"Booked {booked} reservations, rejected {rejected} overlapping requests")
+
+    for _ in range(300):
+        pickup = start + timedelta(hours=rng.randint(0, 24 * 60))
+        criteria = random_criteria(rng)
+        criteria.update(pickup_at=pickup, return_at=pickup + timedelta(hours=rng.randint(1, 24 * 10)))
+        indexed = [car['id'] for car in database.search_cars(criteria)]
+        expected = [car['id'] for car in database.search_cars_sql(criteria)]
+        assert indexed == expected, f"Mismatch for {criteria}"
+
+    print("300 random date-range queries matched the SQL path")
+    print("=== Test Complete ===")
+
+
+def test_pages_match_sql():
+    """Cursor pages from the index and from SQL list every match once, in the same order"""
+
+    print("\n=== Testing Sorted Pages ===\n")
+
+    rng = random.Random(11)
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_pages.db')
+    database.init_db()
+    with database.connection() as conn:
+        insert_cars(conn, generate_cars(3000, seed=11))
+    database.invalidate_inventory()
+
+    for _ in range(150):
+        criteria = random_criteria(rng)
+        criteria.update(sort_by=rng.choice(list(SortKey)), sort_descending=rng.random() < 0.5,
+                        limit=rng.choice([1, 5, 12]))
+        indexed, cursor = [], None
+        while True:
+            page, cursor = database.search_cars_page(criteria, cursor)
+            indexed += [car['id'] for car in page]
+            if cursor is None:
+                break
+        expected, cursor = [], None
+        while True:
+            page = database.search_cars_sql(criteria, cursor)
+            expected += [car['id'] for car in page]
+            if len(page) < criteria['limit']:
+                break
+            cursor = database.cursor_after(criteria, page[-1])
+        assert indexed == expected, f"Page mismatch for {criteria}"
+        unsorted = {key: value for key, value in criteria.items() if key not in ('sort_by', 'sort_descending', 'limit')}
+        assert sorted(indexed) == [car['id'] for car in database.search_cars(unsorted)]
+
+    first, cursor = database.search_cars_page({'sort_by': 'year', 'limit': 3})
+    try:
+        database.search_cars_page({'sort_by': 'price', 'limit': 3}, cursor)
+    except ValueError as e:
+        print(f"Rejected cursor: {e}")
+    else:
+        raise AssertionError("a cursor only continues the sort order it was made for")
+
+    # The covering indexes let SQLite stop after one page instead of sorting every match
+    with database.connection() as conn:
+        for order in ('daily_price DESC, id DESC', 'passengers DESC, daily_price, id', 'year, daily_price, id'):
+            plan = " ".join(row[3] for row in conn.execute(
+                f"EXPLAIN QUERY PLAN SELECT * FROM cars WHERE available = 1 AND category = 'Economy' "
+                f"ORDER BY {order} LIMIT 10"
+            ))
+            print(f"ORDER BY {order}: {plan}")
+            assert 'TEMP B-TREE' not in plan
+
+    print("150 random sorted searches paged identically")
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_index_matches_sql()
+    test_availability_matches_sql()
+    test_pages_match_sql()
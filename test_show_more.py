@@ -0,0 +1,116 @@
+"""
+Test "show me more": sorted pages, saved search positions and follow-up pages.
+No LLM is called; actions are built directly and listings rendered locally.
+"""
+import os
+import tempfile
+
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+
+import chatbot  # noqa: E402
+import database  # noqa: E402
+from local_parser import parse_message  # noqa: E402
+from models import CarSearchCriteria, ChatbotAction  # noqa: E402
+from synthetic_fleet import generate_cars, insert_cars  # noqa: E402
+
+SHOW_MORE = ChatbotAction(action_type='show_more')
+
+
+def use_fresh_database(fleet_size=0):
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), 'test_show_more.db')
+    database.init_db()
+    if fleet_size:
+        with database.connection() as conn:
+            insert_cars(conn, generate_cars(fleet_size, seed=5))
+        database.invalidate_inventory()
+    chatbot.RESPONSE_RENDERING = 'local'
+    return chatbot.CarRentalChatbot()
+
+
+def turn(bot, user_message, action, history, local=None):
+    """One exchange through run_tool/present_cars/remember_page; returns (cars, history)"""
+    tool = bot.run_tool(action, local, user_message, history)
+    if tool is None:
+        reply, cars = chatbot.NO_MORE_REPLY, []
+    else:
+        more = tool.pop('more', None)
+        cars = tool['cars']
+        reply = "".join(bot.present_cars([], **tool))
+        if more:
+            bot.remember_page(user_message, reply, more)
+    return cars, history + [{'role': 'user', 'content': user_message}, {'role': 'assistant', 'content': reply}]
+
+
+def test_sorted_pages():
+    """'The 4 newest' then 'more' walks every car once, newest first, cheapest within a year"""
+
+    print("=== Testing sorted pages ===\n")
+    bot = use_fresh_database()
+    action = ChatbotAction(action_type='search_cars',
+                           search_criteria=CarSearchCriteria(sort_by='year', sort_descending=True, limit=4))
+    cars, history = turn(bot, "show me the 4 newest cars", action, [])
+    seen = list(cars)
+    while True:
+        cars, history = turn(bot, "show me more", SHOW_MORE, history)
+        if not cars:
+            break
+        assert len(cars) <= 4
+        seen += cars
+    print(f"Pages: {[(car['year'], car['daily_price']) for car in seen]}")
+    assert history[-1]['content'] == chatbot.NO_MORE_REPLY
+    assert sorted(car['id'] for car in seen) == sorted(car['id'] for car in database.get_all_cars())
+    assert seen == sorted(seen, key=lambda car: (-car['year'], car['daily_price'], car['id']))
+    print("\n=== Test Complete ===\n")
+
+
+def test_more_after_unsorted_search():
+    """A follow-up skips the cars already offered and keeps to the search's categories"""
+
+    print("=== Testing more SUVs ===\n")
+    bot = use_fresh_database(fleet_size=300)
+    local = parse_message("show me SUVs")
+    shown_reply_cars, history = turn(bot, "show me SUVs", local.action, [], local)
+    offered = {car['id'] for car in chatbot.pick_options(shown_reply_cars)}
+
+    more, history = turn(bot, "any more?", SHOW_MORE, history)
+    print(f"More: {[(car['category'], car['daily_price']) for car in more]}")
+    assert len(more) == chatbot.MAX_OPTIONS
+    assert not offered & {car['id'] for car in more}, "offered cars are not repeated"
+    assert all(car['category'].endswith('SUV') for car in more)
+    assert [car['daily_price'] for car in more] == sorted(car['daily_price'] for car in more)
+
+    even_more, _ = turn(bot, "more please", SHOW_MORE, history)
+    assert not {car['id'] for car in even_more} & ({car['id'] for car in more} | offered)
+    print("\n=== Test Complete ===\n")
+
+
+def test_more_after_ranking():
+    """Ranked results continue with the next best matches"""
+
+    print("=== Testing more ranked cars ===\n")
+    bot = use_fresh_database(fleet_size=300)
+    message = "something comfy for a desert road trip with lots of bags"
+    ranked, history = turn(bot, message, ChatbotAction(action_type='get_inventory'), [])
+    more, history = turn(bot, "show me more", SHOW_MORE, history)
+    print(f"More: {[(car['category'], car['features'][:2]) for car in more]}")
+    assert more and not {car['id'] for car in ranked[:chatbot.MAX_OPTIONS]} & {car['id'] for car in more}
+    assert [car['id'] for car in more] == [car['id'] for car in ranked[chatbot.MAX_OPTIONS:][:len(more)]]
+    print("\n=== Test Complete ===\n")
+
+
+def test_nothing_to_continue():
+    """Without a search behind the last reply there is nothing more to show"""
+
+    print("=== Testing show_more without a search ===\n")
+    bot = use_fresh_database()
+    assert bot.run_tool(SHOW_MORE, None, "more", []) is None
+    history = [{'role': 'user', 'content': "hello"}, {'role': 'assistant', 'content': "Hello! How can I help?"}]
+    assert bot.run_tool(SHOW_MORE, None, "more", history) is None
+    print("=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_sorted_pages()
+    test_more_after_unsorted_search()
+    test_more_after_ranking()
+    test_nothing_to_continue()
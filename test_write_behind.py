@@ -0,0 +1,35 @@
+"""
+Test the write-behind queue: a row that can never commit must not block the rest
+"""
+from write_behind import WriteBehindQueue
+
+
+def test_poison_entry_is_dead_lettered():
+    """After max_attempts the bad entry is dropped and the good ones commit"""
+
+    print("=== Testing a poison entry ===\n")
+    committed = []
+
+    def flush_batch(entries):
+        if 'poison' in entries:
+            raise ValueError("constraint failed")
+        committed.extend(entries)
+
+    queue = WriteBehindQueue(flush_batch, max_batch=10, max_delay_ms=20, max_attempts=2)
+    for entry in ('a', 'poison', 'b'):
+        queue.put(entry, entry, [{'role': 'user', 'content': entry}])
+    assert queue.flush(timeout=10), "the queue must drain"
+    queue.put('c', 'c', [{'role': 'user', 'content': 'c'}])
+    assert queue.flush(timeout=10)
+    queue.close()
+
+    print(f"Committed {committed}, stats {queue.stats}")
+    assert committed == ['a', 'b', 'c']
+    assert queue.dead_letters == ['poison'] and queue.stats['dead_lettered'] == 1
+    assert queue.stats['errors'] == 2 and queue.stats['committed'] == 3
+    assert not any(queue.has_pending(key) for key in ('a', 'poison', 'b', 'c'))
+    print("\n=== Test Complete ===")
+
+
+if __name__ == "__main__":
+    test_poison_entry_is_dead_lettered()
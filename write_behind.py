@@ -0,0 +1,174 @@
+"""
+Write-behind buffer with group commit.
+
+Writes are queued in memory and a background thread hands them to a flush
+function in batches (up to `max_batch` entries, or whatever arrived within
+`max_delay_ms` of the first one). Until a batch is committed its messages
+stay visible through `pending()`, so readers can merge them with what is
+already on disk.
+
+A batch that fails to commit is retried (once a second) up to
+`max_attempts` times. After that its entries are committed one by one, and
+any entry that still fails is logged and dead-lettered, so one bad row
+cannot hold up every later write.
+"""
+import threading
+import time
+
+
+class WriteBehindQueue:
+    """Queue of keyed writes drained by a single background committer"""
+
+    def __init__(self, flush_batch, max_batch=64, max_delay_ms=50, max_queue=4096,
+                 max_attempts=5, name='write-behind'):
+        """
+        Args:
+            flush_batch: Callable taking a list of entries; must commit them
+                atomically or raise
+            max_batch: Maximum number of entries per commit
+            max_delay_ms: How long the first entry of a batch may wait for
+                company before it is committed
+            max_queue: Queue length at which put() blocks until the writer
+                catches up, so an overloaded disk cannot exhaust memory
+            max_attempts: Commit attempts per entry before it is tried alone
+                and, if it still fails, dead-lettered
+        """
+        self.flush_batch = flush_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        # Held while a batch is committed and retired from the pending view;
+        # readers take it to see disk + pending as one consistent state
+        self.commit_lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'committed': 0, 'batches': 0, 'errors': 0, 'dead_lettered': 0}
+        # The most recent entries that could not be committed, for inspection
+        self.dead_letters = []
+
+        self._cond = threading.Condition()
+        self._queue = []
+        self._pending = {}
+        self._in_flight = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, key, entry, messages):
+        """Queue `entry` for commit; `messages` are served by pending(key) meanwhile"""
+        with self._cond:
+            while len(self._queue) >= self.max_queue and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._queue.append((key, entry, len(messages), 0))
+            self._pending.setdefault(key, []).extend(messages)
+            self.stats['enqueued'] += 1
+            self._cond.notify_all()
+
+    def has_pending(self, key):
+        with self._cond:
+            return key in self._pending
+
+    def pending(self, key):
+        """Messages queued for `key` that are not committed yet"""
+        with self._cond:
+            return list(self._pending.get(key, ()))
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is committed; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """Flush outstanding writes and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+
+            # Group commit: give the batch a short window to fill up
+            deadline = time.monotonic() + self.max_delay
+            while len(self._queue) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            failed = False
+            with self.commit_lock:
+                try:
+                    self.flush_batch([entry for _, entry, _, _ in batch])
+                except Exception as e:
+                    print(f"Error committing write-behind batch: {e}")
+                    self.stats['errors'] += 1
+                    batch = [(key, entry, count, attempts + 1) for key, entry, count, attempts in batch]
+                    if any(attempts >= self.max_attempts for *_, attempts in batch):
+                        self._commit_one_by_one(batch)
+                    else:
+                        failed = True
+                        with self._cond:
+                            # Keep the entries (and their pending view) and retry
+                            self._queue[:0] = batch
+                            self._in_flight = 0
+                            self._cond.notify_all()
+                else:
+                    self._retire(batch)
+                    with self._cond:
+                        self.stats['batches'] += 1
+
+            if failed:
+                time.sleep(1)
+
+    def _commit_one_by_one(self, batch):
+        """Commit a batch that keeps failing entry by entry; dead-letter the entries that fail"""
+        for item in batch:
+            key, entry, _, attempts = item
+            try:
+                self.flush_batch([entry])
+            except Exception as e:
+                print(f"Dropping write-behind entry for {key} after {attempts} attempts: {e}; entry: {entry!r}")
+                with self._cond:
+                    self.stats['dead_lettered'] += 1
+                    self.dead_letters = self.dead_letters[-99:] + [entry]
+                self._retire([item], committed=False)
+            else:
+                self._retire([item])
+                with self._cond:
+                    self.stats['batches'] += 1
+
+    def _retire(self, batch, committed=True):
+        """Drop finished entries from the pending view (entries of a key retire in queue order)"""
+        with self._cond:
+            for key, _, count, _ in batch:
+                remaining = self._pending[key]
+                del remaining[:count]
+                if not remaining:
+                    del self._pending[key]
+            if committed:
+                self.stats['committed'] += len(batch)
+            self._in_flight -= len(batch)
+            self._cond.notify_all()